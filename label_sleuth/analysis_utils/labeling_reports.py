@@ -28,6 +28,7 @@ from label_sleuth.data_access.core.data_structs import LABEL_POSITIVE, LABEL_NEG
 from label_sleuth.models.core.languages import Language
 from label_sleuth.models.core.catalog import ModelsCatalog
 from label_sleuth.models.core.tools import remove_stop_words_and_punctuation
+from label_sleuth.orchestrator.job_scheduler import JobPriority
 from label_sleuth.orchestrator.utils import convert_text_elements_to_train_data
 
 MIN_TOKEN_OVERLAP_THRESHOLD = 0.6
@@ -72,7 +73,8 @@ def get_disagreements_using_cross_validation(workspace_id, category_id: int, lab
         left_out_data = train_splits[i]
         fold_train_data = \
             np.concatenate([part for j, part in enumerate(train_splits) if j != i])
-        model_id, future = model_api.train(fold_train_data, language=language)
+        model_id, future = model_api.train(fold_train_data, language=language, priority=JobPriority.REPORTS,
+                                           workspace_id=workspace_id)
         logging.info(f'Suspicious labels report fold {i}: training cross-validation model {model_id}')
         future.result(timeout=60)
         logging.info(f'Suspicious labels report fold {i}: done waiting for cross-validation model {model_id}, '
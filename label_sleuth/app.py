@@ -18,6 +18,7 @@ import logging
 import os
 import shutil
 import tempfile
+import threading
 import traceback
 import zipfile
 import pkg_resources
@@ -34,9 +35,10 @@ from flask_cors import CORS, cross_origin
 
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
 from label_sleuth.training_set_selector.training_set_selector_factory import TrainingSetSelectionFactory
-from label_sleuth.app_utils import elements_back_to_front, extract_iteration_information_list, \
-    extract_enriched_ngrams_and_weights_list, get_element, get_natural_sort_key, validate_category_id, \
-    validate_workspace_id
+from label_sleuth.app_utils import DEFAULT_MAX_STATUS_STREAMS, build_category_status_stream_response, \
+    build_export_response, elements_back_to_front, extract_iteration_information_list, \
+    extract_enriched_ngrams_and_weights_list, \
+    get_category_status, get_element, get_natural_sort_key, validate_category_id, validate_workspace_id
 from label_sleuth.authentication import authenticate_response, login_if_required, verify_password
 from label_sleuth.active_learning.core.active_learning_factory import ActiveLearningFactory
 from label_sleuth.config import Configuration
@@ -60,6 +62,7 @@ class LabelSleuthApp(Flask):
     orchestrator_api: OrchestratorApi
     users: dict
     tokens: list
+    status_stream_slots: threading.Semaphore  # limits the number of concurrently open status streams
 
 
 # in order for the IDE to recognize custom objects within the Label Sleuth flask application -- and specifically
@@ -77,15 +80,17 @@ def create_app(config: Configuration, output_dir) -> LabelSleuthApp:
     app.config["output_dir"] = output_dir
     app.users = {x['username']: dacite.from_dict(data_class=User, data=x) for x in app.config["CONFIGURATION"].users}
     app.tokens = [user.token for user in app.users.values()]
+    app.status_stream_slots = threading.BoundedSemaphore(DEFAULT_MAX_STATUS_STREAMS)
     sentence_embedding_service = SentenceEmbeddingService(embedding_model_dir=output_dir,
                                                           preload_spacy_model_name=config.language.spacy_model_name,
                                                           preload_fasttext_language_id=
                                                           config.language.fasttext_language_id)
-    data_access = FileBasedDataAccess(output_dir)
-    background_jobs_manager = BackgroundJobsManager()
+    data_access = FileBasedDataAccess(output_dir, use_text_search_index=config.text_search_index)
+    background_jobs_manager = BackgroundJobsManager(executor_backend=config.background_jobs_backend)
     training_set_selection_factory = TrainingSetSelectionFactory(data_access, background_jobs_manager)
 
-    app.orchestrator_api = OrchestratorApi(OrchestratorStateApi(os.path.join(output_dir, "workspaces")),
+    app.orchestrator_api = OrchestratorApi(OrchestratorStateApi(os.path.join(output_dir, "workspaces"),
+                                                                state_backend=config.state_backend),
                                            data_access,
                                            ActiveLearningFactory(),
                                            ModelFactory(os.path.join(output_dir, "models"),
@@ -95,6 +100,7 @@ def create_app(config: Configuration, output_dir) -> LabelSleuthApp:
                                            background_jobs_manager,
                                            sentence_embedding_service,
                                            app.config["CONFIGURATION"])
+    app.orchestrator_api.resume_interrupted_iterations()
     app.register_blueprint(main_blueprint)
     return app
 
@@ -105,6 +111,8 @@ def start_server(app, host, port, num_serving_threads):
         logging.getLogger('werkzeug').disabled = True
         os.environ['WERKZEUG_RUN_MAIN'] = True
 
+    # each open status stream occupies a serving thread, so at most half of the threads are used by status streams
+    app.status_stream_slots = threading.BoundedSemaphore(max(1, num_serving_threads // 2))
     from waitress import serve
     serve(app, host=host, port=port, threads=num_serving_threads)
 
@@ -757,11 +765,13 @@ def export_labels(workspace_id):
     :param workspace_id:
     :request_arg labeled_only: only export elements as they were labeled by the user. If set to False, use the
     TrainingSetSelectionStrategy to determine the exported elements
+    :request_arg format: optional. either "csv" (default) or "parquet"
     """
     labeled_only = request.args.get('labeled_only', "true")
     labeled_only = labeled_only.lower() == "true"
 
-    return curr_app.orchestrator_api.export_workspace_labels(workspace_id, labeled_only).to_csv(index=False)
+    labels_batches = curr_app.orchestrator_api.export_workspace_labels_batches(workspace_id, labeled_only)
+    return build_export_response(labels_batches, f'{workspace_id}_labels')
 
 
 """
@@ -777,30 +787,37 @@ def get_labelling_status(workspace_id):
     """
     Returns information about the number of user labels for the category, as well as a number between 0-100 that
     reflects when a new model will be trained.
-    Once a certain amount of user labels for a given category has been reached, the get_labelling_status() call --
-    via a call to orchestrator_api.train_if_recommended() -- will trigger an iteration flow in the background. This
-    flow includes training a model, inferring the full corpus using this model, choosing candidate elements for
-    labeling using active learning, and calculating various statistics.
+    Once a certain amount of user labels for a given category has been reached, setting labels triggers an iteration
+    flow in the background (see OrchestratorApi.train_if_recommended()), so this call only reads the current status.
+    The iteration flow includes training a model, inferring the full corpus using this model, choosing candidate
+    elements for labeling using active learning, and calculating various statistics.
 
     :param workspace_id:
     :request_arg category_id:
     """
-
     category_id = int(request.args['category_id'])
-    dataset_name = curr_app.orchestrator_api.get_dataset_name(workspace_id)
+    return jsonify(get_category_status(workspace_id, category_id))
 
-    labeling_counts = curr_app.orchestrator_api. \
-        get_label_counts(workspace_id, dataset_name, category_id,
-                         remove_duplicates=curr_app.config["CONFIGURATION"].apply_labels_to_duplicate_texts)
-    progress = curr_app.orchestrator_api.get_progress(workspace_id, dataset_name, category_id)
 
-    # TODO move executor to the orchestrator
-    executor.submit(curr_app.orchestrator_api.train_if_recommended, workspace_id, category_id)
+@main_blueprint.route("/workspace/<workspace_id>/status_stream", methods=['GET'])
+@login_if_required
+@validate_category_id
+@validate_workspace_id
+def get_labelling_status_stream(workspace_id):
+    """
+    Stream the labeling status of the category (see get_labelling_status()) together with the information about its
+    iterations (see get_all_iterations_for_category()) as server-sent events, which are sent whenever the labels or the
+    iterations of the category change. This allows the UI to follow the progress of the iteration flows without polling.
 
-    return jsonify({
-        "labeling_counts": labeling_counts,
-        "progress": progress
-    })
+    Each open stream uses up a serving thread, so the number of concurrently open streams is limited to half of the
+    serving threads (503 is returned above it), and streams are closed after a few minutes; the browser's EventSource
+    reconnects automatically.
+
+    :param workspace_id:
+    :request_arg category_id:
+    """
+    category_id = int(request.args['category_id'])
+    return build_category_status_stream_response(workspace_id, category_id)
 
 
 @main_blueprint.route("/workspace/<workspace_id>/iterations", methods=['GET'])
@@ -888,6 +905,7 @@ def export_predictions(workspace_id):
     :param workspace_id:
     :request_arg category_id:
     :request_arg iteration_index: optional. if not provided, the model from the latest iteration will be exported.
+    :request_arg format: optional. either "csv" (default) or "parquet"
     """
     category_id = int(request.args['category_id'])
     iteration_index = request.args.get('iteration_index', None)
@@ -896,12 +914,9 @@ def export_predictions(workspace_id):
             get_all_iterations_by_status(workspace_id, category_id, IterationStatus.READY)[-1]
     else:
         iteration_index = int(iteration_index)
-    dataset_name = curr_app.orchestrator_api.get_dataset_name(workspace_id)
-    elements = curr_app.orchestrator_api.get_all_text_elements(dataset_name)
-    infer_results = curr_app.orchestrator_api.infer(workspace_id, category_id, elements,
-                                                    iteration_index=iteration_index)
-    return pd.DataFrame([{**te.__dict__, "score": pred.score, 'predicted_label': pred.label} for te, pred
-                         in zip(elements, infer_results)]).to_csv(index=False)
+    predictions_batches = curr_app.orchestrator_api.export_predictions_batches(workspace_id, category_id,
+                                                                               iteration_index=iteration_index)
+    return build_export_response(predictions_batches, f'{workspace_id}_predictions')
 
 
 @main_blueprint.route('/workspace/<workspace_id>/export_model', methods=['GET'])
@@ -13,11 +13,18 @@
 #  limitations under the License.
 #
 import functools
+import io
 import logging
+import queue
 import re
-from typing import List, Mapping, Sequence
+import threading
+import time
+from typing import Iterable, List, Mapping, Sequence
 
-from flask import current_app, request, jsonify
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import current_app, request, json, jsonify, Response, stream_with_context
 
 from label_sleuth.analysis_utils.analyze_tokens import ngrams_by_info_gain
 from label_sleuth.data_access.core.data_structs import TextElement
@@ -26,6 +33,13 @@ from label_sleuth.models.core.languages import Languages
 from label_sleuth.orchestrator.core.state_api.orchestrator_state_api import Iteration, IterationStatus
 from label_sleuth.orchestrator.orchestrator_api import TRAIN_COUNTS_STR_KEY
 
+STATUS_STREAM_KEEP_ALIVE_SECONDS = 15  # idle time after which a comment is sent to keep the status stream open
+# a status stream occupies a serving thread while it is open, so it is closed after STATUS_STREAM_MAX_SECONDS, and the
+# browser reconnects after STATUS_STREAM_RETRY_MILLISECONDS
+STATUS_STREAM_MAX_SECONDS = 300
+STATUS_STREAM_RETRY_MILLISECONDS = 1000
+DEFAULT_MAX_STATUS_STREAMS = 5  # maximum number of concurrently open status streams, unless set by the server
+
 
 def validate_workspace_id(function):
     @functools.wraps(function)
@@ -145,3 +159,147 @@ def extract_enriched_ngrams_and_weights_list(elements, boolean_labels):
 
 def get_natural_sort_key(text):
     return [int(x) if x.isdigit() else x for x in re.split(r'(\d+)', text)]
+
+
+class _ChunkedOutputStream(io.RawIOBase):
+    """
+    A write-only stream that keeps the data written to it until it is collected by pop(). Unlike BytesIO, truncating
+    the collected data does not affect the position reported by tell(), which the parquet writer relies on.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def pop(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def dataframes_to_csv_chunks(dataframes: Iterable[pd.DataFrame]) -> Iterable[str]:
+    header = True
+    for df in dataframes:
+        yield df.to_csv(index=False, header=header)
+        header = False
+
+
+def dataframes_to_parquet_chunks(dataframes: Iterable[pd.DataFrame]) -> Iterable[bytes]:
+    """
+    Write the dataframes as consecutive row groups of a single parquet file, yielding the bytes of each row group as
+    soon as it is written. Columns of non-string objects (e.g. metadata dicts) are written as their string
+    representation, as they are in the csv export.
+    """
+    stream = _ChunkedOutputStream()
+    writer = None
+    for df in dataframes:
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].map(lambda value: value if value is None or isinstance(value, str) else str(value))
+        if writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # columns that are empty in the first batch are assumed to be strings
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                for field in schema], metadata=schema.metadata)
+            writer = pq.ParquetWriter(stream, schema)
+        writer.write_table(pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False))
+        yield stream.pop()
+    if writer is not None:
+        writer.close()
+        yield stream.pop()
+
+
+def build_export_response(dataframes: Iterable[pd.DataFrame], file_name: str):
+    """
+    Stream the dataframes as a single file, in the format given by the "format" request argument (csv by default, or
+    parquet). The rows are written as the dataframes are generated, so the whole file is never held in memory.
+    :param dataframes: dataframes with identical columns
+    :param file_name: name of the downloaded file, without the extension
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format == 'csv':
+        chunks, mimetype = dataframes_to_csv_chunks(dataframes), 'text/csv'
+    elif export_format == 'parquet':
+        chunks, mimetype = dataframes_to_parquet_chunks(dataframes), 'application/octet-stream'
+    else:
+        return jsonify({"type": "export_format_error",
+                        "title": f"export format should be either csv or parquet (got {export_format})"}), 400
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={file_name}.{export_format}'})
+
+
+def get_category_status(workspace_id, category_id) -> Mapping:
+    """
+    The number of user labels for the category, and a number between 0-100 that reflects when a new model will be
+    trained.
+    """
+    dataset_name = current_app.orchestrator_api.get_dataset_name(workspace_id)
+    labeling_counts = current_app.orchestrator_api. \
+        get_label_counts(workspace_id, dataset_name, category_id,
+                         remove_duplicates=current_app.config["CONFIGURATION"].apply_labels_to_duplicate_texts)
+    progress = current_app.orchestrator_api.get_progress(workspace_id, dataset_name, category_id)
+    return {"labeling_counts": labeling_counts, "progress": progress}
+
+
+def build_category_status_stream_response(workspace_id, category_id):
+    """
+    Stream the status of the category and the information about its iterations as server-sent events. An event is sent
+    when the stream is opened, and then whenever the labels or the iterations of the category change; changes that
+    occur while an event is sent are reported together in the next event.
+
+    Each open stream occupies a serving thread, so the number of concurrently open streams is limited by
+    current_app.status_stream_slots (a 503 response is returned above it), and each stream is closed after
+    STATUS_STREAM_MAX_SECONDS. The stream starts with a retry field, so the browser's EventSource reconnects shortly
+    after the stream is closed.
+    """
+    orchestrator_api = current_app.orchestrator_api
+    status_stream_slots = current_app.status_stream_slots
+    if not status_stream_slots.acquire(blocking=False):
+        return jsonify({"type": "too_many_status_streams",
+                        "title": "too many status streams are open, please try again later"}), 503
+    release_lock = threading.Lock()
+
+    def release_slot():
+        # the response may be closed more than once
+        if release_lock.acquire(blocking=False):
+            status_stream_slots.release()
+
+    def generate_events():
+        end_time = time.time() + STATUS_STREAM_MAX_SECONDS
+        yield f"retry: {STATUS_STREAM_RETRY_MILLISECONDS}\n\n"
+        with orchestrator_api.events.subscribe(workspace_id, category_id) as event_queue:
+            send_status = True
+            while True:
+                if send_status:
+                    iterations = orchestrator_api.get_all_iterations_for_category(workspace_id, category_id)
+                    status = {**get_category_status(workspace_id, category_id),
+                              "iterations": extract_iteration_information_list(iterations)}
+                    yield f"data: {json.dumps(status)}\n\n"
+                remaining_seconds = end_time - time.time()
+                if remaining_seconds <= 0:
+                    return
+                try:
+                    event_queue.get(timeout=min(STATUS_STREAM_KEEP_ALIVE_SECONDS, remaining_seconds))
+                except queue.Empty:
+                    send_status = False
+                    yield ": keep-alive\n\n"
+                    continue
+                while not event_queue.empty():
+                    event_queue.get_nowait()
+                send_status = True
+
+    response = Response(stream_with_context(generate_events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(release_slot)
+    return response
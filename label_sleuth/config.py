@@ -47,6 +47,9 @@ class Configuration:
     active_learning_policy: ActiveLearningPolicy = None
     main_panel_elements_per_page: int = 500
     sidebar_panel_elements_per_page: int = 50
+    text_search_index: bool = False
+    background_jobs_backend: str = "thread"
+    state_backend: str = "json"
     users: List[dict] = field(default_factory=list)
 
 
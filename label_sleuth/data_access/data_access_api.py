@@ -19,6 +19,10 @@ from dataclasses import dataclass
 from enum import Enum
 
 from typing import Iterable, Sequence, Mapping, List, Union, Set
+
+import numpy as np
+import pandas as pd
+
 from label_sleuth.data_access.core.data_structs import Document, TextElement, Label, URI_SEP, LabelType
 
 
@@ -127,6 +131,14 @@ class DataAccessApi(object, metaclass=abc.ABCMeta):
         :param dataset_name:
         """
 
+    @abc.abstractmethod
+    def get_duplicate_text_mask(self, dataset_name: str) -> np.ndarray:
+        """
+        Return a boolean array with an entry for each TextElement in the given dataset_name, in the order of the
+        dataset, which is True for elements whose text is identical to that of an element in a previous row.
+        :param dataset_name:
+        """
+
     @abc.abstractmethod
     def get_all_text_elements(self, dataset_name: str) -> List[TextElement]:
         """
@@ -135,6 +147,16 @@ class DataAccessApi(object, metaclass=abc.ABCMeta):
         :param dataset_name: the name of the dataset from which the TextElement should be retrieved.
         """
 
+    @abc.abstractmethod
+    def get_all_text_elements_batches(self, dataset_name: str, batch_size: int) -> Iterable[List[TextElement]]:
+        """
+        Iterate over all the TextElements in the given dataset_name, in batches of *batch_size* elements. Unlike
+        get_all_text_elements(), only the TextElement objects of a single batch are created at a time.
+
+        :param dataset_name: the name of the dataset from which the TextElement should be retrieved.
+        :param batch_size: the number of TextElements in each batch
+        """
+
     @abc.abstractmethod
     def get_text_elements(self, workspace_id: str, dataset_name: str, sample_size: int = sys.maxsize,
                           sample_start_idx: int = 0, query: str = None, is_regex: bool = False,
@@ -252,6 +274,17 @@ class DataAccessApi(object, metaclass=abc.ABCMeta):
         :param label_types:  by default, only the LabelType.Standard (strong labels) are retrieved.
         """
 
+    @abc.abstractmethod
+    def get_uris_by_texts(self, dataset_name: str, texts: Iterable[str]) -> pd.DataFrame:
+        """
+        Return the uris of all the text elements in the given dataset whose text is identical to one of the given
+        texts.
+        :param dataset_name:
+        :param texts:
+        :return: a DataFrame with a row for each matching text element, and the columns DisplayFields.text and
+        DisplayFields.uri
+        """
+
     @abc.abstractmethod
     def get_text_element_iterator(self, workspace_id, dataset_name, shuffle=False, random_state: int = 0,
                                   remove_duplicates=False) -> Iterable[TextElement]:
@@ -14,7 +14,6 @@
 #
 
 import ast
-import dataclasses
 import logging
 import os
 import random
@@ -24,18 +23,25 @@ import threading
 import time
 
 import jsonpickle
+import numpy as np
 import ujson as json
 import pandas as pd
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from collections import Counter, defaultdict
 from typing import Sequence, Iterable, Mapping, List, Union, Set
 
 import label_sleuth.data_access.file_based.utils as utils
-from label_sleuth.data_access.core.data_structs import Document, Label, TextElement, LabelType
+from label_sleuth.data_access.file_based.label_counts import LabelCounts
+from label_sleuth.data_access.file_based.result_set_cache import ResultSet, ResultSetCache
+from label_sleuth.data_access.file_based.text_index import TextIndex, append_text_index_block, load_text_index
+from label_sleuth.data_access.core.data_structs import Document, DisplayFields, Label, TextElement, LabelType
 from label_sleuth.data_access.data_access_api import DataAccessApi, AlreadyExistsException, DocumentStatistics, \
     LabeledStatus
 
+segments_compaction_thread_pool = ThreadPoolExecutor(1)
+
 
 class FileBasedDataAccess(DataAccessApi):
     """
@@ -50,56 +56,140 @@ class FileBasedDataAccess(DataAccessApi):
     ===labels_in_memory===
     maps workspace_id -> dataset name -> URIs -> categories -> Label object
 
+    On disk, the labels of a workspace for a dataset are stored as a snapshot of this mapping, along with an append-only
+    journal of the set/unset operations performed since the snapshot was written. The journal is replayed on top of the
+    snapshot when the labels are loaded, and once it grows beyond max_labels_journal_records it is compacted into a new
+    snapshot.
+
+    ===label_codes_in_memory===
+    maps (workspace_id, dataset_name) -> category_id -> a numpy array aligned to the rows of the dataset DataFrame,
+    which holds a code describing the label of each element for that category (see utils.label_to_code). These arrays
+    are built from labels_in_memory the first time they are needed, and are then updated along with labels_in_memory.
+
+    ===label_counts_in_memory===
+    maps (workspace_id, dataset_name) -> category_id -> LabelCounts, i.e. the number of elements with each label code,
+    with and without duplicate texts. The counts are built from label_codes_in_memory the first time they are needed,
+    and are then updated incrementally along with the label codes, so that get_label_counts() does not scan the
+    dataset. check_label_counts() rebuilds the counts from the labels and verifies that they are consistent.
+
+    ===uri_to_row_in_memory===
+    maps dataset_name to a dict from the URI of each TextElement to its position in the dataset DataFrame. The dict is
+    built once per dataset, and is extended when documents are added to the dataset.
+
+    ===text_groups_in_memory===
+    maps dataset_name to the grouping of the dataset rows by text_unique_id, in CSR form: the rows of the elements whose
+    text_unique_id is i are text_group_rows[text_group_indptr[i]:text_group_indptr[i+1]], in ascending order. Also holds
+    a boolean mask of the rows that are the first occurrence of their text in the dataset. The grouping is persisted
+    next to the dataset files, and is recalculated when documents are added to the dataset.
+
+    ===text_index_in_memory===
+    maps dataset_name to a TextIndex, i.e. an inverted index from tokens to the rows that contain them, which is used
+    for narrowing down the rows that need to be checked for a query. The index is only maintained if the
+    FileBasedDataAccess is created with use_text_search_index=True; it is built when the dataset is created, and is
+    extended when documents are added to the dataset.
+
+    ===result_sets_cache===
+    a short-lived cache of the (filtered, deduplicated and shuffled) row positions returned by _get_text_elements, so
+    that requesting additional pages of the same results does not repeat the work. The cache keys include
+    dataset_versions and labels_versions, which are incremented whenever the dataset or the workspace labels change,
+    so stale results are never returned.
+
+    ===text_to_unique_id_in_memory===
+    maps dataset_name to a dict from each unique text in the dataset to its text_unique_id; used for assigning ids to
+    the texts of newly added documents without recalculating the ids of the whole dataset
+
+    The dataset TextElements are stored on disk as a sequence of append-only Arrow segments. The first segment is
+    "dataset_sentences.arrow"; each subsequent call to add_documents writes its elements to a new segment, and the
+    list of segments is kept in a manifest file. Once there are too many segments, they are merged in the background.
+
+    ===documents_index_in_memory===
+    maps dataset_name to a dict from document URI to the (offset, length) of the encoded Document inside the packed
+    documents file of the dataset. On disk, the index is stored as a snapshot file along with an append-only journal of
+    the entries added since the snapshot was written, which is compacted into a new snapshot once it grows beyond
+    max_documents_index_journal_records. The entries are kept in the order in which the documents were added; the uris
+    sorted by the natural order of the document names are computed on first use and kept in sorted_document_uris.
     """
     doc_dir_name = 'doc_dump'
-    sentences_filename = 'dataset_sentences.csv'
+    documents_filename = 'documents.jsonl'
+    documents_index_filename = 'documents_index.json'
+    documents_index_journal_filename = 'documents_index_journal.jsonl'
+    max_documents_index_journal_records = 10000
+    sentences_filename = 'dataset_sentences.arrow'
+    legacy_sentences_filename = 'dataset_sentences.csv'
+    segments_manifest_filename = 'dataset_segments.json'
+    text_groups_filename = 'dataset_text_groups.npz'
+    text_index_filename = 'dataset_text_index.pkl'
+    max_segments_before_compaction = 8
     labels_filename = 'workspace_labels.json'
+    labels_journal_filename = 'workspace_labels_journal.jsonl'
+    max_labels_journal_records = 10000
 
     workspace_to_labels_lock_objects = defaultdict(threading.Lock)
     ds_in_memory = defaultdict(pd.DataFrame)
     labels_in_memory = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(Label))))
+    labels_journal_records_count = defaultdict(int)
+    label_codes_in_memory = defaultdict(dict)
+    label_counts_in_memory = defaultdict(dict)
+    uri_to_row_in_memory = {}
+    text_groups_in_memory = {}
+    text_index_in_memory = {}
+    result_sets_cache = ResultSetCache(capacity=32, ttl_seconds=10 * 60)
+    dataset_versions = defaultdict(int)
+    labels_versions = defaultdict(int)
+    text_to_unique_id_in_memory = {}
+    documents_index_in_memory = {}
+    documents_index_journal_records_count = defaultdict(int)
+    sorted_document_uris = {}
     dataset_in_memory_lock = threading.RLock()
 
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, use_text_search_index=False):
+        """
+        :param output_dir:
+        :param use_text_search_index: if True, maintain a token index of each dataset, and use it to speed up queries
+        """
         self.output_dir = output_dir
+        self.use_text_search_index = use_text_search_index
 
     def add_documents(self, dataset_name: str, documents: Iterable[Document]):
         """
         Add new documents to a given dataset; If dataset does not exist, create it.
 
         In this implementation, the same data is stored in two formats:
-            A. a json file per Document, containing data for the TextElement objects within that Document
-            B. a single csv file, containing data for the TextElement objects from all Documents for this dataset
+            A. a packed documents file, containing one encoded Document per line, and an index of the position of
+            each Document in this file
+            B. Arrow segment files, containing data for the TextElement objects from all Documents for this dataset.
+            The TextElements of the given documents are written to a new segment, so the cost of adding documents
+            depends on the number of added elements rather than on the size of the dataset.
 
         :param dataset_name: the name of the dataset to which the documents should be added.
         :param documents: an Iterable over Document type.
         """
-        doc_dump_dir = self._get_documents_dump_dir(dataset_name)
         sentences = []
-        if not os.path.exists(doc_dump_dir):
-            os.makedirs(doc_dump_dir)
-        else:
-            doc_ids = {document.uri for document in documents}
-            intersection = doc_ids.intersection(set(self.get_all_document_uris(dataset_name)))
+        with self.dataset_in_memory_lock:
+            documents_index = self._get_documents_index(dataset_name)
+            intersection = {document.uri for document in documents if document.uri in documents_index}
             if len(intersection) > 0:
                 raise AlreadyExistsException(f"{len(intersection)} documents are already in dataset '{dataset_name}'. "
                                              f"uris: ({list(intersection)[:5]}{'...' if len(intersection) > 5 else ''})",
                                              list(intersection))
 
-        for doc in documents:
-            # save doc to file
-            filename = utils.uri_to_filename(doc.uri)
-            file_path = os.path.join(doc_dump_dir, filename)
-            doc_encoded = jsonpickle.encode(doc)
-            with open(file_path + '.json', 'w') as f:
-                f.write(doc_encoded)
-            # add doc sentences to working memory
-            sentences.extend(doc.text_elements)
-        self._add_sentences_to_dataset_in_memory(dataset_name=dataset_name, text_elements=sentences)
+            new_index_entries = []
+            os.makedirs(self._get_dataset_base_dir(dataset_name), exist_ok=True)
+            documents_file_path = self._get_documents_filename(dataset_name)
+            with open(documents_file_path, 'ab') as f:
+                for doc in documents:
+                    # save doc to the packed documents file
+                    doc_encoded = jsonpickle.encode(doc).encode('utf-8') + b'\n'
+                    new_index_entries.append((doc.uri, (f.tell(), len(doc_encoded))))
+                    f.write(doc_encoded)
+                    # add doc sentences to working memory
+                    sentences.extend(doc.text_elements)
+            self._add_to_documents_index(dataset_name, new_index_entries)
+            self._add_sentences_to_dataset_in_memory(dataset_name=dataset_name, text_elements=sentences)
 
         num_of_text_elements = sum([len(doc.text_elements) for doc in documents])
         logging.info(f'{dataset_name}:\t\tloaded {len(documents)} documents '
-                     f'({num_of_text_elements} text elements) under {doc_dump_dir}')
+                     f'({num_of_text_elements} text elements) under {documents_file_path}')
         return DocumentStatistics(len(documents), num_of_text_elements)
 
     def set_labels(self, workspace_id: str, uris_to_labels: Mapping[str, Mapping[int, Label]],
@@ -120,20 +210,29 @@ class FileBasedDataAccess(DataAccessApi):
         dataset_name = utils.get_dataset_name_from_uri(next(iter(uris_to_labels.keys())))
         with self._get_lock_object_for_workspace(workspace_id):
             ds_labels = self._get_labels(workspace_id, dataset_name)
-            all_uris = self.get_all_text_elements_uris(dataset_name)
+            uri_to_row = self._get_uri_to_row(dataset_name)
+            updated_uris_to_labels = []
             for uri, labels in uris_to_labels.items():
-                if uri not in all_uris:
+                if uri not in uri_to_row:
                     raise Exception(f'Trying to set labels for uri "{uri}" which does not exist')
 
                 if apply_to_duplicate_texts:  # set the given label for all elements with the same text
                     same_text_uris = self._get_uris_with_the_same_text(dataset_name, uri)
                     for same_text_uri in same_text_uris:
                         ds_labels[same_text_uri].update(labels)
+                        updated_uris_to_labels.append((same_text_uri, labels))
                 else:
                     # Note: we do not override existing labels if they are from another category
                     ds_labels[uri].update(labels)
-            # Save updated labels dict to disk
-            self._save_labels_data(dataset_name, workspace_id)
+                    updated_uris_to_labels.append((uri, labels))
+            self._update_label_codes(workspace_id, dataset_name, updated_uris_to_labels)
+            self.labels_versions[(workspace_id, dataset_name)] += 1
+            # Save the label changes to disk
+            self._append_to_labels_journal(
+                dataset_name, workspace_id,
+                [{'op': 'set', 'uri': uri, 'labels': {str(category_id): label.to_dict()
+                                                      for category_id, label in labels.items()}}
+                 for uri, labels in updated_uris_to_labels])
 
     def unset_labels(self, workspace_id: str, category_id: int, uris: Sequence[str], apply_to_duplicate_texts=False):
         """
@@ -148,9 +247,10 @@ class FileBasedDataAccess(DataAccessApi):
         dataset_name = utils.get_dataset_name_from_uri(uris[0])
         with self._get_lock_object_for_workspace(workspace_id):
             ds_labels = self._get_labels(workspace_id, dataset_name)
-            all_uris = self.get_all_text_elements_uris(dataset_name)
+            uri_to_row = self._get_uri_to_row(dataset_name)
+            updated_uris = []
             for uri in uris:
-                if uri not in all_uris:
+                if uri not in uri_to_row:
                     raise Exception(f'Trying to unset labels for uri "{uri}" which does not exist')
 
                 if apply_to_duplicate_texts:  # unset the given label for all elements with the same text
@@ -159,12 +259,18 @@ class FileBasedDataAccess(DataAccessApi):
                         ds_labels[same_text_uri].pop(category_id)
                         if len(ds_labels[same_text_uri]) == 0:
                             ds_labels.pop(same_text_uri)
+                        updated_uris.append(same_text_uri)
                 else:
                     ds_labels[uri].pop(category_id)
                     if len(ds_labels[uri]) == 0:
                         ds_labels.pop(uri)
-            # Save updated labels dict to disk
-            self._save_labels_data(dataset_name, workspace_id)
+                    updated_uris.append(uri)
+            self._update_label_codes(workspace_id, dataset_name, [(uri, {category_id: None}) for uri in updated_uris])
+            self.labels_versions[(workspace_id, dataset_name)] += 1
+            # Save the label changes to disk
+            self._append_to_labels_journal(dataset_name, workspace_id,
+                                           [{'op': 'unset', 'uri': uri, 'category_id': category_id}
+                                            for uri in updated_uris])
 
     def get_documents(self, workspace_id: Union[None, str], dataset_name: str, uris: Iterable[str],
                       label_types: Union[None,Set[LabelType]] = frozenset({LabelType.Standard})) \
@@ -183,16 +289,21 @@ class FileBasedDataAccess(DataAccessApi):
         information for the TextElements of these Documents, if available.
         """
 
-        def load_doc(uri):
-            filename = utils.uri_to_filename(uri)
-            file_path = os.path.join(doc_dump_dir, filename)
-            with open(file_path + '.json') as json_file:
-                doc_encoded = json_file.read()
-            doc = jsonpickle.decode(doc_encoded)
-            return doc
-
-        doc_dump_dir = self._get_documents_dump_dir(dataset_name)
-        docs = [load_doc(uri) for uri in uris]
+        uris = list(uris)
+        documents_index = self._get_documents_index(dataset_name)
+        missing_uris = [uri for uri in uris if uri not in documents_index]
+        if len(missing_uris) > 0:
+            raise Exception(f"{len(missing_uris)} documents do not exist in dataset '{dataset_name}': "
+                            f"{missing_uris[:5]}{'...' if len(missing_uris) > 5 else ''}")
+
+        # read the requested documents in the order in which they are stored in the file
+        uri_to_doc = {}
+        with open(self._get_documents_filename(dataset_name), 'rb') as f:
+            for uri in sorted(set(uris), key=lambda u: documents_index[u][0]):
+                offset, length = documents_index[uri]
+                f.seek(offset)
+                uri_to_doc[uri] = jsonpickle.decode(f.read(length).decode('utf-8'))
+        docs = [uri_to_doc[uri] for uri in uris]
         if workspace_id is not None:
             with self._get_lock_object_for_workspace(workspace_id):
                 for d in docs:
@@ -207,13 +318,13 @@ class FileBasedDataAccess(DataAccessApi):
         :param dataset_name: the name of the dataset from which the Document uris should be retrieved.
         :return: a List of all Document uris in the given dataset_name.
         """
-        uris = []
-        doc_dump_dir = self._get_documents_dump_dir(dataset_name)
-        for filename in os.listdir(doc_dump_dir):
-            filename, file_extension = os.path.splitext(filename)
-            uris.append(utils.filename_to_uri(filename))
-        uris = sorted(uris, key=utils.get_sort_key_by_document_name)
-        return uris
+        if not self._dataset_exists(dataset_name):
+            raise Exception(f'Dataset "{dataset_name}" does not exist.')
+        with self.dataset_in_memory_lock:
+            if dataset_name not in self.sorted_document_uris:
+                self.sorted_document_uris[dataset_name] = sorted(self._get_documents_index(dataset_name),
+                                                                 key=utils.get_sort_key_by_document_name)
+            return list(self.sorted_document_uris[dataset_name])
 
     def get_all_text_elements_uris(self, dataset_name: str) -> List[str]:
         """
@@ -229,7 +340,15 @@ class FileBasedDataAccess(DataAccessApi):
         Return the total number of TextElements in the given dataset_name.
         :param dataset_name:
         """
-        return len(self.get_all_text_elements_uris(dataset_name))
+        return len(self._get_ds_in_memory(dataset_name))
+
+    def get_duplicate_text_mask(self, dataset_name: str) -> np.ndarray:
+        """
+        Return a boolean array with an entry for each TextElement in the given dataset_name, in the order of the
+        dataset, which is True for elements whose text is identical to that of an element in a previous row.
+        :param dataset_name:
+        """
+        return ~self._get_text_groups(dataset_name).first_occurrence_mask
 
     def get_all_text_elements(self, dataset_name: str) -> List[TextElement]:
         """
@@ -239,6 +358,19 @@ class FileBasedDataAccess(DataAccessApi):
         """
         return utils.build_text_elements_from_dataframe_and_labels(self._get_ds_in_memory(dataset_name), labels_dict={})
 
+    def get_all_text_elements_batches(self, dataset_name: str, batch_size: int) -> Iterable[List[TextElement]]:
+        """
+        Iterate over all the TextElements in the given dataset_name, in batches of *batch_size* elements. Unlike
+        get_all_text_elements(), only the TextElement objects of a single batch are created at a time.
+
+        :param dataset_name: the name of the dataset from which the TextElement should be retrieved.
+        :param batch_size: the number of TextElements in each batch
+        """
+        corpus_df = self._get_ds_in_memory(dataset_name)
+        for i in range(0, len(corpus_df), batch_size):
+            yield utils.build_text_elements_from_dataframe_and_labels(corpus_df.iloc[i:i + batch_size],
+                                                                      labels_dict={})
+
     def get_text_elements(self, workspace_id: str, dataset_name: str, sample_size: int = sys.maxsize,
                           sample_start_idx: int = 0, query: str = None, is_regex: bool = False, document_uri=None,
                           remove_duplicates=False, random_state: int = 0) -> Mapping:
@@ -260,11 +392,15 @@ class FileBasedDataAccess(DataAccessApi):
         value is the total number of TextElements in the dataset matched by the query.
         {'results': [TextElement], 'hit_count': int}
         """
+        filter_func = lambda df: \
+            utils.filter_by_query_and_document_uri(
+                df, query, is_regex, document_uri,
+                candidate_rows=self._get_query_candidate_rows(dataset_name, query, is_regex))
         with self._get_lock_object_for_workspace(workspace_id):
             results_dict = \
                 self._get_text_elements(
-                    workspace_id=workspace_id, dataset_name=dataset_name,
-                    filter_func=lambda df, _: utils.filter_by_query_and_document_uri(df, query, is_regex, document_uri),
+                    workspace_id=workspace_id, dataset_name=dataset_name, filter_func=filter_func,
+                    filter_key=('query', query, is_regex, document_uri), filter_uses_labels=False,
                     sample_size=sample_size, sample_start_idx=sample_start_idx,
                     remove_duplicates=remove_duplicates, random_state=random_state)
 
@@ -292,12 +428,15 @@ class FileBasedDataAccess(DataAccessApi):
         value is the total number of TextElements in the dataset matched by the query.
         {'results': [TextElement], 'hit_count': int}
         """
-        filter_func = lambda df, labels: \
-            utils.filter_by_query_and_label_status(df, labels, category_id, LabeledStatus.UNLABELED, query, is_regex)
-
         with self._get_lock_object_for_workspace(workspace_id):
+            filter_func = lambda df: \
+                utils.filter_by_query_and_label_status(
+                    df, self._get_label_codes(workspace_id, dataset_name, category_id), LabeledStatus.UNLABELED, query,
+                    is_regex, candidate_rows=self._get_query_candidate_rows(dataset_name, query, is_regex))
             results_dict = self._get_text_elements(workspace_id=workspace_id, dataset_name=dataset_name,
-                                                   filter_func=filter_func, sample_size=sample_size,
+                                                   filter_func=filter_func,
+                                                   filter_key=('unlabeled', category_id, query, is_regex),
+                                                   sample_size=sample_size,
                                                    sample_start_idx=sample_start_idx,
                                                    remove_duplicates=remove_duplicates, random_state=random_state)
         return results_dict
@@ -325,12 +464,17 @@ class FileBasedDataAccess(DataAccessApi):
         {'results': [TextElement], 'hit_count': int}
         """
 
-        filter_func = lambda df, labels: \
-            utils.filter_by_query_and_label_status(df, labels, category_id, LabeledStatus.LABELED, query, is_regex,
-                                                   label_types=label_types)
         with self._get_lock_object_for_workspace(workspace_id):
+            filter_func = lambda df: \
+                utils.filter_by_query_and_label_status(
+                    df, self._get_label_codes(workspace_id, dataset_name, category_id), LabeledStatus.LABELED, query,
+                    is_regex, label_types=label_types,
+                    candidate_rows=self._get_query_candidate_rows(dataset_name, query, is_regex))
             results_dict = self._get_text_elements(workspace_id=workspace_id, dataset_name=dataset_name,
-                                                   filter_func=filter_func, sample_size=sample_size,
+                                                   filter_func=filter_func,
+                                                   filter_key=('labeled', category_id, query, is_regex,
+                                                               frozenset(label_types)),
+                                                   sample_size=sample_size,
                                                    remove_duplicates=remove_duplicates, random_state=random_state)
         return results_dict
 
@@ -348,22 +492,35 @@ class FileBasedDataAccess(DataAccessApi):
         :return: a map whose keys are label values, and the values are the number of TextElements this label was
         assigned to.
         """
-        labels_by_uri = self._get_labels(workspace_id=workspace_id, dataset_name=dataset_name).copy()
-        if remove_duplicates:
-            corpus_df = self._get_ds_in_memory(dataset_name=dataset_name)
-            labeled_df = corpus_df[corpus_df['uri'].isin(labels_by_uri)]
-            uris_to_keep = set(labeled_df.drop_duplicates(subset=['text'])['uri'])
-            labels_by_uri = {uri: category_to_label for uri, category_to_label in labels_by_uri.items()
-                             if uri in uris_to_keep}
-
-        category_label_list = \
-            [category_to_label[category_id] for category_to_label in labels_by_uri.values()
-             if category_id in category_to_label and category_to_label[category_id].label_type in label_types]
-
-        if fine_grained_counts:
-            return Counter(lbl_obj.get_detailed_label_name() for lbl_obj in category_label_list)
-        else:
-            return Counter(lbl_obj.label for lbl_obj in category_label_list)
+        with self._get_lock_object_for_workspace(workspace_id):
+            code_counts = self._get_label_counts_of_category(workspace_id, dataset_name, category_id) \
+                .get_code_counts(label_types, remove_duplicates)
+
+        counts = Counter()
+        for code in code_counts.nonzero()[0]:
+            label = utils.code_to_label(code)
+            counts[label.get_detailed_label_name() if fine_grained_counts else label.label] += int(code_counts[code])
+        return counts
+
+    def check_label_counts(self, workspace_id: str, dataset_name: str) -> bool:
+        """
+        Rebuild the label counts of all the categories of the given workspace from its labels, and verify that they
+        match the counts that were maintained incrementally. Counts that do not match are replaced by the rebuilt ones.
+        :param workspace_id:
+        :param dataset_name:
+        :return: True if the label counts of all the categories were consistent
+        """
+        is_consistent = True
+        with self._get_lock_object_for_workspace(workspace_id):
+            category_to_counts = self.label_counts_in_memory[(workspace_id, dataset_name)]
+            for category_id, label_counts in list(category_to_counts.items()):
+                self.label_codes_in_memory[(workspace_id, dataset_name)].pop(category_id, None)
+                rebuilt_label_counts = self._get_label_counts_of_category(workspace_id, dataset_name, category_id)
+                if not rebuilt_label_counts.has_same_counts(label_counts):
+                    logging.warning(f"label counts of workspace '{workspace_id}' category id '{category_id}' in "
+                                    f"dataset '{dataset_name}' were inconsistent with the labels, and were rebuilt")
+                    is_consistent = False
+        return is_consistent
 
     def delete_all_labels(self, workspace_id, dataset_name):
         """
@@ -371,12 +528,20 @@ class FileBasedDataAccess(DataAccessApi):
         :param workspace_id:
         :param dataset_name:
         """
-        labels_file = self._get_workspace_labels_dump_filename(workspace_id, dataset_name)
-        if os.path.isfile(labels_file):
-            os.remove(labels_file)
-        workspace_dumps_dir = self._get_workspace_labels_dir(workspace_id)
-        if os.path.exists(workspace_dumps_dir) and len(os.listdir(workspace_dumps_dir)) == 0:
-            os.rmdir(workspace_dumps_dir)
+        with self._get_lock_object_for_workspace(workspace_id):
+            if workspace_id in self.labels_in_memory:
+                self.labels_in_memory[workspace_id].pop(dataset_name, None)
+            self.label_codes_in_memory.pop((workspace_id, dataset_name), None)
+            self.label_counts_in_memory.pop((workspace_id, dataset_name), None)
+            self.labels_journal_records_count.pop((workspace_id, dataset_name), None)
+            self.labels_versions[(workspace_id, dataset_name)] += 1
+            for labels_file in [self._get_workspace_labels_dump_filename(workspace_id, dataset_name),
+                                self._get_workspace_labels_journal_filename(workspace_id, dataset_name)]:
+                if os.path.isfile(labels_file):
+                    os.remove(labels_file)
+            workspace_dumps_dir = self._get_workspace_labels_dir(workspace_id)
+            if os.path.exists(workspace_dumps_dir) and len(os.listdir(workspace_dumps_dir)) == 0:
+                os.rmdir(workspace_dumps_dir)
 
     def delete_labels_for_category(self, workspace_id, dataset_name, category_id):
         """
@@ -402,10 +567,12 @@ class FileBasedDataAccess(DataAccessApi):
         :param label_types:  by default, only the LabelType.Standard (strong labels) are retrieved.
         """
         corpus_df = self._get_ds_in_memory(dataset_name)
+        uri_to_row = self._get_uri_to_row(dataset_name)
         uris = list(uris)
-        corpus_df = corpus_df.loc[corpus_df['uri'].isin(uris)]
-        text_elements_by_uri = {te.uri: te for te
-                                in utils.build_text_elements_from_dataframe_and_labels(corpus_df, labels_dict={})}
+        rows = [uri_to_row[uri] for uri in uris if uri in uri_to_row]
+        text_elements_by_uri = \
+            {te.uri: te for te in utils.build_text_elements_from_dataframe_and_labels(corpus_df.iloc[rows],
+                                                                                      labels_dict={})}
         text_elements = [text_elements_by_uri.get(uri) for uri in uris]
 
         with self._get_lock_object_for_workspace(workspace_id):
@@ -414,6 +581,21 @@ class FileBasedDataAccess(DataAccessApi):
 
         return text_elements
 
+    def get_uris_by_texts(self, dataset_name: str, texts: Iterable[str]) -> pd.DataFrame:
+        """
+        Return the uris of all the text elements in the given dataset whose text is identical to one of the given
+        texts.
+        :param dataset_name:
+        :param texts:
+        :return: a DataFrame with a row for each matching text element, and the columns DisplayFields.text and
+        DisplayFields.uri
+        """
+        corpus_df = self._get_ds_in_memory(dataset_name)
+        # isin() looks up each dataset text in a hash set of the given texts
+        matches_df = corpus_df[corpus_df['text'].isin(pd.unique(pd.Series(list(texts), dtype=object)))]
+        return pd.DataFrame({DisplayFields.text: matches_df['text'].tolist(),
+                             DisplayFields.uri: matches_df['uri'].tolist()})
+
     def get_text_element_iterator(self, workspace_id, dataset_name, shuffle=False, random_state: int = 0,
                                   remove_duplicates=False) -> Iterable[TextElement]:
         """
@@ -427,7 +609,7 @@ class FileBasedDataAccess(DataAccessApi):
         """
         corpus_df = self._get_ds_in_memory(dataset_name)
         if remove_duplicates:
-            corpus_df = corpus_df.drop_duplicates(subset=['text'])
+            corpus_df = corpus_df[self._get_text_groups(dataset_name).first_occurrence_mask]
         all_uris = list(corpus_df['uri'].values)
         if shuffle:
             random.Random(random_state).shuffle(all_uris)
@@ -452,11 +634,24 @@ class FileBasedDataAccess(DataAccessApi):
         :param dataset_name:
         """
         logging.info(f"Deleting dataset '{dataset_name}'")
-        dataset_dir = self._get_dataset_base_dir(dataset_name)
-        if os.path.isdir(dataset_dir):
-            shutil.rmtree(dataset_dir)
-        if dataset_name in self.ds_in_memory:
-            del self.ds_in_memory[dataset_name]
+        with self.dataset_in_memory_lock:
+            dataset_dir = self._get_dataset_base_dir(dataset_name)
+            if os.path.isdir(dataset_dir):
+                shutil.rmtree(dataset_dir)
+            if dataset_name in self.ds_in_memory:
+                del self.ds_in_memory[dataset_name]
+            self.uri_to_row_in_memory.pop(dataset_name, None)
+            self.text_groups_in_memory.pop(dataset_name, None)
+            self.text_index_in_memory.pop(dataset_name, None)
+            self.dataset_versions[dataset_name] += 1
+            self.text_to_unique_id_in_memory.pop(dataset_name, None)
+            self.documents_index_in_memory.pop(dataset_name, None)
+            self.documents_index_journal_records_count.pop(dataset_name, None)
+            self.sorted_document_uris.pop(dataset_name, None)
+            for workspace_and_dataset in [key for key in self.label_codes_in_memory if key[1] == dataset_name]:
+                del self.label_codes_in_memory[workspace_and_dataset]
+            for workspace_and_dataset in [key for key in self.label_counts_in_memory if key[1] == dataset_name]:
+                del self.label_counts_in_memory[workspace_and_dataset]
 
     def _get_lock_object_for_workspace(self, workspace_id: str):
         lock_object = self.workspace_to_labels_lock_objects[workspace_id]
@@ -466,14 +661,14 @@ class FileBasedDataAccess(DataAccessApi):
         with self.dataset_in_memory_lock:
             if dataset_name not in self.ds_in_memory:
                 if self._dataset_exists(dataset_name):
-                    logging.info(f"reading dataset '{dataset_name}' csv file")
-                    dataset_file_path = self._get_dataset_dump_filename(dataset_name)
-
-                    df = pd.read_csv(dataset_file_path, converters=
-                            {"span": lambda span: [tuple(int(x) for x in span[2:-2].split(','))],
-                             "metadata": lambda metadata: ast.literal_eval(metadata) if metadata != '{}' else {}})
-
-                    logging.info(f"csv file for dataset '{dataset_name}' read and processed successfully")
+                    if not os.path.isfile(self._get_dataset_dump_filename(dataset_name)) \
+                            and not os.path.isfile(self._get_segments_manifest_filename(dataset_name)):
+                        self._migrate_legacy_dataset_csv(dataset_name)
+                    segment_files = self._get_segment_filenames(dataset_name)
+                    df = pd.concat([utils.read_arrow_file_to_dataframe(segment_file)
+                                    for segment_file in segment_files], ignore_index=True, sort=False)
+                    logging.info(f"dataset '{dataset_name}' ({len(df)} elements) mapped from "
+                                 f"{len(segment_files)} segment files")
                 else:
                     raise Exception(f'Dataset "{dataset_name}" does not exist.')
                 self.ds_in_memory[dataset_name] = df
@@ -491,6 +686,7 @@ class FileBasedDataAccess(DataAccessApi):
                 for uri, category_to_label in simplified_dict.items():
                     for category_id, label_dict in category_to_label.items():
                         self.labels_in_memory[workspace_id][dataset_name][uri][int(category_id)] = Label(**label_dict)
+                self._replay_labels_journal(dataset_name, workspace_id)
             else:
                 # Save empty dict to disk
                 os.makedirs(Path(file_path).parent, exist_ok=True)
@@ -499,18 +695,308 @@ class FileBasedDataAccess(DataAccessApi):
                     f.write(empty_dict_encoded)
         return self.labels_in_memory[workspace_id][dataset_name]
 
+    def _get_documents_index(self, dataset_name):
+        with self.dataset_in_memory_lock:
+            if dataset_name not in self.documents_index_in_memory:
+                index_file_path = self._get_documents_index_filename(dataset_name)
+                if os.path.isfile(index_file_path):
+                    with open(index_file_path) as f:
+                        index = json.load(f)
+                    self.documents_index_in_memory[dataset_name] = \
+                        {uri: (offset, length) for uri, offset, length
+                         in zip(index['uris'], index['offsets'], index['lengths'])}
+                    self._replay_documents_index_journal(dataset_name)
+                elif os.path.isdir(self._get_documents_dump_dir(dataset_name)):
+                    self._migrate_documents_dump_dir(dataset_name)
+                else:
+                    self.documents_index_in_memory[dataset_name] = {}
+            return self.documents_index_in_memory[dataset_name]
+
+    def _add_to_documents_index(self, dataset_name, new_index_entries):
+        """
+        Add (uri, (offset, length)) entries to the documents index of the dataset, and persist them. The entries are
+        appended to the documents index journal, so the cost of adding documents does not depend on the number of
+        documents already in the dataset; once the journal becomes too long, the index is saved to a new snapshot.
+        """
+        with self.dataset_in_memory_lock:
+            self._get_documents_index(dataset_name).update(new_index_entries)
+            self.sorted_document_uris.pop(dataset_name, None)
+            if not os.path.isfile(self._get_documents_index_filename(dataset_name)):
+                self._save_documents_index(dataset_name)
+                return
+            with open(self._get_documents_index_journal_filename(dataset_name), 'a') as f:
+                f.write(''.join(json.dumps([uri, offset, length]) + '\n'
+                                for uri, (offset, length) in new_index_entries))
+                f.flush()
+                os.fsync(f.fileno())
+            self.documents_index_journal_records_count[dataset_name] += len(new_index_entries)
+            if self.documents_index_journal_records_count[dataset_name] > self.max_documents_index_journal_records:
+                self._save_documents_index(dataset_name)
+
+    def _replay_documents_index_journal(self, dataset_name):
+        """
+        Add the entries recorded in the documents index journal to documents_index_in_memory. A partially written last
+        record is ignored and removed from the journal.
+        """
+        journal_path = self._get_documents_index_journal_filename(dataset_name)
+        if not os.path.isfile(journal_path):
+            return
+        documents_index = self.documents_index_in_memory[dataset_name]
+        records_count = 0
+        valid_journal_size = 0
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    logging.warning(f"ignoring a partially written record at the end of {journal_path}")
+                    break
+                valid_journal_size += len(line)
+                uri, offset, length = json.loads(line)
+                documents_index[uri] = (offset, length)
+                records_count += 1
+        if valid_journal_size < os.path.getsize(journal_path):
+            os.truncate(journal_path, valid_journal_size)
+        self.documents_index_journal_records_count[dataset_name] = records_count
+
+    def _save_documents_index(self, dataset_name):
+        """
+        Write a snapshot of the documents index of the dataset, and clear the documents index journal. Replaying the
+        journal on top of the new snapshot is harmless, so a crash at any point leaves the index intact.
+        """
+        documents_index = self.documents_index_in_memory[dataset_name]
+        index_file_path = self._get_documents_index_filename(dataset_name)
+        offsets, lengths = zip(*documents_index.values()) if len(documents_index) > 0 else ((), ())
+        with open(index_file_path + '.tmp', 'w') as f:
+            json.dump({'uris': list(documents_index.keys()), 'offsets': offsets, 'lengths': lengths}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_file_path + '.tmp', index_file_path)
+        open(self._get_documents_index_journal_filename(dataset_name), 'w').close()
+        self.documents_index_journal_records_count[dataset_name] = 0
+
+    def _migrate_documents_dump_dir(self, dataset_name):
+        """
+        Datasets created by older versions store a json file per document. Pack these files, once, into a single
+        documents file and index.
+        """
+        doc_dump_dir = self._get_documents_dump_dir(dataset_name)
+        logging.info(f"migrating documents of dataset '{dataset_name}' from {doc_dump_dir} to a packed documents file")
+        uris = sorted([utils.filename_to_uri(os.path.splitext(filename)[0]) for filename in os.listdir(doc_dump_dir)],
+                      key=utils.get_sort_key_by_document_name)
+        documents_file_path = self._get_documents_filename(dataset_name)
+        index_entries = []
+        with open(documents_file_path + '.tmp', 'wb') as packed_file:
+            for uri in uris:
+                with open(os.path.join(doc_dump_dir, utils.uri_to_filename(uri) + '.json'), 'rb') as json_file:
+                    doc_encoded = json_file.read().rstrip(b'\n') + b'\n'
+                index_entries.append((uri, (packed_file.tell(), len(doc_encoded))))
+                packed_file.write(doc_encoded)
+        os.replace(documents_file_path + '.tmp', documents_file_path)
+        self.documents_index_in_memory[dataset_name] = dict(index_entries)
+        self.sorted_document_uris.pop(dataset_name, None)
+        self._save_documents_index(dataset_name)
+        shutil.rmtree(doc_dump_dir)
+        logging.info(f"packed {len(uris)} documents of dataset '{dataset_name}' into {documents_file_path}")
+
+    def _get_label_codes(self, workspace_id, dataset_name, category_id) -> np.ndarray:
+        """
+        Return the label codes array of the given category, aligned to the rows of the dataset DataFrame. Must be
+        called while holding the workspace lock.
+        """
+        num_rows = len(self._get_ds_in_memory(dataset_name))
+        category_to_codes = self.label_codes_in_memory[(workspace_id, dataset_name)]
+        label_codes = category_to_codes.get(category_id)
+        if label_codes is None or len(label_codes) > num_rows:
+            ds_labels = self._get_labels(workspace_id, dataset_name)
+            uris_and_labels = [(uri, category_to_label[category_id]) for uri, category_to_label in ds_labels.items()
+                               if category_id in category_to_label]
+            label_codes = np.zeros(num_rows, dtype=utils.LABEL_CODE_DTYPE)
+            if len(uris_and_labels) > 0:
+                uris, labels = zip(*uris_and_labels)
+                label_codes[self._get_row_positions(dataset_name, uris)] = [utils.label_to_code(l) for l in labels]
+            # label counts that were built from the previous label codes are rebuilt on their next use
+            self.label_counts_in_memory[(workspace_id, dataset_name)].pop(category_id, None)
+        elif len(label_codes) < num_rows:  # documents were added to the dataset, and their elements are unlabeled
+            label_codes = np.concatenate([label_codes,
+                                          np.zeros(num_rows - len(label_codes), dtype=utils.LABEL_CODE_DTYPE)])
+        category_to_codes[category_id] = label_codes
+        return label_codes
+
+    def _update_label_codes(self, workspace_id, dataset_name, uris_and_labels):
+        """
+        Update the label codes arrays that were already built, following a change of labels.
+        :param uris_and_labels: a list of tuples of uri and a dict from category id to the new Label of this uri for
+        this category, or to None if the label was removed
+        """
+        category_to_codes = self.label_codes_in_memory[(workspace_id, dataset_name)]
+        category_to_uris_and_codes = defaultdict(dict)
+        for uri, category_to_label in uris_and_labels:
+            for category_id, label in category_to_label.items():
+                if category_id in category_to_codes:
+                    category_to_uris_and_codes[category_id][uri] = 0 if label is None else utils.label_to_code(label)
+        for category_id, uri_to_code in category_to_uris_and_codes.items():
+            label_codes = self._get_label_codes(workspace_id, dataset_name, category_id)
+            rows = self._get_row_positions(dataset_name, uri_to_code.keys())
+            new_codes = list(uri_to_code.values())
+            label_counts = self.label_counts_in_memory[(workspace_id, dataset_name)].get(category_id)
+            if label_counts is not None:
+                text_unique_ids = self._get_ds_in_memory(dataset_name)['text_unique_id'].values[rows]
+                for row, text_unique_id, old_code, new_code in zip(rows.tolist(), text_unique_ids.tolist(),
+                                                                   label_codes[rows].tolist(), new_codes):
+                    label_counts.update(row, text_unique_id, old_code, new_code)
+            label_codes[rows] = new_codes
+
+    def _get_label_counts_of_category(self, workspace_id, dataset_name, category_id) -> LabelCounts:
+        """
+        Return the label counts of the given category. Must be called while holding the workspace lock.
+        """
+        label_codes = self._get_label_codes(workspace_id, dataset_name, category_id)
+        category_to_counts = self.label_counts_in_memory[(workspace_id, dataset_name)]
+        label_counts = category_to_counts.get(category_id)
+        if label_counts is None:
+            label_counts = LabelCounts(label_codes, self._get_ds_in_memory(dataset_name)['text_unique_id'].values)
+            category_to_counts[category_id] = label_counts
+        return label_counts
+
+    def _get_row_positions(self, dataset_name, uris) -> np.ndarray:
+        """
+        Return the positions of the given uris in the dataset DataFrame.
+        """
+        uri_to_row = self._get_uri_to_row(dataset_name)
+        return np.array([uri_to_row[uri] for uri in uris], dtype=np.int64)
+
+    def _get_uri_to_row(self, dataset_name):
+        with self.dataset_in_memory_lock:
+            corpus_df = self._get_ds_in_memory(dataset_name)
+            uri_to_row = self.uri_to_row_in_memory.get(dataset_name)
+            if uri_to_row is None or len(uri_to_row) != len(corpus_df):
+                uri_to_row = {uri: row for row, uri in enumerate(corpus_df['uri'].tolist())}
+                self.uri_to_row_in_memory[dataset_name] = uri_to_row
+            return uri_to_row
+
     def _add_sentences_to_dataset_in_memory(self, dataset_name, text_elements: Iterable[TextElement]):
-        if self._dataset_exists(dataset_name):
-            self.ds_in_memory[dataset_name] = self._get_ds_in_memory(dataset_name)
-        dicts = [dataclasses.asdict(s) for s in text_elements]
-        [d.pop('category_to_label') for d in dicts]  # category_to_labels is not saved in the dataframe
-        new_sentences_df = pd.DataFrame(dicts)
-        if dataset_name in self.ds_in_memory:
-            self.ds_in_memory[dataset_name] = self.ds_in_memory[dataset_name].append(new_sentences_df, sort=False)
-        else:
-            self.ds_in_memory[dataset_name] = new_sentences_df
-        self.ds_in_memory[dataset_name] = self._add_text_unique_ids(self.ds_in_memory[dataset_name])
-        self.ds_in_memory[dataset_name].to_csv(self._get_dataset_dump_filename(dataset_name), index=False)
+        with self.dataset_in_memory_lock:
+            # category_to_labels is not saved in the dataframe
+            new_sentences_df = utils.text_elements_to_dataframe(text_elements)
+            self.dataset_versions[dataset_name] += 1
+            if not self._dataset_exists(dataset_name):
+                new_sentences_df = self._add_text_unique_ids(new_sentences_df)
+                dataset_file_path = self._get_dataset_dump_filename(dataset_name)
+                utils.write_dataframe_to_arrow_file(new_sentences_df, dataset_file_path)
+                self.ds_in_memory[dataset_name] = utils.read_arrow_file_to_dataframe(dataset_file_path)
+                if self.use_text_search_index:
+                    self._get_text_index(dataset_name)
+                return
+
+            existing_df = self._get_ds_in_memory(dataset_name)
+            uri_to_row = self._get_uri_to_row(dataset_name)
+            new_sentences_df = self._extend_text_unique_ids(dataset_name, new_sentences_df)
+            segment_files, next_segment_id = self._read_segments_manifest(dataset_name)
+            segment_file_path = os.path.join(self._get_dataset_base_dir(dataset_name),
+                                             self._get_segment_basename(next_segment_id))
+            utils.write_dataframe_to_arrow_file(new_sentences_df, segment_file_path)
+            segment_files.append(os.path.basename(segment_file_path))
+            self._write_segments_manifest(dataset_name, segment_files, next_segment_id + 1)
+            self.ds_in_memory[dataset_name] = \
+                pd.concat([existing_df, utils.read_arrow_file_to_dataframe(segment_file_path)],
+                          ignore_index=True, sort=False)
+            uri_to_row.update({uri: len(existing_df) + i for i, uri in enumerate(new_sentences_df['uri'].tolist())})
+            self.text_groups_in_memory.pop(dataset_name, None)
+            if self.use_text_search_index:
+                self._get_text_index(dataset_name)
+            if len(segment_files) > self.max_segments_before_compaction:
+                segments_compaction_thread_pool.submit(self._compact_segments, dataset_name)
+
+    def _extend_text_unique_ids(self, dataset_name, new_sentences_df):
+        """
+        Assign text_unique_ids to the elements of new_sentences_df, continuing the ids already assigned to the texts
+        of the dataset, so that a text that already appears in the dataset keeps its id.
+        """
+        with self.dataset_in_memory_lock:
+            if dataset_name not in self.text_to_unique_id_in_memory:
+                df = self._get_ds_in_memory(dataset_name)
+                self.text_to_unique_id_in_memory[dataset_name] = \
+                    dict(zip(df['text'].tolist(), df['text_unique_id'].tolist()))
+            text_to_unique_id = self.text_to_unique_id_in_memory[dataset_name]
+            text_unique_ids = []
+            for text in new_sentences_df['text'].tolist():
+                if text not in text_to_unique_id:
+                    text_to_unique_id[text] = len(text_to_unique_id)
+                text_unique_ids.append(text_to_unique_id[text])
+        new_sentences_df['text_unique_id'] = pd.array(text_unique_ids, dtype='int64')
+        return new_sentences_df
+
+    def _compact_segments(self, dataset_name):
+        """
+        Merge the current segment files of the dataset into a single segment. Segments appended while the merge is
+        running are kept as is, after the merged segment.
+        """
+        try:
+            with self.dataset_in_memory_lock:
+                if not os.path.isfile(self._get_segments_manifest_filename(dataset_name)):
+                    return
+                segment_files, next_segment_id = self._read_segments_manifest(dataset_name)
+                self._write_segments_manifest(dataset_name, segment_files, next_segment_id + 1)
+            dataset_dir = self._get_dataset_base_dir(dataset_name)
+            logging.info(f"compacting {len(segment_files)} segments of dataset '{dataset_name}'")
+            df = pd.concat([utils.read_arrow_file_to_dataframe(os.path.join(dataset_dir, segment_file))
+                            for segment_file in segment_files], ignore_index=True, sort=False)
+            compacted_file = self._get_segment_basename(next_segment_id)
+            utils.write_dataframe_to_arrow_file(df, os.path.join(dataset_dir, compacted_file))
+
+            with self.dataset_in_memory_lock:
+                current_segment_files, current_next_segment_id = self._read_segments_manifest(dataset_name)
+                if current_segment_files[:len(segment_files)] != segment_files:
+                    raise Exception(f"segments of dataset '{dataset_name}' changed during compaction")
+                self._write_segments_manifest(dataset_name,
+                                              [compacted_file] + current_segment_files[len(segment_files):],
+                                              current_next_segment_id)
+                for segment_file in segment_files:
+                    os.remove(os.path.join(dataset_dir, segment_file))
+            logging.info(f"compacted {len(segment_files)} segments of dataset '{dataset_name}' into {compacted_file}")
+        except Exception:
+            logging.exception(f"failed to compact the segments of dataset '{dataset_name}'")
+
+    def _get_segment_filenames(self, dataset_name):
+        segment_files, _ = self._read_segments_manifest(dataset_name)
+        return [os.path.join(self._get_dataset_base_dir(dataset_name), segment_file) for segment_file in segment_files]
+
+    def _read_segments_manifest(self, dataset_name):
+        """
+        :return: the list of segment file names of the dataset, in order, and the id to be used for the next segment.
+        A dataset that was never appended to has no manifest, and consists of a single segment.
+        """
+        manifest_file = self._get_segments_manifest_filename(dataset_name)
+        if not os.path.isfile(manifest_file):
+            return [self.sentences_filename], 1
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        return manifest['segments'], manifest['next_segment_id']
+
+    def _write_segments_manifest(self, dataset_name, segment_files, next_segment_id):
+        manifest_file = self._get_segments_manifest_filename(dataset_name)
+        with open(manifest_file + '.tmp', 'w') as f:
+            json.dump({'segments': segment_files, 'next_segment_id': next_segment_id}, f)
+        os.replace(manifest_file + '.tmp', manifest_file)
+
+    def _get_segment_basename(self, segment_id):
+        name, extension = os.path.splitext(self.sentences_filename)
+        return f'{name}.{segment_id}{extension}'
+
+    def _migrate_legacy_dataset_csv(self, dataset_name):
+        """
+        Datasets created by older versions are stored as a csv file. Convert such a file, once, to the Arrow format.
+        """
+        csv_file_path = self._get_legacy_dataset_dump_filename(dataset_name)
+        logging.info(f"migrating dataset '{dataset_name}' csv file to the Arrow format")
+        df = pd.read_csv(csv_file_path, converters=
+                         {"span": lambda span: [tuple(int(x) for x in span[2:-2].split(','))],
+                          "metadata": lambda metadata: ast.literal_eval(metadata) if metadata != '{}' else {}})
+        text_elements = [TextElement(uri=uri, text=text, span=span, metadata=metadata, category_to_label={})
+                         for uri, text, span, metadata in zip(df['uri'], df['text'], df['span'], df['metadata'])]
+        df = self._add_text_unique_ids(utils.text_elements_to_dataframe(text_elements))
+        utils.write_dataframe_to_arrow_file(df, self._get_dataset_dump_filename(dataset_name))
+        os.remove(csv_file_path)
+        logging.info(f"dataset '{dataset_name}' migrated successfully")
 
     def _add_labels_info_for_text_elements(self, workspace_id, dataset_name, text_elements: List[TextElement],
                                            label_types):
@@ -524,70 +1010,208 @@ class FileBasedDataAccess(DataAccessApi):
                                               if label.label_type in label_types}
         return text_elements
 
-    def _get_text_elements(self, workspace_id: str, dataset_name: str, filter_func, sample_size: int,
-                           sample_start_idx=0, remove_duplicates=False, random_state: int = 0) -> Mapping:
+    def _get_text_elements(self, workspace_id: str, dataset_name: str, filter_func, filter_key, sample_size: int,
+                           sample_start_idx=0, remove_duplicates=False, random_state: int = 0,
+                           filter_uses_labels=True) -> Mapping:
         """
         :param workspace_id: if None no labels info would be used or output
         :param dataset_name:
-        :param filter_func:
+        :param filter_func: a function that receives the dataset DataFrame and returns the filtered DataFrame
+        :param filter_key: a hashable description of the filter, that identifies the results of filter_func in the
+        result sets cache
         :param sample_size: number of elements to return. if None, return all elements without sampling
         :param sample_start_idx: get elements starting from this index (for pagination)
         :param remove_duplicates:
         :param random_state: provide an int seed to define a random state. Default is zero.
+        :param filter_uses_labels: whether the results of filter_func depend on the workspace labels
         """
         corpus_df = self._get_ds_in_memory(dataset_name)
         if workspace_id:
             labels_dict = self._get_labels(workspace_id, dataset_name)
         else:
             labels_dict = {}
-        labels_series = corpus_df['uri'].apply(lambda u: labels_dict[u] if u in labels_dict else {})
-        corpus_df = filter_func(corpus_df, labels_series)
 
-        results_dict = {'hit_count': len(corpus_df)}
+        cache_key = (workspace_id, dataset_name, filter_key, remove_duplicates, random_state, sample_size is None,
+                     self.dataset_versions[dataset_name],
+                     self.labels_versions[(workspace_id, dataset_name)] if filter_uses_labels else None)
+        # without a random state the order of a shuffled result set is not reproducible, so it is not cached
+        result_set = self.result_sets_cache.get(cache_key) if random_state is not None else None
+        if result_set is None:
+            result_set = self._get_result_set(dataset_name, corpus_df, filter_func, sample_size is not None,
+                                              remove_duplicates, random_state)
+            if random_state is not None:
+                self.result_sets_cache.set(cache_key, result_set)
+
+        results_dict = {'hit_count': result_set.hit_count}
         if remove_duplicates:
-            unique_texts = set()
-            corpus_df = corpus_df.loc[
-                corpus_df['text'].apply(lambda x: x not in unique_texts and not unique_texts.add(x))]
-            results_dict['hit_count_unique'] = len(corpus_df)
-
+            results_dict['hit_count_unique'] = result_set.hit_count_unique
+        rows = result_set.rows
         if sample_size is not None:
-            # TODO UNKNOWN BUG fix
-            corpus_df = corpus_df.sample(n=min(sample_size + sample_start_idx, len(corpus_df)),
-                                         random_state=random_state
-                                         )[sample_start_idx:sample_start_idx + sample_size]
-
-        results_dict['results'] = utils.build_text_elements_from_dataframe_and_labels(corpus_df, labels_dict)
+            rows = rows[sample_start_idx:sample_start_idx + sample_size]
+        results_dict['results'] = \
+            utils.build_text_elements_from_dataframe_and_labels(corpus_df.iloc[rows], labels_dict)
         return results_dict
 
+    def _get_result_set(self, dataset_name, corpus_df, filter_func, shuffle, remove_duplicates,
+                        random_state) -> ResultSet:
+        corpus_df = filter_func(corpus_df)
+        hit_count = len(corpus_df)
+        # the index of the dataset DataFrame is the position of each row
+        rows = corpus_df.index.values
+        hit_count_unique = None
+        if remove_duplicates:
+            text_groups = self._get_text_groups(dataset_name)
+            if len(rows) == len(text_groups.first_occurrence_mask):  # nothing was filtered out
+                rows = rows[text_groups.first_occurrence_mask]
+            else:
+                # keep the first of the filtered elements out of each group of elements with the same text
+                _, first_occurrences = np.unique(corpus_df['text_unique_id'].values, return_index=True)
+                rows = rows[np.sort(first_occurrences)]
+            hit_count_unique = len(rows)
+
+        if shuffle:
+            # a prefix of this permutation is identical to the result of DataFrame.sample() with the same random_state,
+            # so each page is a slice of the same shuffled order
+            rows = rows[np.random.RandomState(random_state).permutation(len(rows))]
+        return ResultSet(rows=rows.astype(np.int32 if len(corpus_df.index) < 2 ** 31 else np.int64),
+                         hit_count=hit_count, hit_count_unique=hit_count_unique)
+
+    def _append_to_labels_journal(self, dataset_name, workspace_id, records):
+        """
+        Append records of label changes to the labels journal. Each record is written as a single line, so the cost of
+        a label change does not depend on the total number of labels; once the journal becomes too long, the labels
+        are saved to a new snapshot and the journal is cleared.
+        """
+        timestamp = time.time()
+        journal_path = self._get_workspace_labels_journal_filename(workspace_id, dataset_name)
+        os.makedirs(Path(journal_path).parent, exist_ok=True)
+        with open(journal_path, 'a') as f:
+            f.write(''.join(json.dumps({'timestamp': timestamp, **record}) + '\n' for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self.labels_journal_records_count[(workspace_id, dataset_name)] += len(records)
+        if self.labels_journal_records_count[(workspace_id, dataset_name)] > self.max_labels_journal_records:
+            self._save_labels_data(dataset_name, workspace_id)
+
+    def _replay_labels_journal(self, dataset_name, workspace_id):
+        """
+        Apply the label changes recorded in the labels journal to labels_in_memory. A partially written last record
+        (e.g. if the process was killed while writing it) is ignored and removed from the journal.
+        """
+        journal_path = self._get_workspace_labels_journal_filename(workspace_id, dataset_name)
+        if not os.path.isfile(journal_path):
+            return
+        labels = self.labels_in_memory[workspace_id][dataset_name]
+        records_count = 0
+        valid_journal_size = 0
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    logging.warning(f"ignoring a partially written record at the end of {journal_path}")
+                    break
+                valid_journal_size += len(line)
+                record = json.loads(line)
+                if record['op'] == 'set':
+                    labels[record['uri']].update({int(category_id): Label(**label_dict)
+                                                  for category_id, label_dict in record['labels'].items()})
+                elif record['op'] == 'unset':
+                    labels[record['uri']].pop(record['category_id'], None)
+                    if len(labels[record['uri']]) == 0:
+                        labels.pop(record['uri'])
+                records_count += 1
+        if valid_journal_size < os.path.getsize(journal_path):
+            # remove the partial record, so that new records are not appended to it
+            os.truncate(journal_path, valid_journal_size)
+        self.labels_journal_records_count[(workspace_id, dataset_name)] = records_count
+
     def _save_labels_data(self, dataset_name, workspace_id):
+        """
+        Write a snapshot of all the labels of the workspace for this dataset, and clear the labels journal. The
+        snapshot replaces the previous one atomically, and replaying the journal on top of the new snapshot is harmless,
+        so a crash at any point leaves the labels intact.
+        """
         file_path = self._get_workspace_labels_dump_filename(workspace_id, dataset_name)
         os.makedirs(Path(file_path).parent, exist_ok=True)
         labels = self.labels_in_memory[workspace_id][dataset_name]
         simplified_labels = {k: {str(category_id): label.to_dict() for category_id, label in v.items()}
                              for k, v in labels.items()}
         labels_in_memory_encoded = json.dumps(simplified_labels)
-        with open(file_path, 'w') as f:
+        with open(file_path + '.tmp', 'w') as f:
             f.write(labels_in_memory_encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(file_path + '.tmp', file_path)
+        open(self._get_workspace_labels_journal_filename(workspace_id, dataset_name), 'w').close()
+        self.labels_journal_records_count[(workspace_id, dataset_name)] = 0
 
     @staticmethod
     def _add_text_unique_ids(df):
         """
         To facilitate extraction of duplicate elements, i.e. text elements that have the same text, we assign an id to
-        each unique text in the dataframe. Whenever new documents are added to the corpus, these ids are recalculated.
+        each unique text in the dataframe, by order of first appearance. Whenever new documents are added to the
+        corpus, the ids are extended for the new texts (see _extend_text_unique_ids).
         """
-        unique_to_id = {}
-        df['text_unique_id'] = df['text'].apply(
-            lambda x: len(unique_to_id) - 1 if x not in unique_to_id and not unique_to_id.update({x: len(unique_to_id)})
-            else unique_to_id[x])
+        df['text_unique_id'] = pd.array(pd.factorize(df['text'])[0], dtype='int64')
         return df
 
     def _get_uris_with_the_same_text(self, dataset_name, uri):
         ds_in_memory = self._get_ds_in_memory(dataset_name)
-        text_unique_id = ds_in_memory[ds_in_memory['uri'] == uri]['text_unique_id'].values[0]
-        return ds_in_memory[ds_in_memory['text_unique_id'] == text_unique_id]['uri']
+        text_groups = self._get_text_groups(dataset_name)
+        text_unique_id = ds_in_memory['text_unique_id'].values[self._get_uri_to_row(dataset_name)[uri]]
+        rows = text_groups.text_group_rows[text_groups.text_group_indptr[text_unique_id]:
+                                           text_groups.text_group_indptr[text_unique_id + 1]]
+        return ds_in_memory['uri'].iloc[rows].tolist()
+
+    def _get_query_candidate_rows(self, dataset_name, query, is_regex) -> Union[None, np.ndarray]:
+        """
+        Use the text index (if enabled) to find the rows of the dataset that may match the query.
+        :return: an array of row positions, or None if all rows should be checked
+        """
+        if not query or not self.use_text_search_index:
+            return None
+        return self._get_text_index(dataset_name).get_candidate_rows(query, is_regex)
+
+    def _get_text_index(self, dataset_name) -> TextIndex:
+        """
+        Return the text index of the dataset, loading it from disk if needed, and indexing any rows that are not yet in
+        the index.
+        """
+        with self.dataset_in_memory_lock:
+            corpus_df = self._get_ds_in_memory(dataset_name)
+            text_index_file = self._get_text_index_filename(dataset_name)
+            text_index = self.text_index_in_memory.get(dataset_name)
+            if text_index is None and os.path.isfile(text_index_file):
+                text_index = load_text_index(text_index_file)
+            if text_index is None or text_index.num_rows > len(corpus_df):
+                if os.path.isfile(text_index_file):
+                    os.remove(text_index_file)
+                text_index = TextIndex()
+            if text_index.num_rows < len(corpus_df):
+                logging.info(f"indexing the texts of {len(corpus_df) - text_index.num_rows} elements of dataset "
+                             f"'{dataset_name}'")
+                block = text_index.add_texts(corpus_df['text'].iloc[text_index.num_rows:].tolist())
+                append_text_index_block(text_index_file, block)
+            self.text_index_in_memory[dataset_name] = text_index
+            return text_index
+
+    def _get_text_groups(self, dataset_name) -> utils.TextGroups:
+        with self.dataset_in_memory_lock:
+            num_rows = len(self._get_ds_in_memory(dataset_name))
+            text_groups = self.text_groups_in_memory.get(dataset_name)
+            if text_groups is None or len(text_groups.text_group_rows) != num_rows:
+                text_groups_file = self._get_text_groups_filename(dataset_name)
+                text_groups = utils.load_text_groups(text_groups_file) if os.path.isfile(text_groups_file) else None
+                if text_groups is None or len(text_groups.text_group_rows) != num_rows:
+                    text_unique_ids = self._get_ds_in_memory(dataset_name)['text_unique_id'].to_numpy()
+                    text_groups = utils.build_text_groups(text_unique_ids)
+                    utils.save_text_groups(text_groups, text_groups_file)
+                self.text_groups_in_memory[dataset_name] = text_groups
+            return text_groups
 
     def _dataset_exists(self, dataset_name):
-        return os.path.exists(self._get_dataset_dump_filename(dataset_name))
+        return os.path.exists(self._get_dataset_dump_filename(dataset_name)) \
+               or os.path.exists(self._get_segments_manifest_filename(dataset_name)) \
+               or os.path.exists(self._get_legacy_dataset_dump_filename(dataset_name))
 
     def _get_dataset_base_dir(self, dataset_name):
         return os.path.join(self._get_datasets_base_dir(), dataset_name)
@@ -600,13 +1224,38 @@ class FileBasedDataAccess(DataAccessApi):
     def _get_documents_dump_dir(self, dataset_name):
         return os.path.join(self._get_dataset_base_dir(dataset_name), self.doc_dir_name)
 
+    def _get_documents_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.documents_filename)
+
+    def _get_documents_index_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.documents_index_filename)
+
+    def _get_documents_index_journal_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.documents_index_journal_filename)
+
     def _get_dataset_dump_filename(self, dataset_name):
         return os.path.join(self._get_dataset_base_dir(dataset_name), self.sentences_filename)
 
+    def _get_text_groups_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.text_groups_filename)
+
+    def _get_text_index_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.text_index_filename)
+
+    def _get_segments_manifest_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.segments_manifest_filename)
+
+    def _get_legacy_dataset_dump_filename(self, dataset_name):
+        return os.path.join(self._get_dataset_base_dir(dataset_name), self.legacy_sentences_filename)
+
     def _get_workspace_labels_dump_filename(self, workspace_id, dataset_name):
         workspace_dir = self._get_workspace_labels_dir(workspace_id)
         return os.path.join(workspace_dir, str(dataset_name) + '_' + self.labels_filename)
 
+    def _get_workspace_labels_journal_filename(self, workspace_id, dataset_name):
+        workspace_dir = self._get_workspace_labels_dir(workspace_id)
+        return os.path.join(workspace_dir, str(dataset_name) + '_' + self.labels_journal_filename)
+
     def _get_workspace_labels_dir(self, workspace_id):
         return os.path.join(self.output_dir, 'user_labels', str(workspace_id))
 
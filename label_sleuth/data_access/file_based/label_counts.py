@@ -0,0 +1,121 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from collections import defaultdict
+from typing import Dict, FrozenSet, Set
+
+import numpy as np
+
+from label_sleuth.data_access.core.data_structs import LabelType
+from label_sleuth.data_access.file_based import utils
+
+NUM_LABEL_CODES = utils.LABEL_CODE_WEAK * 2
+ALL_LABEL_TYPES = frozenset(LabelType._member_map_.values())
+# the label type filters for which counts without duplicates are maintained, i.e. all the non-empty sets of label types
+LABEL_TYPE_FILTERS = [frozenset({LabelType.Standard}), frozenset({LabelType.Weak}), ALL_LABEL_TYPES]
+
+
+def _code_matches(code: int, label_types: FrozenSet[LabelType]) -> bool:
+    if not code & utils.LABEL_CODE_LABELED:
+        return False
+    return (LabelType.Weak if code & utils.LABEL_CODE_WEAK else LabelType.Standard) in label_types
+
+
+# label_types -> a boolean mask of the label codes of elements that are labeled with one of these label types
+CODE_MASKS = {label_types: np.array([_code_matches(code, label_types) for code in range(NUM_LABEL_CODES)])
+              for label_types in LABEL_TYPE_FILTERS}
+
+
+class LabelCounts:
+    """
+    The number of elements with each label code (see utils.label_to_code) for a single category, which is updated
+    incrementally as labels change, so that label counts are returned without scanning the label codes of the dataset.
+
+    Counts without duplicates include only the first labeled element (i.e. the one in the lowest row) of each group of
+    elements with the same text_unique_id. As the first labeled element of a group depends on the label types that are
+    counted, these counts are maintained separately for each set of label types. To find the new first labeled element
+    when a label changes, the labeled rows of each text_unique_id are kept as well.
+    """
+
+    def __init__(self, label_codes: np.ndarray, text_unique_ids: np.ndarray):
+        """
+        :param label_codes: the label codes of the category, aligned to the dataset rows
+        :param text_unique_ids: the text_unique_id of each of the dataset rows
+        """
+        labeled_rows = np.flatnonzero(label_codes & utils.LABEL_CODE_LABELED)
+        self.code_counts = np.bincount(label_codes[labeled_rows], minlength=NUM_LABEL_CODES)
+        # text_unique_id -> dict from each labeled row with this text to its label code
+        self.text_group_labeled_rows: Dict[int, Dict[int, int]] = defaultdict(dict)
+        for row, text_unique_id, code in zip(labeled_rows.tolist(), text_unique_ids[labeled_rows].tolist(),
+                                             label_codes[labeled_rows].tolist()):
+            self.text_group_labeled_rows[text_unique_id][row] = code
+        self.unique_code_counts = {}
+        for label_types in LABEL_TYPE_FILTERS:
+            rows = np.flatnonzero(utils.get_labeled_mask(label_codes, label_types))
+            _, first_occurrences = np.unique(text_unique_ids[rows], return_index=True)
+            self.unique_code_counts[label_types] = np.bincount(label_codes[rows[first_occurrences]],
+                                                               minlength=NUM_LABEL_CODES)
+
+    def update(self, row: int, text_unique_id: int, old_code: int, new_code: int):
+        """
+        Update the counts following a change of the label code of *row* from *old_code* to *new_code*
+        """
+        if old_code == new_code:
+            return
+        if old_code & utils.LABEL_CODE_LABELED:
+            self.code_counts[old_code] -= 1
+        if new_code & utils.LABEL_CODE_LABELED:
+            self.code_counts[new_code] += 1
+
+        text_group = self.text_group_labeled_rows[text_unique_id]
+        old_first_codes = [self._get_first_labeled_code(text_group, label_types) for label_types in LABEL_TYPE_FILTERS]
+        if new_code & utils.LABEL_CODE_LABELED:
+            text_group[row] = new_code
+        else:
+            text_group.pop(row, None)
+        for label_types, old_first_code in zip(LABEL_TYPE_FILTERS, old_first_codes):
+            new_first_code = self._get_first_labeled_code(text_group, label_types)
+            if new_first_code != old_first_code:
+                if old_first_code:
+                    self.unique_code_counts[label_types][old_first_code] -= 1
+                if new_first_code:
+                    self.unique_code_counts[label_types][new_first_code] += 1
+        if len(text_group) == 0:
+            del self.text_group_labeled_rows[text_unique_id]
+
+    def get_code_counts(self, label_types: Set[LabelType], remove_duplicates: bool) -> np.ndarray:
+        """
+        :return: the number of elements with each label code, among the elements labeled with one of *label_types*
+        """
+        label_types = frozenset(label_types).intersection(ALL_LABEL_TYPES)
+        if len(label_types) == 0:
+            return np.zeros(NUM_LABEL_CODES, dtype=np.int64)
+        if remove_duplicates:
+            return self.unique_code_counts[label_types].copy()
+        return np.where(CODE_MASKS[label_types], self.code_counts, 0)
+
+    def has_same_counts(self, other: 'LabelCounts') -> bool:
+        return np.array_equal(self.code_counts, other.code_counts) \
+            and all(np.array_equal(self.unique_code_counts[label_types], other.unique_code_counts[label_types])
+                    for label_types in LABEL_TYPE_FILTERS)
+
+    @staticmethod
+    def _get_first_labeled_code(text_group: Dict[int, int], label_types) -> int:
+        """
+        :return: the label code of the lowest row in the group that is labeled with one of *label_types*, or 0 if there
+        is no such row
+        """
+        return min(((row, code) for row, code in text_group.items() if _code_matches(code, label_types)),
+                   default=(None, 0))[1]
@@ -0,0 +1,71 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import threading
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+import numpy as np
+
+
+@dataclass
+class ResultSet:
+    """
+    The result of filtering (and possibly shuffling) the elements of a dataset.
+    rows: positions of the matching dataset rows, in the order in which they are returned to the caller
+    hit_count: the number of matching rows (before the removal of duplicates)
+    hit_count_unique: the number of matching rows after the removal of duplicates, if duplicates were removed
+    """
+    rows: np.ndarray
+    hit_count: int
+    hit_count_unique: Optional[int] = None
+
+
+class ResultSetCache:
+    """
+    A small LRU cache of ResultSets, whose entries also expire after a fixed time. This allows paginating over the
+    results of a query without filtering and shuffling the dataset again for each page.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[ResultSet]:
+        with self.lock:
+            if key not in self.cache:
+                return None
+            creation_time, result_set = self.cache[key]
+            if time.time() - creation_time > self.ttl_seconds:
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return result_set
+
+    def set(self, key: Hashable, result_set: ResultSet):
+        with self.lock:
+            self.cache[key] = (time.time(), result_set)
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
@@ -0,0 +1,189 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import os
+import pickle
+import re
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants  # python >= 3.11
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+TOKEN_PATTERN = re.compile(r'\w+')
+EMPTY_ROWS = np.array([], dtype=np.int64)
+
+
+@dataclass
+class TextIndexBlock:
+    """
+    Postings of the tokens of the dataset rows in the range [start_row, end_row)
+    """
+    start_row: int
+    end_row: int
+    postings: Dict[str, np.ndarray]
+
+
+class TextIndex:
+    """
+    An inverted index from each token in the dataset texts to the (sorted) positions of the rows that contain it. The
+    index is used to narrow down the rows that can match a query, so that the query only needs to be checked against
+    these candidate rows rather than against the whole dataset.
+
+    Texts are tokenized after case folding, so the candidates of a query are a superset of the rows that match it both
+    case sensitively and case insensitively.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, np.ndarray] = {}
+        self.num_rows = 0
+        self._vocabulary = None
+
+    def add_texts(self, texts: List[str]) -> TextIndexBlock:
+        """
+        Index the given texts, as the rows that follow the rows already in the index.
+        :return: the block of postings that was added to the index
+        """
+        token_to_rows = defaultdict(list)
+        for row, text in enumerate(texts, start=self.num_rows):
+            for token in set(TOKEN_PATTERN.findall(text.casefold())):
+                token_to_rows[token].append(row)
+        block = TextIndexBlock(start_row=self.num_rows, end_row=self.num_rows + len(texts),
+                               postings={token: np.array(rows, dtype=np.int64) for token, rows in token_to_rows.items()})
+        self.add_block(block)
+        return block
+
+    def add_block(self, block: TextIndexBlock):
+        if block.start_row != self.num_rows:
+            raise Exception(f"text index block starts at row {block.start_row}, but the index has {self.num_rows} rows")
+        for token, rows in block.postings.items():
+            existing_rows = self.postings.get(token)
+            self.postings[token] = rows if existing_rows is None else np.concatenate([existing_rows, rows])
+        self.num_rows = block.end_row
+        self._vocabulary = None
+
+    def get_candidate_rows(self, query: str, is_regex: bool) -> Optional[np.ndarray]:
+        """
+        Return the sorted positions of the rows that may match the query, or None if the index cannot be used for this
+        query (in which case all rows should be checked).
+        :param query:
+        :param is_regex: if True, the query is a (case sensitive) regular expression; otherwise, it is a case
+        insensitive string
+        """
+        if is_regex:
+            # any match of the regex starts with its literal prefix, if it has one
+            literal = get_regex_literal_prefix(query)
+            if not literal:
+                return None
+            return self._get_substring_candidate_rows(literal)
+        if not query.isascii():
+            # non-ascii case insensitive matching does not necessarily agree with case folding
+            return None
+        return self._get_substring_candidate_rows(query)
+
+    def _get_substring_candidate_rows(self, substring) -> Optional[np.ndarray]:
+        substring = substring.casefold()
+        candidates = None
+        for match in TOKEN_PATTERN.finditer(substring):
+            # a query token that is surrounded by non-word characters must be a full token of the text; a token at the
+            # edge of the query may only be a part of a text token
+            rows = self._get_rows_for_token(match.group(), is_token_start=match.start() > 0,
+                                            is_token_end=match.end() < len(substring))
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+    def _get_rows_for_token(self, token, is_token_start, is_token_end) -> np.ndarray:
+        if is_token_start and is_token_end:
+            return self.postings.get(token, EMPTY_ROWS)
+
+        vocabulary = self._get_vocabulary()
+        if is_token_start:
+            matching_mask = pc.starts_with(vocabulary, pattern=token)
+        elif is_token_end:
+            matching_mask = pc.ends_with(vocabulary, pattern=token)
+        else:
+            matching_mask = pc.match_substring(vocabulary, pattern=token)
+        matching_tokens = vocabulary.filter(matching_mask).to_pylist()
+        if len(matching_tokens) == 0:
+            return EMPTY_ROWS
+        return np.unique(np.concatenate([self.postings[matching_token] for matching_token in matching_tokens]))
+
+    def _get_vocabulary(self) -> pa.Array:
+        if self._vocabulary is None:
+            self._vocabulary = pa.array(list(self.postings.keys()), type=pa.string())
+        return self._vocabulary
+
+
+def get_regex_literal_prefix(pattern) -> Optional[str]:
+    """
+    Return the literal string that every match of the given regular expression starts with, or None if the regular
+    expression has no such prefix, or is case insensitive.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    items = list(parsed)
+    if len(items) > 0 and items[0][0] == sre_constants.AT:
+        items = items[1:]
+    literal_chars = []
+    for op, value in items:
+        if op != sre_constants.LITERAL:
+            break
+        literal_chars.append(chr(value))
+    return ''.join(literal_chars) if len(literal_chars) > 0 else None
+
+
+def append_text_index_block(file_path, block: TextIndexBlock):
+    with open(file_path, 'ab') as f:
+        pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_text_index(file_path) -> TextIndex:
+    """
+    Load the index from a file of consecutive blocks. A partially written last block is ignored and removed.
+    """
+    text_index = TextIndex()
+    valid_file_size = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                break
+            except Exception:
+                logging.warning(f"ignoring a partially written block at the end of {file_path}")
+                break
+            text_index.add_block(block)
+            valid_file_size = f.tell()
+    if valid_file_size < os.path.getsize(file_path):
+        os.truncate(file_path, valid_file_size)
+    return text_index
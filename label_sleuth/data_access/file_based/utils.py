@@ -13,11 +13,17 @@
 #  limitations under the License.
 #
 
+import os
 import re
-from typing import Set
+from dataclasses import dataclass, fields
+from typing import Iterable, Set
 
+import numpy as np
 import pandas as pd
-from label_sleuth.data_access.core.data_structs import TextElement, URI_SEP, LabelType
+import pyarrow as pa
+import ujson as json
+
+from label_sleuth.data_access.core.data_structs import TextElement, URI_SEP, LabelType, Label
 from label_sleuth.data_access.data_access_api import LabeledStatus
 
 
@@ -44,22 +50,137 @@ def filename_to_uri(filename):
     return uri
 
 
+# columns of the on-disk (and in-memory) representation of a dataset. The span of each element is stored as two integer
+# columns, and the metadata dict is stored as a json string that is only decoded when TextElement objects are built
+DATASET_SCHEMA = pa.schema([('uri', pa.string()),
+                            ('text', pa.string()),
+                            ('span_begin', pa.int64()),
+                            ('span_end', pa.int64()),
+                            ('metadata', pa.string()),
+                            ('text_unique_id', pa.int64())])
+
+ARROW_STRING_DTYPE = pd.StringDtype("pyarrow")
+
+
+def text_elements_to_dataframe(text_elements: Iterable[TextElement]) -> pd.DataFrame:
+    text_elements = list(text_elements)
+    df = pd.DataFrame({'uri': pd.array([te.uri for te in text_elements], dtype=ARROW_STRING_DTYPE),
+                       'text': pd.array([te.text for te in text_elements], dtype=ARROW_STRING_DTYPE),
+                       'span_begin': pd.array([te.span[0][0] for te in text_elements], dtype='int64'),
+                       'span_end': pd.array([te.span[0][1] for te in text_elements], dtype='int64'),
+                       'metadata': pd.array([json.dumps(te.metadata) for te in text_elements],
+                                            dtype=ARROW_STRING_DTYPE)})
+    return df
+
+
+def write_dataframe_to_arrow_file(df: pd.DataFrame, file_path):
+    """
+    Write the dataset dataframe to an uncompressed Arrow IPC file, so that it can later be memory-mapped. The file is
+    first written to a temporary path and then moved into place, so that readers never see a partially written file.
+    """
+    table = pa.Table.from_pandas(df[DATASET_SCHEMA.names], schema=DATASET_SCHEMA, preserve_index=False)
+    temp_file_path = file_path + '.tmp'
+    with pa.OSFile(temp_file_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, DATASET_SCHEMA) as writer:
+            writer.write_table(table)
+    os.replace(temp_file_path, file_path)
+
+
+def read_arrow_file_to_dataframe(file_path) -> pd.DataFrame:
+    """
+    Read a dataset Arrow IPC file into a dataframe. The file is memory-mapped, and the string columns of the returned
+    dataframe are backed by the mapped buffers rather than by python objects, so loading is fast and the pages can be
+    shared between processes that read the same dataset.
+    """
+    with pa.memory_map(file_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(types_mapper={pa.string(): ARROW_STRING_DTYPE}.get, split_blocks=True)
+
+
+@dataclass
+class TextGroups:
+    """
+    Grouping of the dataset rows by their text_unique_id, in CSR form.
+    """
+    text_group_indptr: np.ndarray
+    text_group_rows: np.ndarray
+    first_occurrence_mask: np.ndarray
+
+
+def build_text_groups(text_unique_ids: np.ndarray) -> TextGroups:
+    text_group_rows = np.argsort(text_unique_ids, kind='stable')
+    text_group_indptr = np.concatenate([[0], np.cumsum(np.bincount(text_unique_ids))])
+    first_occurrence_mask = np.zeros(len(text_unique_ids), dtype=bool)
+    # text unique ids are consecutive, so every group is non-empty, and its first row is the first occurrence
+    first_occurrence_mask[text_group_rows[text_group_indptr[:-1]]] = True
+    return TextGroups(text_group_indptr, text_group_rows, first_occurrence_mask)
+
+
+def save_text_groups(text_groups: TextGroups, file_path):
+    with open(file_path + '.tmp', 'wb') as f:
+        np.savez(f, **{field.name: getattr(text_groups, field.name) for field in fields(TextGroups)})
+    os.replace(file_path + '.tmp', file_path)
+
+
+def load_text_groups(file_path) -> TextGroups:
+    with np.load(file_path) as arrays:
+        return TextGroups(**{field.name: arrays[field.name] for field in fields(TextGroups)})
+
+
+def decode_metadata(metadata_str):
+    return {} if metadata_str == '{}' else json.loads(metadata_str)
+
+
 def build_text_elements_from_dataframe_and_labels(df, labels_dict):
     # text element fields are extracted from the dataframe, with the exception of the labels, which are stored elsewhere
-    element_data_columns = list(TextElement.get_field_names() - {'category_to_label'})
-    element_dicts = map(lambda row: dict(zip(element_data_columns, row)), df[element_data_columns].values)
-    text_elements = [TextElement(**d, category_to_label=labels_dict.get(d['uri'], {}).copy())
-                     for d in element_dicts]
+    rows = zip(df['uri'].tolist(), df['text'].tolist(), df['span_begin'].tolist(), df['span_end'].tolist(),
+               df['metadata'].tolist())
+    text_elements = [TextElement(uri=uri, text=text, span=[(span_begin, span_end)],
+                                 metadata=decode_metadata(metadata),
+                                 category_to_label=labels_dict.get(uri, {}).copy())
+                     for uri, text, span_begin, span_end, metadata in rows]
 
     return text_elements
 
 
-def filter_by_labeled_status(df: pd.DataFrame, labels_series: pd.Series, category_id: int, labeled_status: LabeledStatus,
+# bits of the label codes array, which holds the label status of each dataset element for a specific category
+LABEL_CODE_LABELED = 1
+LABEL_CODE_POSITIVE = 2
+LABEL_CODE_WEAK = 4
+LABEL_CODE_DTYPE = np.int8
+
+
+def label_to_code(label: Label) -> int:
+    return LABEL_CODE_LABELED | (LABEL_CODE_POSITIVE if label.label else 0) \
+           | (LABEL_CODE_WEAK if label.label_type == LabelType.Weak else 0)
+
+
+def code_to_label(code: int) -> Label:
+    return Label(label=bool(code & LABEL_CODE_POSITIVE),
+                 label_type=LabelType.Weak if code & LABEL_CODE_WEAK else LabelType.Standard)
+
+
+def get_labeled_mask(label_codes: np.ndarray, label_types: Set[LabelType] = None) -> np.ndarray:
+    """
+    :param label_codes: array of label codes for a category, aligned to the dataset rows
+    :param label_types: if provided, only elements whose label is of one of these types are considered labeled
+    :return: a boolean mask of the labeled elements
+    """
+    mask = (label_codes & LABEL_CODE_LABELED) != 0
+    if label_types is not None:
+        if LabelType.Standard not in label_types:
+            mask &= (label_codes & LABEL_CODE_WEAK) != 0
+        if LabelType.Weak not in label_types:
+            mask &= (label_codes & LABEL_CODE_WEAK) == 0
+    return mask
+
+
+def filter_by_labeled_status(df: pd.DataFrame, label_codes: np.ndarray, labeled_status: LabeledStatus,
                              label_types: Set[LabelType] = None):
     """
     :param df:
-    :param labels_series: series of the label dictionary corresponding to each element in the dataframe
-    :param category_id:
+    :param label_codes: array of the label codes (for the relevant category) corresponding to each element in the
+    dataframe
     :param labeled_status: unlabeled, labeled or all
     :param label_types: set of applicable label types if filtering for labeled elements (LabelStatus.LABELED)
     :return:
@@ -71,34 +192,47 @@ def filter_by_labeled_status(df: pd.DataFrame, labels_series: pd.Series, categor
         raise Exception(f"label_types must be provided when filtering labeled elements")
 
     if labeled_status == LabeledStatus.UNLABELED:
-        return df[labels_series.apply(lambda x: category_id not in x)]
+        return df[~get_labeled_mask(label_codes)]
     elif labeled_status == LabeledStatus.LABELED:
-        return df[labels_series.apply(lambda x: category_id in x and x[category_id].label_type in label_types)]
+        return df[get_labeled_mask(label_codes, label_types)]
 
     return df
 
 
-def filter_by_query_and_document_uri(df: pd.DataFrame, query, is_regex: bool = False, document_id=None):
+def filter_by_query_and_document_uri(df: pd.DataFrame, query, is_regex: bool = False, document_id=None,
+                                     candidate_rows: np.ndarray = None):
+    """
+    :param df:
+    :param query: query to use for filtering text elements
+    :param is_regex: whether to process the query as regular expression
+    :param document_id: if provided, only keep the text elements of this document
+    :param candidate_rows: if provided, the positions of the only dataset rows that may match the query. Note that this
+    relies on the index of the dataframe being the positions of the rows in the dataset
+    :return:
+    """
     if document_id is not None:
         df = df[df.uri.str.startswith(f"{document_id}-")]
     if query:
+        if candidate_rows is not None:
+            df = df[df.index.isin(candidate_rows)]
         # case=is_regex: we want the query to be case sensitive if we are matching using a regex and case insensitive otherwise
         df = df[df.text.str.contains(query, case=is_regex, na=False, regex=is_regex)]
     return df
 
 
-def filter_by_query_and_label_status(df: pd.DataFrame, labels_series: pd.Series, category_id: int,
-                                     labeled_status: LabeledStatus, query: str, is_regex: bool = False,
-                                     label_types: Set[LabelType] = None):
+def filter_by_query_and_label_status(df: pd.DataFrame, label_codes: np.ndarray, labeled_status: LabeledStatus,
+                                     query: str, is_regex: bool = False, label_types: Set[LabelType] = None,
+                                     candidate_rows: np.ndarray = None):
     """
     :param df:
-    :param labels_series: series of the label dictionary corresponding to each element in the dataframe
-    :param category_id:
+    :param label_codes: array of the label codes (for the relevant category) corresponding to each element in the
+    dataframe
     :param labeled_status: unlabeled, labeled or all
     :param query: query to use for filtering text elements
     :param is_regex: whether to process the query as regular expression
     :param label_types: set of applicable label types if filtering for labeled elements (LabelStatus.LABELED)
+    :param candidate_rows: if provided, the positions of the only dataset rows that may match the query
     :return:
     """
-    df = filter_by_labeled_status(df, labels_series, category_id, labeled_status, label_types=label_types)
-    return filter_by_query_and_document_uri(df, query, is_regex)
+    df = filter_by_labeled_status(df, label_codes, labeled_status, label_types=label_types)
+    return filter_by_query_and_document_uri(df, query, is_regex, candidate_rows=candidate_rows)
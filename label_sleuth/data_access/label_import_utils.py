@@ -14,27 +14,22 @@
 #
 
 import logging
-import re
 import string
-import sys
-from typing import Dict, Iterable, Sequence, List, Union
+from typing import Dict, Sequence, List, Union
 import pandas as pd
-from label_sleuth.data_access.core.data_structs import DisplayFields, LABEL_POSITIVE, Label, TextElement, LabelType, \
+from label_sleuth.data_access.core.data_structs import DisplayFields, LABEL_POSITIVE, Label, LabelType, \
     URI_SEP
 
-def get_element_group_by_texts(texts: Sequence[str], workspace_id, dataset_name, data_access, remove_duplicates) \
-        -> Iterable[TextElement]:
+def get_elements_df_by_texts(texts: Sequence[str], dataset_name, data_access) -> pd.DataFrame:
     """
     The user may import a large number of labeled instances, and these will not necessarily be given with a text
-    element uri. Thus, the goal here is to efficiently query for a group of text elements using only the texts, and
-    optionally a *doc_uri* that the texts belong to.
-    The order of the returned elements DOES NOT match the order of the texts given as input.
+    element uri. Thus, the goal here is to efficiently find the group of text elements with the given texts, so that
+    they can be joined with the imported labels using the texts, and optionally a *doc_id* that the texts belong to.
+    :return: a DataFrame with the text, doc_id and uri of each of the matching text elements
     """
-    regex = '|'.join(f'^{re.escape(t)}$' for t in texts)
-    elements = data_access.get_text_elements(workspace_id=workspace_id, dataset_name=dataset_name,
-                                             sample_size=sys.maxsize, query=regex, is_regex=True,
-                                             document_uri=None, remove_duplicates=remove_duplicates)
-    return elements['results']
+    elements_df = data_access.get_uris_by_texts(dataset_name, texts)
+    elements_df[DisplayFields.doc_id] = elements_df[DisplayFields.uri].str.split(URI_SEP).str[1]
+    return elements_df[[DisplayFields.text, DisplayFields.doc_id, DisplayFields.uri]]
 
 
 def merge_and_rename_dfs(a: pd.DataFrame, b: pd.DataFrame, on: Union[str, List[str]]):
@@ -63,19 +58,9 @@ def process_labels_dataframe(workspace_id, dataset_name, data_access, labels_df_
     if DisplayFields.label_type not in labels_df_to_import.columns:
         labels_df_to_import[DisplayFields.label_type] = LabelType.Standard.name
 
-    # calling get_element_group_by_texts is the most expensive call on this function and,
-    # removing duplicates from the texts iterable reduces significantly its runtime
+    # the texts are looked up in the dataset all at once, and then joined with the imported labels (see below)
     texts = labels_df_to_import[DisplayFields.text].unique()
-
-    elements = get_element_group_by_texts(texts, workspace_id, dataset_name, data_access, remove_duplicates=False)   
-        
-
-    # convert Element list into a DataFrame in order to perform the join operation
-    query_elements_df = pd.DataFrame(
-            [[e.text, e.uri.split('-')[1], e.uri] for e in elements],
-            columns=[DisplayFields.text, DisplayFields.doc_id, DisplayFields.uri]
-        )
-
+    query_elements_df = get_elements_df_by_texts(texts, dataset_name, data_access)
 
     def has_contradicting_labels(df: pd.DataFrame):
         return df[DisplayFields.label].unique().shape[0] > 1
@@ -104,12 +89,14 @@ def process_labels_dataframe(workspace_id, dataset_name, data_access, labels_df_
                 query_elements_df, 
                 [DisplayFields.doc_id, DisplayFields.text]
             )
+    # if the same element is given more than one label for a category, a positive label and a weak label take precedence
+    df = df.sort_values([DisplayFields.category_name, DisplayFields.uri, DisplayFields.label, DisplayFields.label_type])
+    df = df.drop_duplicates(subset=[DisplayFields.category_name, DisplayFields.uri], keep='last')
     category_to_uri_to_label = {}
-    for category_name, category_df in df.groupby(DisplayFields.category_name):
-        uri_to_label = {}
-        for uri, uri_df in category_df.groupby(DisplayFields.uri):
-            for (label, label_type), _ in uri_df.groupby([DisplayFields.label, DisplayFields.label_type]):
-                uri_to_label[uri] = {category_name: Label(label=bool(label), label_type=LabelType[label_type])}
-        category_to_uri_to_label[category_name] = uri_to_label
+    for category_name, uri, label, label_type in zip(df[DisplayFields.category_name].tolist(),
+                                                     df[DisplayFields.uri].tolist(), df[DisplayFields.label].tolist(),
+                                                     df[DisplayFields.label_type].tolist()):
+        category_to_uri_to_label.setdefault(category_name, {})[uri] = \
+            {category_name: Label(label=bool(label), label_type=LabelType[label_type])}
 
     return category_to_uri_to_label, contracticting_labels_info
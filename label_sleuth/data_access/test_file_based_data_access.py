@@ -13,12 +13,17 @@
 #  limitations under the License.
 #
 
+import os
 import random
 import unittest
 from collections import Counter
 from typing import List
 import tempfile
-from label_sleuth.data_access.core.data_structs import Document, TextElement, Label
+
+import jsonpickle
+import pandas as pd
+
+from label_sleuth.data_access.core.data_structs import Document, TextElement, Label, LabelType
 from label_sleuth.data_access.file_based.utils import URI_SEP
 
 from label_sleuth.data_access.file_based.file_based_data_access import FileBasedDataAccess
@@ -131,6 +136,56 @@ class TestFileBasedDataAccess(unittest.TestCase):
         self.assertSetEqual(set(docs_uris_expected), set(docs_uris_in_memory))
         self.data_access.delete_dataset(dataset_name)
 
+    def test_documents_index_journal(self):
+        dataset_name = self.test_documents_index_journal.__name__ + '_dump'
+        docs = generate_corpus(self.data_access, dataset_name, 2)
+        index_path = self.data_access._get_documents_index_filename(dataset_name)
+        index_mtime = os.path.getmtime(index_path)
+        # documents are added in reverse order of their names; their index entries are appended to the journal
+        for doc_id in [11, 10, 3, 2]:
+            doc = generate_simple_doc(dataset_name, doc_id)
+            self.data_access.add_documents(dataset_name, [doc])
+            docs.append(doc)
+        self.assertEqual(index_mtime, os.path.getmtime(index_path))
+        expected_uris = [doc.uri for doc in sorted(docs, key=lambda d: int(d.uri.split(URI_SEP)[-1]))]
+        self.assertListEqual(expected_uris, self.data_access.get_all_document_uris(dataset_name))
+
+        # the index is loaded from the snapshot and the journal
+        del self.data_access.documents_index_in_memory[dataset_name]
+        del self.data_access.sorted_document_uris[dataset_name]
+        self.assertListEqual(expected_uris, self.data_access.get_all_document_uris(dataset_name))
+        self.assertListEqual([docs[2], docs[-1]],
+                             self.data_access.get_documents(None, dataset_name, [docs[2].uri, docs[-1].uri]))
+
+        # once the journal is too long, it is compacted into a new snapshot
+        self.data_access.max_documents_index_journal_records = 4
+        doc = generate_simple_doc(dataset_name, 12)
+        self.data_access.add_documents(dataset_name, [doc])
+        del self.data_access.max_documents_index_journal_records
+        self.assertEqual(0, os.path.getsize(self.data_access._get_documents_index_journal_filename(dataset_name)))
+        del self.data_access.documents_index_in_memory[dataset_name]
+        self.assertListEqual(expected_uris + [doc.uri], self.data_access.get_all_document_uris(dataset_name))
+        self.data_access.delete_dataset(dataset_name)
+
+    def test_migrate_documents_dump_dir(self):
+        dataset_name = self.test_migrate_documents_dump_dir.__name__ + '_dump'
+        docs = generate_corpus(self.data_access, dataset_name, 12)
+        # write the documents in the format used by older versions, i.e. a jsonpickle file per document
+        doc_dump_dir = self.data_access._get_documents_dump_dir(dataset_name)
+        os.makedirs(doc_dump_dir)
+        for doc in docs:
+            with open(os.path.join(doc_dump_dir, doc.uri + '.json'), 'w') as f:
+                f.write(jsonpickle.encode(doc))
+        os.remove(self.data_access._get_documents_filename(dataset_name))
+        os.remove(self.data_access._get_documents_index_filename(dataset_name))
+        del self.data_access.documents_index_in_memory[dataset_name]
+
+        self.assertListEqual([doc.uri for doc in docs], self.data_access.get_all_document_uris(dataset_name))
+        self.assertListEqual([docs[10], docs[2]],
+                             self.data_access.get_documents(None, dataset_name, [docs[10].uri, docs[2].uri]))
+        self.assertFalse(os.path.exists(doc_dump_dir))
+        self.data_access.delete_dataset(dataset_name)
+
     def test_get_all_text_elements_uris(self):
         dataset_name = self.test_get_all_text_elements_uris.__name__ + '_dump'
         docs = generate_corpus(self.data_access, dataset_name, random.randint(1, 10))
@@ -155,6 +210,64 @@ class TestFileBasedDataAccess(unittest.TestCase):
         self.assertListEqual(text_elements_expected, text_elements_found)
         self.data_access.delete_dataset(dataset_name)
 
+    def test_migrate_legacy_csv_dataset(self):
+        dataset_name = self.test_migrate_legacy_csv_dataset.__name__ + '_dump'
+        docs = generate_corpus(self.data_access, dataset_name, 2)
+        text_elements_expected = [text for doc in docs for text in doc.text_elements]
+        text_elements_expected[0].metadata = {'source': 'csv', 'page': 3}
+        # write the dataset in the format used by older versions, i.e. a csv with span and metadata reprs
+        legacy_df = pd.DataFrame([{'uri': te.uri, 'text': te.text, 'span': te.span, 'metadata': te.metadata}
+                                  for te in text_elements_expected])
+        legacy_df.to_csv(self.data_access._get_legacy_dataset_dump_filename(dataset_name), index=False)
+        os.remove(self.data_access._get_dataset_dump_filename(dataset_name))
+        del self.data_access.ds_in_memory[dataset_name]
+
+        self.assertListEqual(text_elements_expected, self.data_access.get_all_text_elements(dataset_name))
+        self.assertTrue(os.path.isfile(self.data_access._get_dataset_dump_filename(dataset_name)))
+        self.assertFalse(os.path.isfile(self.data_access._get_legacy_dataset_dump_filename(dataset_name)))
+        self.data_access.delete_dataset(dataset_name)
+
+    def test_get_duplicate_text_mask(self):
+        dataset_name = self.test_get_duplicate_text_mask.__name__ + '_dump'
+        docs = generate_corpus(self.data_access, dataset_name, 3, add_duplicate=True)
+        texts = [element.text for doc in docs for element in doc.text_elements]
+        self.assertListEqual(pd.Series(texts).duplicated().tolist(),
+                             self.data_access.get_duplicate_text_mask(dataset_name).tolist())
+        self.data_access.delete_dataset(dataset_name)
+
+    def test_add_documents_to_existing_dataset_in_segments(self):
+        dataset_name = self.test_add_documents_to_existing_dataset_in_segments.__name__ + '_dump'
+        docs = generate_corpus(self.data_access, dataset_name, 2, add_duplicate=True)
+        for doc_id in range(2, 5):
+            # documents with the same doc_id suffix contain duplicate texts of the previous documents
+            doc = generate_simple_doc(dataset_name, doc_id, add_duplicate=True)
+            doc.uri += '_new'
+            for element in doc.text_elements:
+                element.uri = element.uri.replace(f'{URI_SEP}{doc_id}{URI_SEP}', f'{URI_SEP}{doc_id}_new{URI_SEP}')
+                element.text = element.text.replace(str(doc_id), str(doc_id - 2))
+            self.data_access.add_documents(dataset_name, [doc])
+            docs.append(doc)
+        text_elements_expected = [text for doc in docs for text in doc.text_elements]
+        self.assertEqual(4, len(self.data_access._get_segment_filenames(dataset_name)))
+
+        def assert_dataset_as_expected():
+            df = self.data_access._get_ds_in_memory(dataset_name)
+            self.assertListEqual(text_elements_expected, self.data_access.get_all_text_elements(dataset_name))
+            self.assertListEqual(list(pd.factorize(df['text'])[0]), df['text_unique_id'].tolist())
+            uris = [element.uri for element in text_elements_expected[::-1]]
+            self.assertListEqual(text_elements_expected[::-1],
+                                 self.data_access.get_text_elements_by_uris('test_segments', dataset_name, uris))
+
+        assert_dataset_as_expected()
+        del self.data_access.ds_in_memory[dataset_name]
+        assert_dataset_as_expected()
+
+        self.data_access._compact_segments(dataset_name)
+        self.assertEqual(1, len(self.data_access._get_segment_filenames(dataset_name)))
+        del self.data_access.ds_in_memory[dataset_name]
+        assert_dataset_as_expected()
+        self.data_access.delete_dataset(dataset_name)
+
     # def test_get_text_elements(self):
     #     dataset_name = self.test_sample_text_elements.__name__ + '_dump'
     #     sample_size = 5
@@ -201,6 +314,30 @@ class TestFileBasedDataAccess(unittest.TestCase):
         sample_and_check_that_labels_match(selected_doc, texts_and_labels_dict)
         self.data_access.delete_dataset(dataset_name)
 
+    def test_query_text_elements_with_text_search_index(self):
+        dataset_name = self.test_query_text_elements_with_text_search_index.__name__ + '_dump'
+        indexed_data_access = FileBasedDataAccess(self.data_temp_dir.name, use_text_search_index=True)
+        generate_corpus(indexed_data_access, dataset_name, 3)
+        doc = generate_simple_doc(dataset_name, 3)
+        doc.text_elements[0].text = 'Straße, e-mail: some_one@EXAMPLE.com (x2)'
+        indexed_data_access.add_documents(dataset_name, [doc])
+        self.assertEqual(len(indexed_data_access.get_all_text_elements_uris(dataset_name)),
+                         indexed_data_access._get_text_index(dataset_name).num_rows)
+
+        queries = ['sentence', 'SENTENCE IS', 'entence i', 'ence', 'is n', ' one ', 'view for the future! 2',
+                   'e-mail', 'l: some_one@ex', 'x2)', '!', 'straße', 'strasse', 'nothing like this']
+        regex_queries = ['^Document', 'sentence.*not', 'The se[c]ond', '(?i)the second', 'bit|sentence', r'\d', '^$']
+        for query, is_regex in [(query, False) for query in queries] + [(query, True) for query in regex_queries]:
+            expected = self.data_access.get_text_elements('test_text_index', dataset_name, query=query,
+                                                          is_regex=is_regex)
+            del indexed_data_access.text_index_in_memory[dataset_name]  # also test loading the index from disk
+            indexed_data_access.result_sets_cache.clear()
+            found = indexed_data_access.get_text_elements('test_text_index', dataset_name, query=query,
+                                                          is_regex=is_regex)
+            self.assertEqual(expected['hit_count'], found['hit_count'], f'hit count for query {query}')
+            self.assertListEqual(expected['results'], found['results'], f'results for query {query}')
+        self.data_access.delete_dataset(dataset_name)
+
     def test_get_unlabeled_text_elements(self):
         workspace_id = 'test_sample_unlabeled_text_elements'
         dataset_name = self.test_get_unlabeled_text_elements.__name__ + '_dump'
@@ -316,6 +453,62 @@ class TestFileBasedDataAccess(unittest.TestCase):
         #     self.assertIn(query, sampled_text.text)
         # self.data_access.delete_dataset(dataset_name)
 
+    def test_pages_of_cached_result_sets(self):
+        workspace_id = 'test_pages_of_cached_result_sets'
+        dataset_name = self.test_pages_of_cached_result_sets.__name__ + '_dump'
+        category_id = 0
+        sample_all = 10 ** 100  # a huge sample_size to sample all elements
+        docs = generate_corpus(self.data_access, dataset_name, 5, add_duplicate=True)
+
+        all_res = self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id, sample_all,
+                                                               remove_duplicates=True, random_state=3)
+        self.assertEqual(25, all_res['hit_count'])
+        self.assertEqual(20, all_res['hit_count_unique'])
+        # each page is a slice of the full results, and matches the results of sampling with the same random state
+        for page_start in range(0, 20, 6):
+            page_res = self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id, 6,
+                                                                    sample_start_idx=page_start,
+                                                                    remove_duplicates=True, random_state=3)
+            self.assertListEqual(all_res['results'][page_start:page_start + 6], page_res['results'])
+        self.data_access.result_sets_cache.clear()
+        # results without a random state are not reproducible, so they are not cached
+        self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id, 6,
+                                                     remove_duplicates=True, random_state=None)
+        self.assertEqual(0, len(self.data_access.result_sets_cache.cache))
+        page_res = self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id, 6,
+                                                                sample_start_idx=6, remove_duplicates=True,
+                                                                random_state=3)
+        self.assertListEqual(all_res['results'][6:12], page_res['results'])
+
+        # labeling elements invalidates the cached results
+        labeled_uri = all_res['results'][0].uri
+        self.data_access.set_labels(workspace_id, {labeled_uri: {category_id: Label(label=LABEL_POSITIVE)}})
+        all_res = self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id, sample_all,
+                                                               remove_duplicates=True, random_state=3)
+        self.assertEqual(24, all_res['hit_count'])
+        self.assertNotIn(labeled_uri, [element.uri for element in all_res['results']])
+
+        # adding documents invalidates the cached results
+        self.data_access.add_documents(dataset_name, [generate_simple_doc(dataset_name, len(docs))])
+        all_res = self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id, sample_all,
+                                                               remove_duplicates=True, random_state=3)
+        self.assertEqual(28, all_res['hit_count'])
+
+        self.data_access.delete_all_labels(workspace_id, dataset_name)
+        self.data_access.delete_dataset(dataset_name)
+
+    def test_get_uris_by_texts(self):
+        dataset_name = self.test_get_uris_by_texts.__name__ + '_dump'
+        docs = generate_corpus(self.data_access, dataset_name, 3, add_duplicate=True)
+        texts = [docs[1].text_elements[0].text, docs[2].text_elements[2].text, 'not in the dataset',
+                 docs[2].text_elements[2].text]
+        uris_df = self.data_access.get_uris_by_texts(dataset_name, texts)
+        self.assertListEqual([(docs[1].text_elements[0].text, docs[1].text_elements[0].uri),
+                              (docs[1].text_elements[0].text, docs[1].text_elements[4].uri),
+                              (docs[2].text_elements[2].text, docs[2].text_elements[2].uri)],
+                             list(uris_df[['text', 'uri']].itertuples(index=False, name=None)))
+        self.data_access.delete_dataset(dataset_name)
+
     def test_multithread_async_set_labels(self):
         import threading
         num_docs = 100
@@ -380,6 +573,122 @@ class TestFileBasedDataAccess(unittest.TestCase):
             self.assertEqual(expected_count, observed_count, f'count for {label_val} does not match.')
         self.data_access.delete_dataset(dataset_name)
 
+    def test_get_label_counts_and_labeled_elements_by_label_type(self):
+        workspace_id = 'test_get_label_counts_by_label_type'
+        dataset_name = self.test_get_label_counts_and_labeled_elements_by_label_type.__name__ + '_dump'
+        category_id = 0
+        doc = generate_corpus(self.data_access, dataset_name, 1)[0]
+        uris = [element.uri for element in doc.text_elements]
+        # build the label index before setting labels, so that it is updated incrementally
+        self.assertEqual(0, sum(self.data_access.get_label_counts(workspace_id, dataset_name, category_id).values()))
+        weak_negative = Label(LABEL_NEGATIVE, label_type=LabelType.Weak)
+        self.data_access.set_labels(workspace_id, {uris[0]: {category_id: Label(LABEL_POSITIVE)},
+                                                   uris[1]: {category_id: Label(LABEL_NEGATIVE)},
+                                                   uris[2]: {category_id: weak_negative, 1: Label(LABEL_POSITIVE)}})
+        self.assertDictEqual({'true': 1, 'false': 1, 'weak_false': 1},
+                             dict(self.data_access.get_label_counts(workspace_id, dataset_name, category_id)))
+        self.assertDictEqual({True: 1, False: 1},
+                             dict(self.data_access.get_label_counts(workspace_id, dataset_name, category_id,
+                                                                    label_types={LabelType.Standard},
+                                                                    fine_grained_counts=False)))
+        weak_labeled = self.data_access.get_labeled_text_elements(workspace_id, dataset_name, category_id,
+                                                                  label_types={LabelType.Weak})['results']
+        self.assertListEqual([uris[2]], [element.uri for element in weak_labeled])
+        unlabeled = self.data_access.get_unlabeled_text_elements(workspace_id, dataset_name, category_id)['results']
+        self.assertSetEqual(set(uris[3:]), {element.uri for element in unlabeled})
+
+        self.data_access.unset_labels(workspace_id, category_id, [uris[0]])
+        self.assertDictEqual({'false': 1, 'weak_false': 1},
+                             dict(self.data_access.get_label_counts(workspace_id, dataset_name, category_id)))
+        self.assertDictEqual({'true': 1}, dict(self.data_access.get_label_counts(workspace_id, dataset_name, 1)))
+        self.data_access.delete_all_labels(workspace_id, dataset_name)
+        self.data_access.delete_dataset(dataset_name)
+
+    def test_incremental_label_counts_with_duplicates(self):
+        workspace_id = 'test_incremental_label_counts'
+        dataset_name = self.test_incremental_label_counts_with_duplicates.__name__ + '_dump'
+        category_id = 0
+        docs = generate_corpus(self.data_access, dataset_name, 2, add_duplicate=True)
+        uris = [element.uri for doc in docs for element in doc.text_elements]
+        # the first and last elements of each document have the same text
+        first_text_uris = [docs[0].text_elements[0].uri, docs[0].text_elements[-1].uri]
+        self.assertEqual(0, sum(self.data_access.get_label_counts(workspace_id, dataset_name, category_id).values()))
+
+        self.data_access.set_labels(workspace_id, {first_text_uris[1]: {category_id: Label(LABEL_NEGATIVE)}})
+        self.data_access.set_labels(workspace_id, {first_text_uris[0]: {category_id: Label(LABEL_POSITIVE)}})
+        self.assertDictEqual({'true': 1, 'false': 1},
+                             dict(self.data_access.get_label_counts(workspace_id, dataset_name, category_id)))
+        # only the first labeled element out of the elements with the same text is counted
+        self.assertDictEqual({'true': 1}, dict(self.data_access.get_label_counts(workspace_id, dataset_name,
+                                                                                 category_id, remove_duplicates=True)))
+        self.data_access.unset_labels(workspace_id, category_id, [first_text_uris[0]])
+        self.assertDictEqual({'false': 1}, dict(self.data_access.get_label_counts(
+            workspace_id, dataset_name, category_id, remove_duplicates=True)))
+
+        random.seed(0)
+        for _ in range(100):
+            uri = random.choice(uris)
+            if random.random() < 0.3:
+                if uri in self.data_access._get_labels(workspace_id, dataset_name) \
+                        and category_id in self.data_access._get_labels(workspace_id, dataset_name)[uri]:
+                    self.data_access.unset_labels(workspace_id, category_id, [uri],
+                                                  apply_to_duplicate_texts=random.random() < 0.5)
+            else:
+                label = Label(random.choice([LABEL_POSITIVE, LABEL_NEGATIVE]),
+                              label_type=random.choice([LabelType.Standard, LabelType.Weak]))
+                self.data_access.set_labels(workspace_id, {uri: {category_id: label}},
+                                            apply_to_duplicate_texts=random.random() < 0.5)
+            counts = self.data_access.get_label_counts(workspace_id, dataset_name, category_id,
+                                                       remove_duplicates=True, label_types={LabelType.Weak})
+            self.assertTrue(self.data_access.check_label_counts(workspace_id, dataset_name))
+            self.assertEqual(counts, self.data_access.get_label_counts(workspace_id, dataset_name, category_id,
+                                                                       remove_duplicates=True,
+                                                                       label_types={LabelType.Weak}))
+
+        # counts that are inconsistent with the labels are rebuilt
+        label_counts = self.data_access.label_counts_in_memory[(workspace_id, dataset_name)][category_id]
+        expected_counts = self.data_access.get_label_counts(workspace_id, dataset_name, category_id)
+        label_counts.code_counts[1] += 1
+        self.assertFalse(self.data_access.check_label_counts(workspace_id, dataset_name))
+        self.assertEqual(expected_counts, self.data_access.get_label_counts(workspace_id, dataset_name, category_id))
+        self.data_access.delete_all_labels(workspace_id, dataset_name)
+        self.data_access.delete_dataset(dataset_name)
+
+    def test_labels_journal_replay_and_compaction(self):
+        workspace_id = 'test_labels_journal'
+        dataset_name = self.test_labels_journal_replay_and_compaction.__name__ + '_dump'
+        category_id = 0
+        doc = generate_corpus(self.data_access, dataset_name, 1)[0]
+        uris = [element.uri for element in doc.text_elements]
+        self.data_access.set_labels(workspace_id, {uri: {category_id: Label(LABEL_POSITIVE)} for uri in uris})
+        self.data_access.unset_labels(workspace_id, category_id, uris[:1])
+        self.data_access.set_labels(workspace_id, {uris[1]: {category_id: Label(LABEL_NEGATIVE)}})
+        expected_labels = {uri: dict(category_to_label) for uri, category_to_label
+                           in self.data_access._get_labels(workspace_id, dataset_name).items()}
+
+        def reload_labels():
+            del self.data_access.labels_in_memory[workspace_id][dataset_name]
+            self.data_access.label_codes_in_memory.pop((workspace_id, dataset_name), None)
+            return {uri: dict(category_to_label) for uri, category_to_label
+                    in self.data_access._get_labels(workspace_id, dataset_name).items()}
+
+        # a record that was only partially written is ignored
+        with open(self.data_access._get_workspace_labels_journal_filename(workspace_id, dataset_name), 'a') as f:
+            f.write('{"timestamp": 0, "op": "unset", "uri": "')
+        self.assertDictEqual(expected_labels, reload_labels())
+        self.assertDictEqual({'true': 2, 'false': 1},
+                             dict(self.data_access.get_label_counts(workspace_id, dataset_name, category_id)))
+        self.data_access.unset_labels(workspace_id, category_id, uris[3:])
+        expected_labels.pop(uris[3])
+        self.assertDictEqual(expected_labels, reload_labels())
+
+        self.data_access._save_labels_data(dataset_name, workspace_id)
+        self.assertEqual(0, os.path.getsize(
+            self.data_access._get_workspace_labels_journal_filename(workspace_id, dataset_name)))
+        self.assertDictEqual(expected_labels, reload_labels())
+        self.data_access.delete_all_labels(workspace_id, dataset_name)
+        self.data_access.delete_dataset(dataset_name)
+
     def test_get_text_elements_by_id(self):
         workspace_id = "test_get_text_elements_by_id"
         dataset_name = self.test_get_text_elements_by_id.__name__ + '_dump'
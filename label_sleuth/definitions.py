@@ -13,15 +13,19 @@
 #  limitations under the License.
 #
 
+import os
+
 import torch
 
-INFER_CACHE_SIZE = 10000000
+INFER_CACHE_SIZE_BYTES = 2 * 1024 ** 3  # memory limit for the in-memory predictions cache of each model class
+LOADED_MODELS_CACHE_SIZE = 10  # number of loaded models kept in memory by each model class
 ACTIVE_LEARNING_SUGGESTION_COUNT = 1000
 CPU_WORKERS = 10  # TODO use number of cores?
 MPS_GPU_AVAILABLE = hasattr(torch.backends, "mps") and torch.backends.mps.is_available()  # relevant for mac machines
 # with GPU devices (e.g., Apple M1 chip). Check if mps exists in torch for backward compatibility
 GPU_AVAILABLE = torch.cuda.is_available() or MPS_GPU_AVAILABLE
 GPU_WORKERS = 1  # Currently only one GPU is supported
+PROCESS_WORKERS = max(1, min(CPU_WORKERS, (os.cpu_count() or 1) // 2))  # used with the "process" jobs backend
 
 
 
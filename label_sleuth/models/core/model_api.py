@@ -14,6 +14,7 @@
 #
 
 import abc
+import ast
 import logging
 import os
 import shutil
@@ -24,20 +25,35 @@ import tempfile
 from collections import defaultdict
 from concurrent.futures import Future
 from enum import Enum
-from typing import Mapping, Sequence, Tuple, Set
+from typing import Callable, Iterable, Mapping, Sequence, Tuple, Set
 
 import jsonpickle
+import xxhash
 
 import label_sleuth.definitions as definitions
 from label_sleuth.models.core.languages import Languages, Language
 from label_sleuth.models.core.prediction import Prediction
-from label_sleuth.models.util.disk_cache import load_model_prediction_store_from_disk, \
-    save_model_prediction_store_to_disk
+from label_sleuth.models.core.process_jobs import get_job_predictions_dir, infer_in_worker, train_in_worker, \
+    write_items
+from label_sleuth.models.util.disk_cache import load_model_prediction_store_from_disk
 from label_sleuth.models.util.LRUCache import LRUCache
+from label_sleuth.models.util.prediction_cache import PredictionCache, PredictionCacheStats
+from label_sleuth.models.util.prediction_store import PredictionStore
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+from label_sleuth.orchestrator.job_scheduler import JobPriority
 
 PREDICTIONS_STORE_DIR_NAME = "predictions"
 LANGUAGE_STR_KEY = "Language"
+PREDICTION_STORES_CACHE_SIZE = 10
+WORKER_PROCESS_INFER_MIN_ITEMS = 1000  # smaller inference calls are not worth the overhead of a worker process
+INFER_CHUNK_SIZE = 10000  # number of texts in each chunk of inference over a full dataset
+
+
+def split_into_chunks(texts: Sequence[str], chunk_size=INFER_CHUNK_SIZE) -> Iterable[Sequence[str]]:
+    """
+    Split a list of texts into chunks for infer_by_id_in_chunks()
+    """
+    return (texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size))
 
 
 class ModelStatus(Enum):
@@ -52,7 +68,13 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
     Base class for implementing a classification model.
     This base class provides general methods for training in the background, caching model predictions etc.,
     while the _train(), load_model() and infer() methods are specific to each model implementation.
+
+    Models that keep all their state on disk (i.e. load_model() only depends on the files written by _train()) can set
+    can_run_in_worker_process to True, in which case their training and large inference jobs are executed by worker
+    processes when the BackgroundJobsManager uses the "process" backend.
     """
+    can_run_in_worker_process = False
+
     def __init__(self, output_dir, background_jobs_manager: BackgroundJobsManager, gpu_support=False):
         """
         Model implementations can require some or all of the parameters in models_factory.ModelDependencies
@@ -65,8 +87,12 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         self.gpu_support = gpu_support
         self.primary_lock = threading.Lock()
         self.model_locks = defaultdict(lambda: threading.Lock())
-        self.cache = LRUCache(definitions.INFER_CACHE_SIZE)
-        self.cache_lock = threading.Lock()
+        self.cache = PredictionCache(definitions.INFER_CACHE_SIZE_BYTES)
+        self.prediction_stores = LRUCache(PREDICTION_STORES_CACHE_SIZE)
+        self.prediction_stores_lock = threading.Lock()
+        self.loaded_models = LRUCache(definitions.LOADED_MODELS_CACHE_SIZE)
+        self.loaded_models_lock = threading.Lock()
+        self.worker_spec = None  # set by the ModelFactory, see process_jobs.ModelWorkerSpec
 
     @abc.abstractmethod
     def _train(self, model_id: str, train_data: Sequence[Mapping], model_params: Mapping):
@@ -118,8 +144,8 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         """
         return Prediction
 
-    def train(self, train_data: Sequence[Mapping], language: Language,
-              model_params=None, done_callback=None) -> Tuple[str, Future]:
+    def train(self, train_data: Sequence[Mapping], language: Language, model_params=None, done_callback=None,
+              priority=JobPriority.TRAINING, workspace_id=None) -> Tuple[str, Future]:
         """
         Create a unique model identifier, and launch a model training job in a background thread.
         :param train_data: a list of dictionaries with at least the "text" and "label" fields, additional fields can be
@@ -129,6 +155,8 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         can then access this parameter via the get_language() call
         :param model_params: dictionary for additional model parameters (can be None)
         :param done_callback: an optional function to be executed once the training job has completed
+        :param priority: the JobPriority of the training job
+        :param workspace_id: the workspace for which the model is trained, if any, used for scheduling the job
         :return: a unique identifier for the model, and a Future object for the training job that was submitted in the
         background
         """
@@ -138,12 +166,29 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         self.mark_train_as_started(model_id)
         self.save_metadata(model_id, language, model_params)
 
-        future = self.background_jobs_manager.add_background_job(self.train_and_update_status,
+        train_method = self._train_in_worker_process if self._runs_in_worker_process() \
+            else self.train_and_update_status
+        future = self.background_jobs_manager.add_background_job(train_method,
                                                                  args=(model_id, train_data, model_params),
                                                                  use_gpu=self.gpu_support,
-                                                                 done_callback=done_callback)
+                                                                 done_callback=done_callback,
+                                                                 priority=priority, workspace_id=workspace_id)
         return model_id, future
 
+    def _train_in_worker_process(self, model_id, train_data, model_params) -> str:
+        """
+        Run train_and_update_status() in a worker process, and wait for it to complete. The job is submitted through
+        the scheduled background jobs, so that training in worker processes follows the same priorities.
+        """
+        job_dir = tempfile.mkdtemp(prefix=f"train_{model_id}_")
+        try:
+            train_data_path = write_items(train_data, job_dir)
+            future = self.background_jobs_manager.add_process_job(
+                train_in_worker, args=(self.worker_spec, model_id, train_data_path, model_params), done_callback=None)
+            return future.result()
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
     def train_and_update_status(self, model_id, *args) -> str:
         """
         Run the model _train() function, and return *model_id* if it has finished successfully.
@@ -159,13 +204,23 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         return model_id
 
     @staticmethod
-    def _infer_item_to_cache_key(item:Mapping):
+    def _infer_item_to_cache_key(item: Mapping) -> int:
         """
-        returns the unique identifier of an item sent to inference. Currently an item consists only of a text field.
-        * The return value is somewhat complex for backward compatability. In the next breaking change, this could
-        be changed to items's text only
+        returns the unique identifier of an item sent to inference, which is a 64-bit hash of the item. Currently an
+        item usually consists only of a text field, in which case only the text is hashed.
         """
-        return str(tuple(sorted(item.items())))
+        if len(item) == 1 and 'text' in item:
+            return xxhash.xxh3_64_intdigest(item['text'].encode('utf-8'))
+        # a different seed makes sure that items with additional fields do not share keys with text-only items
+        return xxhash.xxh3_64_intdigest(str(tuple(sorted(item.items()))).encode('utf-8'), seed=1)
+
+    @staticmethod
+    def _legacy_store_key_to_cache_key(legacy_key: str) -> int:
+        """
+        convert the keys of prediction stores written by older versions, which are in the form of
+        str(tuple(sorted(item.items()))), to the current cache keys
+        """
+        return ModelAPI._infer_item_to_cache_key(dict(ast.literal_eval(legacy_key)))
 
     def infer_by_id(self, model_id, items_to_infer: Sequence[Mapping], use_cache=True) -> Sequence[Prediction]:
         """
@@ -184,9 +239,10 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         if not use_cache:
             logging.info(f"Running infer without cache for {len(items_to_infer)} values in {self.__class__.__name__} "
                          f"model id {model_id}")
-            return self._infer_by_id(model_id, items_to_infer)
+            return self._infer_items(model_id, items_to_infer)
 
-        in_memory_cache_keys = [(model_id, self._infer_item_to_cache_key(item)) for item in items_to_infer]
+        # each model has a separate cache shard and store so model id is not part of the key
+        cache_keys = [self._infer_item_to_cache_key(item) for item in items_to_infer]
 
         # If there are multiple calls to infer_by_id() using the same *model_id*, we do not want them to perform the
         # below logic at the same time. Specifically, if two calls are asking for prediction results for the same
@@ -196,53 +252,45 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         model_lock_object = self._get_model_lock_object(model_id)
         with model_lock_object:
             # Try to get the predictions from the in-memory cache.
-            with self.cache_lock:  # we avoid different threads reading and writing to the cache at the same time
-                infer_res = [self.cache.get(cache_key) for cache_key in in_memory_cache_keys]
+            infer_res = self.cache.get_many(model_id, cache_keys)
 
             indices_not_in_cache = [i for i, v in enumerate(infer_res) if v is None]
 
             if len(indices_not_in_cache) > 0:  # i.e., some items aren't in the in-memory cache
-                logging.info(f"{len(indices_not_in_cache)} not in cache, loading model prediction store from disk "
+                logging.info(f"{len(indices_not_in_cache)} not in cache, reading from model prediction store on disk "
                              f"in {self.__class__.__name__} for model {model_id}")
-                model_predictions_store = self._load_model_prediction_store_to_cache(model_id)
-                logging.info(f"done loading model prediction store from disk in {self.__class__.__name__} for "
-                             f"model id {model_id}")
-                for idx in indices_not_in_cache:
-                    infer_res[idx] = self.cache.get(in_memory_cache_keys[idx])
+                model_predictions_store = self._get_model_prediction_store(model_id)
+                stored_predictions = model_predictions_store.get([cache_keys[idx] for idx in indices_not_in_cache])
+                found_in_store = {}
+                for idx, prediction in zip(indices_not_in_cache, stored_predictions):
+                    if prediction is not None:
+                        infer_res[idx] = prediction
+                        found_in_store[cache_keys[idx]] = prediction
+                self.cache.set_many(model_id, found_in_store)
                 indices_not_in_cache = [i for i, v in enumerate(infer_res) if v is None]
 
             if len(indices_not_in_cache) > 0:  # i.e., some items aren't in the in-memory cache or the prediction store
                 logging.info(f"model id {model_id}, {len(items_to_infer) - len(indices_not_in_cache)} already in cache, running inference "
-                             f"for {len(indices_not_in_cache)} values (cache size {self.cache.get_current_size()}) "
+                             f"for {len(indices_not_in_cache)} values (cache stats {self.get_cache_stats()}) "
                              f"in {self.__class__.__name__}")
-                missing_items_to_infer = [items_to_infer[idx] for idx in indices_not_in_cache]
                 # If duplicates exist, do not infer the same item more than once
-                uniques = set()
-                uniques_to_infer = [e for e in missing_items_to_infer if frozenset(e.items()) not in uniques
-                                    and not uniques.add(frozenset(e.items()))]
+                key_to_unique_item = {cache_keys[idx]: items_to_infer[idx] for idx in indices_not_in_cache}
 
                 # Run inference using the model for the missing elements
-                new_predictions = self._infer_by_id(model_id, uniques_to_infer)
+                new_predictions = self._infer_items(model_id, list(key_to_unique_item.values()))
                 logging.info(f"finished running infer for {len(indices_not_in_cache)} values")
 
-                item_to_prediction = {frozenset(unique_item.items()): item_predictions
-                                      for unique_item, item_predictions in zip(uniques_to_infer, new_predictions)}
-
-                # each model has a separate store so model id should not be part of the cache key
-                model_predictions_store_keys = [cache_key[1] for cache_key in in_memory_cache_keys]
+                key_to_prediction = dict(zip(key_to_unique_item.keys(), new_predictions))
 
                 # Update cache and prediction store with predictions for the newly inferred elements
-                with self.cache_lock:
-                    for idx, entry in zip(indices_not_in_cache, missing_items_to_infer):
-                        prediction = item_to_prediction[frozenset(entry.items())]
-                        infer_res[idx] = prediction
-                        self.cache.set(in_memory_cache_keys[idx], prediction)
-                        model_predictions_store[model_predictions_store_keys[idx]] = prediction
-                save_model_prediction_store_to_disk(self.get_model_prediction_store_file(model_id),
-                                                    model_predictions_store)
+                for idx in indices_not_in_cache:
+                    infer_res[idx] = key_to_prediction[cache_keys[idx]]
+                self.cache.set_many(model_id, key_to_prediction)
+                model_predictions_store.add(key_to_prediction)
             return infer_res
 
-    def infer_by_id_async(self, model_id, items_to_infer: Sequence[Mapping], done_callback=None):
+    def infer_by_id_async(self, model_id, items_to_infer: Sequence[Mapping], done_callback=None,
+                          priority=JobPriority.ACTIVE_LEARNING_INFERENCE, workspace_id=None, job_group=None):
         """
         Used for launching an inference job in the background. This method has no return, and is suited for a situation
         where the goal is to run a (potentially) long inference job and cache the results. After this background
@@ -252,14 +300,116 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         :param items_to_infer: a list of dictionaries with at least the "text" field, additional fields can be passed
         e.g. [{'text': 'text1', 'additional_field': 'value1'}, {'text': 'text2', 'additional_field': 'value2'}]
         :param done_callback: an optional function to be executed once the inference job has completed
+        :param priority: the JobPriority of the inference job
+        :param workspace_id: the workspace for which the inference runs, if any, used for scheduling the job
+        :param job_group: an optional key for cancelling the job while it is pending, see
+        BackgroundJobsManager.cancel_pending_jobs()
         """
         self.background_jobs_manager.add_background_job(self.infer_by_id, args=(model_id, items_to_infer),
-                                                        use_gpu=self.gpu_support, done_callback=done_callback)
+                                                        use_gpu=self.gpu_support, done_callback=done_callback,
+                                                        priority=priority, workspace_id=workspace_id,
+                                                        job_group=job_group)
+
+    def infer_by_id_in_chunks(self, model_id, text_chunks: Iterable[Sequence[str]], num_texts: int,
+                              chunk_callback: Callable[[Sequence[str], Sequence[Prediction]], None] = None,
+                              progress_callback: Callable[[int, int], None] = None) -> int:
+        """
+        Infer using *model_id* on a large number of texts (e.g. a full dataset), which are given in chunks. Each chunk
+        is inferred using infer_by_id(), so the model lock is only held for one chunk at a time, and only the texts and
+        predictions of a single chunk are held in memory. The predictions of each chunk are written to the prediction
+        store once the chunk is complete, so if the inference is restarted (e.g. after a server restart) the completed
+        chunks are read from the store rather than inferred again.
+
+        :param model_id:
+        :param text_chunks: the texts to infer, in chunks (e.g. of INFER_CHUNK_SIZE texts); may be a lazy iterable
+        :param num_texts: the total number of texts in *text_chunks*, used for reporting progress
+        :param chunk_callback: an optional function, called after each chunk with the texts of the chunk and their
+        predictions
+        :param progress_callback: an optional function, called after each chunk with the number of texts inferred so
+        far and the total number of texts
+        :return: the number of texts that were inferred
+        """
+        num_inferred = 0
+        for texts in text_chunks:
+            predictions = self.infer_by_id(model_id, [{"text": text} for text in texts])
+            num_inferred += len(texts)
+            if chunk_callback is not None:
+                chunk_callback(texts, predictions)
+            if progress_callback is not None:
+                progress_callback(num_inferred, num_texts)
+        return num_inferred
+
+    def infer_by_id_in_chunks_async(self, model_id, text_chunks: Iterable[Sequence[str]], num_texts: int,
+                                    done_callback=None, chunk_callback=None, progress_callback=None,
+                                    priority=JobPriority.ACTIVE_LEARNING_INFERENCE, workspace_id=None,
+                                    job_group=None):
+        """
+        Launch infer_by_id_in_chunks() as a background job; the arguments are as in infer_by_id_in_chunks() and
+        infer_by_id_async().
+        """
+        self.background_jobs_manager.add_background_job(self.infer_by_id_in_chunks,
+                                                        args=(model_id, text_chunks, num_texts, chunk_callback,
+                                                              progress_callback),
+                                                        use_gpu=self.gpu_support, done_callback=done_callback,
+                                                        priority=priority, workspace_id=workspace_id,
+                                                        job_group=job_group)
+
+    def _infer_items(self, model_id, items_to_infer) -> Sequence[Prediction]:
+        """
+        Run inference for *items_to_infer* using *model_id*, in a worker process if possible and worthwhile, and
+        otherwise in the current thread.
+        """
+        if len(items_to_infer) < WORKER_PROCESS_INFER_MIN_ITEMS or not self._runs_in_worker_process():
+            return self._infer_by_id(model_id, items_to_infer)
+
+        job_dir = tempfile.mkdtemp(prefix=f"infer_{model_id}_")
+        try:
+            items_path = write_items(items_to_infer, job_dir)
+            future = self.background_jobs_manager.add_process_job(
+                infer_in_worker, args=(self.worker_spec, model_id, items_path, job_dir), done_callback=None)
+            num_predictions = future.result()
+            predictions_store = PredictionStore(get_job_predictions_dir(job_dir), self.get_prediction_class())
+            return predictions_store.get(range(num_predictions))
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _runs_in_worker_process(self) -> bool:
+        return self.can_run_in_worker_process and self.worker_spec is not None \
+               and self.background_jobs_manager.uses_worker_processes(self.gpu_support)
 
     def _infer_by_id(self, model_id, items_to_infer):
-        model_components = self.load_model(model_path=self.get_model_dir_by_id(model_id))
+        model_components = self._get_model_components(model_id)
         return self.infer(model_components, items_to_infer)
 
+    def _get_model_components(self, model_id):
+        """
+        Return the components of *model_id* (see load_model()). Recently used models are kept in memory, so that
+        repeated inference calls do not load the model from disk every time.
+        """
+        with self.loaded_models_lock:
+            model_components = self.loaded_models.get(model_id)
+        if model_components is not None:
+            return model_components
+
+        model_path = self.get_model_dir_by_id(model_id)
+        try:
+            model_components = self.load_model(model_path=model_path)
+        except MemoryError:
+            logging.warning(f"out of memory while loading model {model_id} in {self.__class__.__name__}, releasing "
+                            f"{self.loaded_models.get_current_size()} loaded models and trying again")
+            with self.loaded_models_lock:
+                self.loaded_models.clear()
+            model_components = self.load_model(model_path=model_path)
+        with self.loaded_models_lock:
+            self.loaded_models.set(model_id, model_components)
+        return model_components
+
+    def get_cache_stats(self) -> PredictionCacheStats:
+        """
+        Returns the hit, miss and eviction counts and the current size of the in-memory predictions cache
+        """
+        return self.cache.get_stats()
+
     def get_model_status(self, model_id) -> ModelStatus:
         if os.path.isfile(self.get_completed_flag_path(model_id)):
             return ModelStatus.READY
@@ -272,10 +422,19 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         model_dir = self.get_model_dir_by_id(model_id)
         if os.path.isdir(model_dir):
             shutil.rmtree(model_dir)
-        prediction_store_path = self.get_model_prediction_store_file(model_id)
-        if os.path.exists(prediction_store_path):
-            logging.info(f"Deleting prediction store {prediction_store_path}")
-            os.remove(prediction_store_path)
+        self.cache.delete_model(model_id)
+        with self.loaded_models_lock:
+            self.loaded_models.remove(model_id)
+        with self.prediction_stores_lock:
+            self.prediction_stores.remove(model_id)
+        prediction_store_dir = self.get_model_prediction_store_dir(model_id)
+        if os.path.isdir(prediction_store_dir):
+            logging.info(f"Deleting prediction store {prediction_store_dir}")
+            shutil.rmtree(prediction_store_dir)
+        legacy_prediction_store_path = self.get_model_prediction_store_file(model_id)
+        if os.path.exists(legacy_prediction_store_path):
+            logging.info(f"Deleting prediction store {legacy_prediction_store_path}")
+            os.remove(legacy_prediction_store_path)
 
     def mark_train_as_started(self, model_id):
         os.makedirs(self.get_model_dir_by_id(model_id), exist_ok=True)
@@ -319,16 +478,36 @@ class ModelAPI(object, metaclass=abc.ABCMeta):
         language_name = ModelAPI.get_metadata(model_path)[LANGUAGE_STR_KEY]
         return getattr(Languages, language_name.upper())
 
-    def _load_model_prediction_store_to_cache(self, model_id):
-        logging.debug(f"start loading cache from disk from {self.get_model_prediction_store_file(model_id)}")
-        model_predictions_store = load_model_prediction_store_from_disk(self.get_model_prediction_store_file(model_id),
-                                                                        self.get_prediction_class())
-        logging.debug(f"done loading cache from disk from {self.get_model_prediction_store_file(model_id)}")
-        for key, value in model_predictions_store.items():
-            self.cache.set((model_id, key), value)
+    def _get_model_prediction_store(self, model_id) -> PredictionStore:
+        """
+        Return the prediction store of the given model. Prediction stores in the json format used by older versions
+        are converted to the current format.
+        """
+        with self.prediction_stores_lock:
+            model_predictions_store = self.prediction_stores.get(model_id)
+            if model_predictions_store is None:
+                model_predictions_store = PredictionStore(self.get_model_prediction_store_dir(model_id),
+                                                          self.get_prediction_class(),
+                                                          legacy_key_converter=self._legacy_store_key_to_cache_key)
+                self.prediction_stores.set(model_id, model_predictions_store)
+
+        legacy_prediction_store_path = self.get_model_prediction_store_file(model_id)
+        if os.path.exists(legacy_prediction_store_path):
+            logging.info(f"converting the prediction store {legacy_prediction_store_path} to the current format")
+            legacy_store = load_model_prediction_store_from_disk(legacy_prediction_store_path,
+                                                                 self.get_prediction_class())
+            model_predictions_store.add({self._legacy_store_key_to_cache_key(legacy_key): prediction
+                                         for legacy_key, prediction in legacy_store.items()})
+            os.remove(legacy_prediction_store_path)
         return model_predictions_store
 
+    def get_model_prediction_store_dir(self, model_id):
+        return os.path.join(self.get_models_dir(), PREDICTIONS_STORE_DIR_NAME, model_id)
+
     def get_model_prediction_store_file(self, model_id):
+        """
+        Returns the path of the json prediction store used by older versions
+        """
         return os.path.join(self.get_models_dir(), PREDICTIONS_STORE_DIR_NAME, model_id + ".json")
 
     def get_model_dir_by_id(self, model_id):
@@ -21,6 +21,7 @@ from dataclasses import dataclass
 
 from label_sleuth.models.core.model_api import ModelAPI
 from label_sleuth.models.core.model_type import ModelType
+from label_sleuth.models.core.process_jobs import ModelWorkerSpec
 from label_sleuth.models.core.tools import SentenceEmbeddingService
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
 
@@ -46,6 +47,11 @@ class ModelFactory:
                     kwargs = {k: v for k, v in self.model_dependencies.__dict__.items() if k in model_input_args}
                     # instantiate the model
                     model_api = model_type.cls(**kwargs)
+                    # allow the model to create an identical instance of itself in worker processes
+                    embedding_service = self.model_dependencies.sentence_embedding_service
+                    model_api.worker_spec = ModelWorkerSpec(
+                        model_type=model_type, models_output_dir=self.model_dependencies.output_dir,
+                        embedding_model_dir=None if embedding_service is None else embedding_service.embedding_model_dir)
                     self.loaded_model_apis[model_type] = model_api
                 except Exception:
                     logging.exception(f"Could not get model type {model_type.cls} from the model factory")
@@ -0,0 +1,121 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Model training and inference jobs that run in the worker processes of the BackgroundJobsManager "process" backend.
+
+Each worker process creates its own ModelAPI instances, which read and write the same model directories as the main
+process. Items to train on or infer are passed to the worker in an Arrow file, and predictions are returned in a
+PredictionStore directory, so that large lists are not pickled and sent through the process pool pipes.
+"""
+
+import os
+import pickle
+import threading
+
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from label_sleuth.models.core.model_type import ModelType
+from label_sleuth.models.util.prediction_store import PredictionStore
+
+ITEMS_ARROW_FILENAME = "items.arrow"
+ITEMS_PICKLE_FILENAME = "items.pkl"
+PREDICTIONS_DIR_NAME = "predictions"
+
+
+@dataclass
+class ModelWorkerSpec:
+    """
+    The information required for creating an instance of a model in a worker process.
+    """
+    model_type: ModelType
+    models_output_dir: str
+    embedding_model_dir: Optional[str]
+
+
+# worker process globals
+_worker_model_factories: Dict[Tuple[str, Optional[str]], object] = {}
+_worker_lock = threading.Lock()
+
+
+def _get_worker_model_api(spec: ModelWorkerSpec):
+    # imported here as models_factory imports the model implementations, which depend on this module
+    from label_sleuth.models.core.models_factory import ModelFactory
+    from label_sleuth.models.core.tools import SentenceEmbeddingService
+    from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+
+    with _worker_lock:
+        factory_key = (spec.models_output_dir, spec.embedding_model_dir)
+        if factory_key not in _worker_model_factories:
+            sentence_embedding_service = None if spec.embedding_model_dir is None \
+                else SentenceEmbeddingService(spec.embedding_model_dir)
+            _worker_model_factories[factory_key] = ModelFactory(spec.models_output_dir, BackgroundJobsManager(),
+                                                                sentence_embedding_service)
+        model_factory = _worker_model_factories[factory_key]
+    return model_factory.get_model_api(spec.model_type)
+
+
+def write_items(items: Sequence[Mapping], job_dir) -> str:
+    """
+    Write a list of train/inference items to a file in *job_dir*, and return the path of the file. Items are written
+    in the Arrow format where possible, and fall back to a pickle file for items with values that Arrow cannot
+    represent (e.g. arbitrary metadata objects), or for items that do not all have the same fields, as an Arrow table
+    has a single schema for all the items.
+    """
+    items = list(items)
+    if len(items) == 0 or all(item.keys() == items[0].keys() for item in items):
+        try:
+            path = os.path.join(job_dir, ITEMS_ARROW_FILENAME)
+            feather.write_feather(pa.Table.from_pylist(items), path, compression='uncompressed')
+            return path
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass
+    path = os.path.join(job_dir, ITEMS_PICKLE_FILENAME)
+    with open(path, 'wb') as f:
+        pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_items(path) -> List[Mapping]:
+    if path.endswith(ITEMS_PICKLE_FILENAME):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    return feather.read_table(path, memory_map=True).to_pylist()
+
+
+def get_job_predictions_dir(job_dir):
+    return os.path.join(job_dir, PREDICTIONS_DIR_NAME)
+
+
+def train_in_worker(spec: ModelWorkerSpec, model_id, train_data_path, model_params) -> str:
+    model_api = _get_worker_model_api(spec)
+    return model_api.train_and_update_status(model_id, read_items(train_data_path), model_params)
+
+
+def infer_in_worker(spec: ModelWorkerSpec, model_id, items_path, job_dir) -> int:
+    """
+    Infer the items in *items_path* using *model_id*, and write the predictions to a PredictionStore in *job_dir*,
+    where the key of each prediction is the index of the item.
+    :return: the number of predictions
+    """
+    model_api = _get_worker_model_api(spec)
+    predictions = model_api._infer_by_id(model_id, read_items(items_path))
+    PredictionStore(get_job_predictions_dir(job_dir), model_api.get_prediction_class()) \
+        .add(dict(enumerate(predictions)))
+    return len(predictions)
@@ -13,14 +13,21 @@
 #  limitations under the License.
 #
 
+import os
 import random
 import tempfile
 import unittest
 from unittest.mock import MagicMock
 
+from label_sleuth.models.core.catalog import ModelsCatalog
 from label_sleuth.models.core.languages import Languages
+from label_sleuth.models.core.model_api import ModelStatus, WORKER_PROCESS_INFER_MIN_ITEMS, split_into_chunks
+from label_sleuth.models.core.models_factory import ModelFactory
+from label_sleuth.models.core.prediction import Prediction
 from label_sleuth.models.random_model import RandomModel
-from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+from label_sleuth.models.util.LRUCache import LRUCache
+from label_sleuth.models.util.disk_cache import save_model_prediction_store_to_disk
+from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager, PROCESS_BACKEND
 
 PREFIX = 'Fascinating sentence'
 
@@ -61,5 +68,73 @@ class TestModelAPI(unittest.TestCase):
         self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=self.sentences1, use_cache=True)
         self.model_api._infer.assert_not_called()
 
+    def test_predictions_read_from_store(self):
+        predictions = self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=self.sentences2)
+        self.model_api.cache.clear()
+        self.model_api.prediction_stores = LRUCache(10)
+        self.model_api.infer = MagicMock(name='infer')
+        stored_predictions = self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=self.sentences2)
+        # scores are stored as float32
+        for prediction, stored_prediction in zip(predictions, stored_predictions):
+            self.assertEqual(prediction.label, stored_prediction.label)
+            self.assertAlmostEqual(prediction.score, stored_prediction.score, places=6)
+        self.model_api.infer.assert_not_called()
+
+    def test_legacy_prediction_store_is_converted(self):
+        legacy_store = {str(tuple(sorted(item.items()))): Prediction(True, 0.75)
+                        for item in self.sentences1}
+        save_model_prediction_store_to_disk(self.model_api.get_model_prediction_store_file(self.model_id),
+                                            legacy_store)
+        self.model_api.infer = MagicMock(name='infer')
+        self.assertListEqual([Prediction(True, 0.75)] * len(self.sentences1),
+                             self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=self.sentences1))
+        self.model_api.infer.assert_not_called()
+        self.assertFalse(os.path.exists(self.model_api.get_model_prediction_store_file(self.model_id)))
+
+    def test_loaded_model_is_reused(self):
+        self.model_api.load_model = MagicMock(name='load_model', wraps=self.model_api.load_model)
+        self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=self.sentences1, use_cache=False)
+        self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=self.sentences2, use_cache=False)
+        self.model_api.load_model.assert_called_once()
+
+        self.model_api.delete_model(self.model_id)
+        self.assertEqual(0, self.model_api.loaded_models.get_current_size())
+
+    def test_infer_in_chunks_resumes_from_store(self):
+        texts = [item['text'] for item in self.sentences2]
+        # simulate an inference job that was interrupted after its first chunk was stored
+        self.model_api.infer_by_id(model_id=self.model_id, items_to_infer=[{'text': text} for text in texts[:4]])
+        restarted_model_api = RandomModel(self.temp_dir.name, BackgroundJobsManager())
+        restarted_model_api.model_id_to_random_seed = self.model_api.model_id_to_random_seed
+        restarted_model_api._infer_by_id = MagicMock(name='_infer_by_id', wraps=restarted_model_api._infer_by_id)
+        chunk_callback = MagicMock(name='chunk_callback')
+        progress_callback = MagicMock(name='progress_callback')
+        num_inferred = restarted_model_api.infer_by_id_in_chunks(self.model_id, split_into_chunks(texts, 4), len(texts),
+                                                                 chunk_callback=chunk_callback,
+                                                                 progress_callback=progress_callback)
+        self.assertEqual(len(texts), num_inferred)
+        self.assertListEqual([text for call in chunk_callback.call_args_list for text in call.args[0]], texts)
+        self.assertEqual(len(texts), sum(len(call.args[1]) for call in chunk_callback.call_args_list))
+        self.assertListEqual([(4, 9), (8, 9), (9, 9)],
+                             [call.args for call in progress_callback.call_args_list])
+        # the first chunk is read from the prediction store, so only the other chunks are inferred
+        self.assertListEqual([4, 1], [len(call.args[1]) for call in restarted_model_api._infer_by_id.call_args_list])
+
     def tearDown(self):
         self.temp_dir.cleanup()
+
+    def test_train_and_infer_in_worker_process(self):
+        model_factory = ModelFactory(self.temp_dir.name, BackgroundJobsManager(executor_backend=PROCESS_BACKEND), None)
+        model_api = model_factory.get_model_api(ModelsCatalog.NB_OVER_BOW)
+        train_data = [{'text': f'{PREFIX} {i} {"good" if i % 2 else "bad"}', 'label': i % 2 == 1} for i in range(20)]
+        model_id, future = model_api.train(train_data, Languages.ENGLISH)
+        self.assertEqual(model_id, future.result())
+        self.assertEqual(ModelStatus.READY, model_api.get_model_status(model_id))
+
+        items = [{'text': f'{PREFIX} {i} {"good" if i % 3 else "bad"}'} for i in range(WORKER_PROCESS_INFER_MIN_ITEMS)]
+        predictions = model_api.infer_by_id(model_id, items)
+        model_api.background_jobs_manager.process_executor.shutdown()
+        expected_predictions = model_api._infer_by_id(model_id, items)  # in the current process
+        self.assertListEqual([p.label for p in expected_predictions], [p.label for p in predictions])
+        for expected_prediction, prediction in zip(expected_predictions, predictions):
+            self.assertAlmostEqual(expected_prediction.score, prediction.score, places=6)
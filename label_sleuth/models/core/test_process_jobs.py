@@ -0,0 +1,43 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import tempfile
+import unittest
+
+from label_sleuth.models.core.process_jobs import ITEMS_ARROW_FILENAME, ITEMS_PICKLE_FILENAME, read_items, \
+    write_items
+
+
+class TestProcessJobs(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_write_and_read_items(self):
+        items = [{'text': 'text1', 'label': True}, {'text': 'text2', 'label': False}]
+        path = write_items(items, self.temp_dir.name)
+        self.assertEqual(ITEMS_ARROW_FILENAME, os.path.basename(path))
+        self.assertListEqual(items, read_items(path))
+
+    def test_items_with_different_fields_are_not_changed(self):
+        for items in [[{'text': 'text1', 'label': True}, {'text': 'text2', 'label': False, 'extra': 1}],
+                      [{'text': 'text1', 'label': True, 'extra': 1}, {'text': 'text2', 'label': False}]]:
+            path = write_items(items, self.temp_dir.name)
+            self.assertEqual(ITEMS_PICKLE_FILENAME, os.path.basename(path))
+            self.assertListEqual(items, read_items(path))
+
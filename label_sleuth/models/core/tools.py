@@ -44,6 +44,7 @@ class RepresentationType(Enum):
 
 class SentenceEmbeddingService:
     def __init__(self, embedding_model_dir, preload_spacy_model_name=None, preload_fasttext_language_id=None):
+        self.embedding_model_dir = embedding_model_dir
         self.spacy_models_path = os.path.join(embedding_model_dir, "spacy_models")
         self.fasttext_models_path = os.path.join(embedding_model_dir, "fasttext_models")
         fasttext.FastText.eprint = lambda x: None
@@ -29,6 +29,7 @@ from label_sleuth.models.core.model_api import ModelAPI
 from label_sleuth.models.core.model_type import ModelType
 from label_sleuth.models.core.prediction import Prediction
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+from label_sleuth.orchestrator.job_scheduler import JobPriority
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s')
 
@@ -63,15 +64,19 @@ class Ensemble(ModelAPI):
         self.aggregation_func = aggregation_func
         self.model_types = model_types
         self.model_apis = [model_factory.get_model_api(model_type) for model_type in model_types]
+        self.can_run_in_worker_process = all(model_api.can_run_in_worker_process for model_api in self.model_apis)
 
-    def train(self, train_data, language, model_params=None, done_callback=None) -> Tuple[str, Future]:
+    def train(self, train_data, language, model_params=None, done_callback=None, priority=JobPriority.TRAINING,
+              workspace_id=None) -> Tuple[str, Future]:
         """
         Submits training of the different model types in the background, and returns a model_id and future object
         for the ensemble model.
         """
         if model_params is None:
             model_params = {}
-        model_ids_and_futures = [model_api.train(train_data, language, model_params) for model_api in self.model_apis]
+        model_ids_and_futures = [model_api.train(train_data, language, model_params, priority=priority,
+                                                 workspace_id=workspace_id)
+                                 for model_api in self.model_apis]
         ensemble_model_id = ",".join(model_id for model_id, future in model_ids_and_futures)
         self.mark_train_as_started(ensemble_model_id)
         self.save_metadata(ensemble_model_id, language, model_params)
@@ -79,7 +84,7 @@ class Ensemble(ModelAPI):
         future = self.background_jobs_manager.add_background_job(
             self.wait_and_update_status,
             args=(ensemble_model_id, [future for model_id, future in model_ids_and_futures]),
-            use_gpu=self.gpu_support, done_callback=done_callback)
+            use_gpu=self.gpu_support, done_callback=done_callback, priority=priority, workspace_id=workspace_id)
         logging.info(f"training an ensemble model id {ensemble_model_id} using {len(train_data)} elements")
         return ensemble_model_id, future
 
@@ -108,8 +113,7 @@ class Ensemble(ModelAPI):
 
     def load_model(self, model_path: Union[str, List]) -> EnsembleComponents:
         if isinstance(model_path, list):
-            # for internal use by the system, where paths for the constituting models are passed
-            # from Ensemble._infer_by_id()
+            # where the paths of the constituting models are passed directly
             model_paths = model_path
         else:
             # for external use, where the ensemble has been exported into a single folder containing all the models
@@ -129,14 +133,14 @@ class Ensemble(ModelAPI):
         models = [model_api.load_model(model_path) for model_api, model_path in zip(self.model_apis, model_paths)]
         return EnsembleComponents(models=models)
 
-    def _infer_by_id(self, model_id, items_to_infer):
+    def _get_model_components(self, model_id) -> EnsembleComponents:
         """
-        We override ModelAPI._infer as we need to extract the paths to all of the models constituting the ensemble
+        We override ModelAPI._get_model_components as the ensemble consists of the models in *model_id*, which are
+        loaded (and kept in memory) by their respective model APIs
         """
-        model_paths = [model_api.get_model_dir_by_id(m_id)
-                       for m_id, model_api in zip(model_id.split(","), self.model_apis)]
-        model = self.load_model(model_path=model_paths)
-        return self.infer(model, items_to_infer)
+        models = [model_api._get_model_components(m_id)
+                  for m_id, model_api in zip(model_id.split(","), self.model_apis)]
+        return EnsembleComponents(models=models)
 
     def infer(self, ensemble: EnsembleComponents, items_to_infer) -> Sequence[EnsemblePrediction]:
         """
@@ -156,6 +160,7 @@ class Ensemble(ModelAPI):
                 for label, score, type_to_prediction in zip(labels, aggregated_scores, type_to_prediction_per_element)]
 
     def delete_model(self, model_id):
+        self.cache.delete_model(model_id)
         for model_api, m_id in zip(self.model_apis, model_id.split(",")):
             model_api.delete_model(m_id)
 
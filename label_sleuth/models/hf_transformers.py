@@ -39,6 +39,8 @@ class HFTransformerModel(ModelAPI):
     """
     Basic implementation for a pytorch-based transformer model that relies on the huggingface transformers library.
     """
+    can_run_in_worker_process = True
+
     def __init__(self, output_dir, background_jobs_manager: BackgroundJobsManager,
                  pretrained_model, batch_size=32, learning_rate=5e-5, num_train_epochs=5):
         """
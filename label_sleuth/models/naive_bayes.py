@@ -41,6 +41,8 @@ class NaiveBayesModelComponents:
 
 
 class NaiveBayes(ModelAPI):
+    can_run_in_worker_process = True
+
     def __init__(self, output_dir, representation_type: RepresentationType,
                  background_jobs_manager: BackgroundJobsManager,
                  sentence_embedding_service: SentenceEmbeddingService,
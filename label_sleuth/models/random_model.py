@@ -59,6 +59,7 @@ class RandomModel(ModelAPI):
     def delete_model(self, model_id):
         if model_id in self.model_id_to_random_seed:
             self.model_id_to_random_seed.pop(model_id)
+        super().delete_model(model_id)
 
     def get_supported_languages(self):
         return Languages.all_languages()
@@ -16,6 +16,7 @@
 import logging
 import os
 import pickle
+import threading
 
 from dataclasses import dataclass
 from typing import Union
@@ -29,10 +30,14 @@ from label_sleuth.models.core.languages import Language, Languages
 from label_sleuth.models.core.model_api import ModelAPI
 from label_sleuth.models.core.prediction import Prediction
 from label_sleuth.models.core.tools import RepresentationType, SentenceEmbeddingService
+from label_sleuth.models.util.LRUCache import LRUCache
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s')
 
+TRAIN_EMBEDDINGS_CACHE_SIZE = 50000  # number of training text embeddings kept in memory by each SVM model class
+
+
 @dataclass
 class SVMModelComponents:
     model: Union[sklearn.svm.LinearSVC, sklearn.svm.SVC]
@@ -41,6 +46,8 @@ class SVMModelComponents:
 
 
 class SVM(ModelAPI):
+    can_run_in_worker_process = True
+
     def __init__(self, output_dir, representation_type: RepresentationType,
                  background_jobs_manager: BackgroundJobsManager, sentence_embedding_service: SentenceEmbeddingService,
                  kernel="linear"):
@@ -49,6 +56,10 @@ class SVM(ModelAPI):
         self.representation_type = representation_type
         if self.representation_type == RepresentationType.WORD_EMBEDDING:
             self.sentence_embedding_service = sentence_embedding_service
+        # (language name, text) -> embedding of a text that was used for training, so that the texts of the previous
+        # iterations are not embedded again when the next model of the category is trained
+        self.train_embeddings_cache = LRUCache(TRAIN_EMBEDDINGS_CACHE_SIZE)
+        self.train_embeddings_cache_lock = threading.Lock()
 
     def _train(self, model_id, train_data, model_params):
         if self.kernel == "linear":
@@ -61,7 +72,7 @@ class SVM(ModelAPI):
 
         language = self.get_language(self.get_model_dir_by_id(model_id))
         texts = [x['text'] for x in train_data]
-        train_data_features, vectorizer = self.input_to_features(texts, language=language)
+        train_data_features, vectorizer = self.get_train_features(texts, language=language)
         labels = np.array([x['label'] for x in train_data])
 
         model.fit(train_data_features, labels)
@@ -100,6 +111,27 @@ class SVM(ModelAPI):
         prob = np.exp(distances) / np.sum(np.exp(distances), axis=1, keepdims=True)
         return prob
 
+    def get_train_features(self, texts, language):
+        """
+        Return the features of the training texts, and the vectorizer fitted on these texts (if any). Embeddings of texts
+        that were used for training previous models are taken from memory, so that when training the next model of a
+        category only the texts labeled since the previous iteration are embedded.
+        """
+        if self.representation_type != RepresentationType.WORD_EMBEDDING:
+            return self.input_to_features(texts, language=language)
+
+        with self.train_embeddings_cache_lock:
+            embeddings = [self.train_embeddings_cache.get((language.name, text)) for text in texts]
+        missing_indices = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if len(missing_indices) > 0:
+            new_embeddings, _ = self.input_to_features([texts[i] for i in missing_indices], language=language)
+            with self.train_embeddings_cache_lock:
+                for i, embedding in zip(missing_indices, new_embeddings):
+                    embeddings[i] = embedding
+                    self.train_embeddings_cache.set((language.name, texts[i]), embedding)
+        logging.info(f"Reused the embeddings of {len(texts) - len(missing_indices)} out of {len(texts)} training texts")
+        return embeddings, None
+
     def input_to_features(self, texts, language=Languages.ENGLISH, vectorizer=None):
         if self.representation_type == RepresentationType.BOW:
             if vectorizer is None:
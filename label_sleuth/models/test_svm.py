@@ -0,0 +1,60 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from label_sleuth.data_access.core.data_structs import LABEL_POSITIVE, LABEL_NEGATIVE
+from label_sleuth.models.core.languages import Languages
+from label_sleuth.models.core.model_api import ModelStatus
+from label_sleuth.models.svm import SVM_WordEmbeddings
+from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+
+
+def embed(sentences, language):
+    return [np.array([sentence.count('positive'), sentence.count('other')], dtype=np.float32)
+            for sentence in sentences]
+
+
+class TestSVM(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.sentence_embedding_service = MagicMock()
+        self.sentence_embedding_service.get_sentence_embeddings_representation.side_effect = embed
+        self.svm = SVM_WordEmbeddings(self.temp_dir.name, BackgroundJobsManager(), self.sentence_embedding_service)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_train_embeds_only_new_texts(self):
+        train_data = [{'text': f'positive text {i}', 'label': LABEL_POSITIVE} for i in range(5)] + \
+                     [{'text': f'other text {i}', 'label': LABEL_NEGATIVE} for i in range(5)]
+        first_model_id, future = self.svm.train(train_data, Languages.ENGLISH)
+        future.result()
+        self.assertEqual(10, len(self.sentence_embedding_service.get_sentence_embeddings_representation
+                                 .call_args.args[0]))
+
+        new_train_data = train_data + [{'text': 'another positive text', 'label': LABEL_POSITIVE}]
+        second_model_id, future = self.svm.train(new_train_data, Languages.ENGLISH)
+        future.result()
+        self.assertListEqual(['another positive text'],
+                             self.sentence_embedding_service.get_sentence_embeddings_representation.call_args.args[0])
+        self.assertEqual(ModelStatus.READY, self.svm.get_model_status(second_model_id))
+
+        predictions = self.svm.infer_by_id(second_model_id, [{'text': 'positive'}, {'text': 'other'}])
+        self.assertListEqual([True, False], [prediction.label for prediction in predictions])
@@ -22,5 +22,11 @@ class LRUCache:
         if len(self.cache) > self.capacity:
             self.cache.popitem(last=False)
 
+    def remove(self, key):
+        self.cache.pop(key, None)
+
+    def clear(self):
+        self.cache.clear()
+
     def get_current_size(self):
         return len(self.cache)
@@ -0,0 +1,200 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence
+
+from label_sleuth.models.core.prediction import Prediction
+
+# approximate memory used by the cache for each entry, in addition to the prediction object itself: the key, and the
+# slot and links of the entry in the OrderedDict
+ENTRY_OVERHEAD_BYTES = 150
+# approximate memory used by the attribute dict of an object, per attribute
+ATTRIBUTE_BYTES = 32
+
+
+def estimate_prediction_size(prediction: Prediction) -> int:
+    """
+    A rough estimate of the memory used by a prediction object, including the values of its fields
+    """
+    size = sys.getsizeof(prediction)
+    for field in fields(prediction):
+        value = getattr(prediction, field.name)
+        size += ATTRIBUTE_BYTES + sys.getsizeof(value)
+        if isinstance(value, dict):  # e.g. the predictions of each model in an ensemble
+            size += sum(sys.getsizeof(v) for v in value.values())
+    return size
+
+
+@dataclass
+class PredictionCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+    max_size_bytes: int = 0
+    models: int = 0
+
+
+class _ModelShard:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.last_access_time = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class PredictionCache:
+    """
+    An in-memory LRU cache of model predictions, bounded by the (estimated) memory used by the cached predictions.
+
+    The cache is sharded by model id, and each shard has its own lock, so that inference using one model does not
+    block reading the cached predictions of another. When the cache is full, entries are evicted from the shard of
+    the model that was least recently used, so that an inference over a large corpus using one model does not evict
+    the predictions of models that are in active use.
+    """
+
+    def __init__(self, max_size_bytes: int):
+        self.max_size_bytes = max_size_bytes
+        self.shards: Dict[str, _ModelShard] = {}
+        self.stats = PredictionCacheStats(max_size_bytes=max_size_bytes)
+        # lock ordering: eviction_lock -> shard lock -> shards_lock
+        self.shards_lock = threading.Lock()  # guards self.shards and self.stats
+        self.eviction_lock = threading.Lock()
+
+    def get_many(self, model_id: str, keys: Sequence[Hashable]) -> List[Optional[Prediction]]:
+        """
+        Return the cached prediction of *model_id* for each of the given keys, or None for keys that are not cached.
+        """
+        shard = self._get_shard(model_id, create=False)
+        if shard is None:
+            results = [None] * len(keys)
+        else:
+            with shard.lock:
+                shard.last_access_time = time.monotonic()
+                results = [shard.entries.get(key) for key in keys]
+                for key, result in zip(keys, results):
+                    if result is not None:
+                        shard.entries.move_to_end(key)
+        num_hits = sum(result is not None for result in results)
+        with self.shards_lock:
+            self.stats.hits += num_hits
+            self.stats.misses += len(results) - num_hits
+        return results
+
+    def set_many(self, model_id: str, key_to_prediction: Mapping[Hashable, Prediction]):
+        shard = self._get_shard(model_id, create=True)
+        size_change = 0
+        num_new_entries = 0
+        with shard.lock:
+            shard.last_access_time = time.monotonic()
+            for key, prediction in key_to_prediction.items():
+                entry_size = estimate_prediction_size(prediction) + ENTRY_OVERHEAD_BYTES
+                previous = shard.entries.get(key)
+                if previous is None:
+                    num_new_entries += 1
+                else:
+                    size_change -= estimate_prediction_size(previous) + ENTRY_OVERHEAD_BYTES
+                shard.entries[key] = prediction
+                shard.entries.move_to_end(key)
+                size_change += entry_size
+            shard.size_bytes += size_change
+        with self.shards_lock:
+            self.stats.entries += num_new_entries
+            self.stats.size_bytes += size_change
+            is_full = self.stats.size_bytes > self.max_size_bytes
+        if is_full:
+            self._evict(current_model_id=model_id)
+
+    def delete_model(self, model_id: str):
+        """
+        Drop all the cached predictions of *model_id*
+        """
+        with self.shards_lock:
+            shard = self.shards.pop(model_id, None)
+        if shard is None:
+            return
+        with shard.lock:
+            with self.shards_lock:
+                self.stats.entries -= len(shard.entries)
+                self.stats.size_bytes -= shard.size_bytes
+            shard.entries.clear()
+            shard.size_bytes = 0
+
+    def clear(self):
+        for model_id in list(self.shards.keys()):
+            self.delete_model(model_id)
+
+    def get_current_size(self) -> int:
+        """
+        Returns the number of cached predictions
+        """
+        with self.shards_lock:
+            return self.stats.entries
+
+    def get_stats(self) -> PredictionCacheStats:
+        with self.shards_lock:
+            return PredictionCacheStats(**{**asdict(self.stats), 'models': len(self.shards)})
+
+    def _get_shard(self, model_id, create) -> Optional[_ModelShard]:
+        with self.shards_lock:
+            shard = self.shards.get(model_id)
+            if shard is None and create:
+                shard = self.shards[model_id] = _ModelShard()
+            return shard
+
+    def _evict(self, current_model_id):
+        """
+        Evict least recently used entries until the cache is within its size limit. Entries are evicted from the least
+        recently used shards first; the shard of *current_model_id* is only used as a last resort.
+        """
+        with self.eviction_lock:
+            while True:
+                with self.shards_lock:
+                    excess_bytes = self.stats.size_bytes - self.max_size_bytes
+                    candidates = sorted(((shard.last_access_time, model_id, shard)
+                                         for model_id, shard in self.shards.items()
+                                         if model_id != current_model_id and shard.size_bytes > 0),
+                                        key=lambda candidate: candidate[:2])
+                    current_shard = self.shards.get(current_model_id)
+                if excess_bytes <= 0:
+                    return
+                if len(candidates) > 0:
+                    victim = candidates[0][2]
+                elif current_shard is not None and current_shard.size_bytes > 0:
+                    victim = current_shard
+                else:
+                    return
+                self._evict_from_shard(victim, excess_bytes)
+
+    def _evict_from_shard(self, shard: _ModelShard, num_bytes):
+        evicted_bytes = 0
+        num_evicted = 0
+        with shard.lock:
+            while evicted_bytes < num_bytes and len(shard.entries) > 0:
+                _, prediction = shard.entries.popitem(last=False)
+                evicted_bytes += estimate_prediction_size(prediction) + ENTRY_OVERHEAD_BYTES
+                num_evicted += 1
+            shard.size_bytes -= evicted_bytes
+            with self.shards_lock:
+                self.stats.entries -= num_evicted
+                self.stats.evictions += num_evicted
+                self.stats.size_bytes -= evicted_bytes
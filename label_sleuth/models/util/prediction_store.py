@@ -0,0 +1,240 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import dataclasses
+import logging
+import os
+import time
+
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Type
+
+import numpy as np
+import ujson
+
+from label_sleuth.models.core.prediction import Prediction
+
+KEY_DTYPE = np.dtype('<u8')
+SCORE_DTYPE = np.dtype('<f4')
+
+
+class PredictionStore:
+    """
+    On-disk store of the predictions of a single model. Each stored prediction is a row, and rows are only ever
+    appended, so storing the predictions for a few new items only requires a small write.
+
+    The store directory contains the following files:
+    keys.u64 - the 64-bit store key (a hash of the inferred item, see ModelAPI._infer_item_to_cache_key) of each row
+    scores.f32 - the float32 score of each row
+    labels.bits - the boolean label of each row, as a packed bitset
+    extras.jsonl - only for prediction classes that add fields to Prediction, lines of [row, {field: value}]
+
+    All the files except for the extras are memory-mapped, and Prediction objects are only created for the rows that
+    are requested. The keys of new rows are written after the rest of their data, so the complete keys in keys.u64
+    determine which rows were fully written; any data beyond them (e.g. following a crash in the middle of a write) is
+    discarded.
+    """
+    keys_filename = 'keys.u64'
+    legacy_keys_filename = 'keys.jsonl'
+    scores_filename = 'scores.f32'
+    labels_filename = 'labels.bits'
+    extras_filename = 'extras.jsonl'
+
+    def __init__(self, store_dir, prediction_class: Type[Prediction] = Prediction,
+                 legacy_key_converter: Callable[[str], int] = None):
+        """
+        :param store_dir:
+        :param prediction_class:
+        :param legacy_key_converter: a function that converts the string keys of stores written by older versions to
+        the current keys
+        """
+        self.store_dir = store_dir
+        self.prediction_class = prediction_class
+        self.legacy_key_converter = legacy_key_converter
+        self.extra_fields = [field.name for field in dataclasses.fields(prediction_class)
+                             if field.name not in ('label', 'score')]
+        self.keys = None
+        # the keys in sorted order, and the row of each of them, for looking up rows by key
+        self.sorted_keys = None
+        self.keys_sort_order = None
+        self.scores = None
+        self.label_bits = None
+        self.row_to_extras = None
+
+    def __len__(self):
+        self._load()
+        return len(self.keys)
+
+    def get(self, keys: Sequence[int]) -> List[Optional[Prediction]]:
+        """
+        Return the stored prediction for each of the given keys, or None for keys that are not in the store.
+        """
+        self._load()
+        rows = self._get_rows(np.array(keys, dtype=KEY_DTYPE))
+        found_rows = rows[rows >= 0]
+        scores = self.scores[found_rows].tolist()
+        labels = ((self.label_bits[found_rows >> 3] >> (7 - (found_rows & 7))) & 1).astype(bool).tolist()
+        found_predictions = iter([self._build_prediction(row, label, score)
+                                  for row, label, score in zip(found_rows.tolist(), labels, scores)])
+        return [next(found_predictions) if row >= 0 else None for row in rows]
+
+    def add(self, key_to_prediction: Mapping[int, Prediction]):
+        """
+        Append the predictions of keys that are not already in the store.
+        """
+        self._load()
+        new_keys = np.array(list(key_to_prediction.keys()), dtype=KEY_DTYPE)
+        is_new = self._get_rows(new_keys) < 0
+        if not is_new.any():
+            return
+        start = time.time()
+        num_rows = len(self.keys)
+        new_keys = new_keys[is_new]
+        predictions = [prediction for prediction, new in zip(key_to_prediction.values(), is_new) if new]
+        with open(self._get_path(self.scores_filename), 'ab') as f:
+            f.write(np.array([prediction.score for prediction in predictions], dtype=SCORE_DTYPE).tobytes())
+        self._append_labels(num_rows, np.array([prediction.label for prediction in predictions], dtype=bool))
+        if len(self.extra_fields) > 0:
+            extras = [[row, {field: value for field, value in dataclasses.asdict(prediction).items()
+                             if field in self.extra_fields}]
+                      for row, prediction in enumerate(predictions, start=num_rows)]
+            with open(self._get_path(self.extras_filename), 'a') as f:
+                f.write(''.join(ujson.dumps(row_extras) + '\n' for row_extras in extras))
+            self.row_to_extras.update({row: row_extras for row, row_extras in extras})
+        with open(self._get_path(self.keys_filename), 'ab') as f:
+            f.write(new_keys.tobytes())
+        self._map_arrays()
+        self._insert_sorted_keys(new_keys, num_rows)
+        logging.info(f"adding {len(predictions)} items to model prediction store on disk took {time.time() - start}")
+
+    def _get_rows(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Return the row of each of the given keys, or -1 for keys that are not in the store
+        """
+        if self.sorted_keys is None:
+            self.keys_sort_order = np.argsort(self.keys, kind='stable')
+            self.sorted_keys = self.keys[self.keys_sort_order]
+        if len(self.sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.sorted_keys) - 1)
+        return np.where(self.sorted_keys[positions] == keys, self.keys_sort_order[positions], -1)
+
+    def _insert_sorted_keys(self, new_keys: np.ndarray, first_new_row: int):
+        """
+        Merge the keys of newly appended rows into the sorted keys, instead of sorting all the keys again
+        """
+        if self.sorted_keys is None:
+            return
+        new_keys_sort_order = np.argsort(new_keys, kind='stable')
+        new_sorted_keys = new_keys[new_keys_sort_order]
+        positions = np.searchsorted(self.sorted_keys, new_sorted_keys)
+        self.sorted_keys = np.insert(self.sorted_keys, positions, new_sorted_keys)
+        self.keys_sort_order = np.insert(self.keys_sort_order, positions, new_keys_sort_order + first_new_row)
+
+    def _build_prediction(self, row, label, score):
+        if len(self.extra_fields) == 0:
+            return self.prediction_class(label=label, score=score)
+        return self.prediction_class(label=label, score=score, **self.row_to_extras[row])
+
+    def _append_labels(self, num_rows, labels: np.ndarray):
+        path = self._get_path(self.labels_filename)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            # the last byte of the bitset may be partially filled; if so, it is rewritten along with the new labels
+            num_complete_bytes = num_rows // 8
+            if num_rows % 8 > 0:
+                f.seek(num_complete_bytes)
+                last_byte = np.frombuffer(f.read(1), dtype=np.uint8)
+                labels = np.concatenate([np.unpackbits(last_byte)[:num_rows % 8].astype(bool), labels])
+            f.seek(num_complete_bytes)
+            f.truncate()
+            f.write(np.packbits(labels).tobytes())
+
+    def _load(self):
+        if self.keys is not None:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        if os.path.exists(self._get_path(self.legacy_keys_filename)):
+            self._convert_legacy_keys()
+        keys_path = self._get_path(self.keys_filename)
+        if not os.path.exists(keys_path):
+            open(keys_path, 'wb').close()
+        num_rows = os.path.getsize(keys_path) // KEY_DTYPE.itemsize
+        # discard data of rows that were not completely written
+        for filename, size in [(self.keys_filename, num_rows * KEY_DTYPE.itemsize),
+                               (self.scores_filename, num_rows * SCORE_DTYPE.itemsize),
+                               (self.labels_filename, (num_rows + 7) // 8)]:
+            path = self._get_path(filename)
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            if os.path.getsize(path) < size:
+                raise Exception(f"prediction store file {path} is shorter than expected for {num_rows} predictions")
+            if os.path.getsize(path) > size:
+                logging.warning(f"ignoring partially written predictions at the end of {path}")
+                os.truncate(path, size)
+        self.row_to_extras = {}
+        if len(self.extra_fields) > 0:
+            self.row_to_extras = self._load_extras(num_rows)
+        self._map_arrays()
+
+    def _convert_legacy_keys(self):
+        """
+        Replace the json file of string keys, used by older versions, with the current binary keys file
+        """
+        legacy_keys_path = self._get_path(self.legacy_keys_filename)
+        if self.legacy_key_converter is None:
+            raise Exception(f"cannot convert the keys in {legacy_keys_path} without a legacy key converter")
+        with open(legacy_keys_path, 'rb') as f:
+            content = f.read()
+        # a partially written last key is dropped, along with the rest of the data of its row
+        content = content[:content.rfind(b'\n') + 1].rstrip(b'\n')
+        legacy_keys = ujson.loads(b'[' + content.replace(b'\n', b',') + b']') if len(content) > 0 else []
+        keys = np.array([self.legacy_key_converter(legacy_key) for legacy_key in legacy_keys], dtype=KEY_DTYPE)
+        keys_path = self._get_path(self.keys_filename)
+        with open(keys_path + '.tmp', 'wb') as f:
+            f.write(keys.tobytes())
+        os.replace(keys_path + '.tmp', keys_path)
+        os.remove(legacy_keys_path)
+
+    def _load_extras(self, num_rows) -> Dict[int, Dict]:
+        row_to_extras = {}
+        extras_path = self._get_path(self.extras_filename)
+        if not os.path.exists(extras_path):
+            return row_to_extras
+        valid_size = 0
+        with open(extras_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                row, extras = ujson.loads(line)
+                if row >= num_rows:
+                    break
+                row_to_extras[row] = extras
+                valid_size += len(line)
+        if valid_size < os.path.getsize(extras_path):
+            os.truncate(extras_path, valid_size)
+        return row_to_extras
+
+    def _map_arrays(self):
+        self.keys = self._map_file(self.keys_filename, KEY_DTYPE)
+        self.scores = self._map_file(self.scores_filename, SCORE_DTYPE)
+        self.label_bits = self._map_file(self.labels_filename, np.uint8)
+
+    def _map_file(self, filename, dtype):
+        path = self._get_path(filename)
+        if os.path.getsize(path) == 0:  # empty files cannot be memory-mapped
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def _get_path(self, filename):
+        return os.path.join(self.store_dir, filename)
@@ -0,0 +1,45 @@
+import unittest
+
+from label_sleuth.models.core.prediction import Prediction
+from label_sleuth.models.util.prediction_cache import PredictionCache, estimate_prediction_size, \
+    ENTRY_OVERHEAD_BYTES
+
+ENTRY_SIZE = estimate_prediction_size(Prediction(True, 0.5)) + ENTRY_OVERHEAD_BYTES
+
+
+class TestPredictionCache(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = PredictionCache(100 * ENTRY_SIZE)
+        cache.set_many('model_1', {1: Prediction(True, 0.5), 2: Prediction(False, 0.25)})
+        self.assertListEqual([Prediction(False, 0.25), None, Prediction(True, 0.5)], cache.get_many('model_1', [2, 3, 1]))
+        self.assertListEqual([None], cache.get_many('model_2', [1]))
+
+        stats = cache.get_stats()
+        self.assertEqual((2, 2, 0, 2, 1), (stats.hits, stats.misses, stats.evictions, stats.entries, stats.models))
+        self.assertEqual(2 * ENTRY_SIZE, stats.size_bytes)
+
+    def test_evict_from_least_recently_used_model(self):
+        cache = PredictionCache(10 * ENTRY_SIZE)
+        cache.set_many('model_1', {i: Prediction(True, 0.5) for i in range(4)})
+        cache.set_many('model_2', {i: Prediction(True, 0.5) for i in range(4)})
+        cache.get_many('model_1', [0])
+        # model_2 is now the least recently used model, so its oldest entries are evicted first
+        cache.set_many('model_3', {i: Prediction(True, 0.5) for i in range(4)})
+        self.assertEqual(10, cache.get_current_size())
+        self.assertListEqual([None, None, Prediction(True, 0.5), Prediction(True, 0.5)],
+                             cache.get_many('model_2', range(4)))
+        self.assertEqual(2, cache.get_stats().evictions)
+
+        # a single model that exceeds the limit evicts its own oldest entries
+        cache.set_many('model_4', {i: Prediction(True, 0.5) for i in range(12)})
+        self.assertEqual(10, cache.get_current_size())
+        self.assertListEqual([None, None, Prediction(True, 0.5)], cache.get_many('model_4', [0, 1, 2]))
+
+    def test_delete_model(self):
+        cache = PredictionCache(100 * ENTRY_SIZE)
+        cache.set_many('model_1', {1: Prediction(True, 0.5)})
+        cache.set_many('model_2', {1: Prediction(True, 0.5), 2: Prediction(False, 0.25)})
+        cache.delete_model('model_2')
+        self.assertListEqual([None], cache.get_many('model_2', [1]))
+        self.assertEqual(1, cache.get_current_size())
+        self.assertEqual(ENTRY_SIZE, cache.get_stats().size_bytes)
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from dataclasses import dataclass
+
+import numpy as np
+
+from label_sleuth.models.core.prediction import Prediction
+from label_sleuth.models.util.prediction_store import PredictionStore
+
+
+@dataclass
+class PredictionWithExtras(Prediction):
+    model_type_to_prediction: dict
+
+
+class TestPredictionStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.temp_dir.name, 'store')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_add_and_get_predictions(self):
+        predictions = {(i * 7919) % 2 ** 64: Prediction(i % 3 == 0, np.float32(i / 20)) for i in range(20)}
+        store = PredictionStore(self.store_dir)
+        store.add(dict(list(predictions.items())[:5]))
+        # appending after a partially filled byte of labels, and ignoring keys that are already stored
+        store.add(dict(list(predictions.items())[3:]))
+        self.assertEqual(20, len(store))
+
+        keys = list(predictions.keys())[::-1] + [2 ** 64 - 1]
+        expected = [predictions[key] for key in keys[:-1]] + [None]
+        self.assertListEqual(expected, store.get(keys))
+        self.assertListEqual(expected, PredictionStore(self.store_dir).get(keys))
+
+    def test_sorted_keys_are_updated_on_add(self):
+        rng = np.random.default_rng(0)
+        keys = rng.integers(0, 2 ** 63, 100, dtype=np.uint64).tolist()
+        store = PredictionStore(self.store_dir)
+        for start in range(0, len(keys), 30):
+            store.add({key: Prediction(key % 2 == 0, 0.5) for key in keys[start:start + 30]})
+            self.assertListEqual(sorted(keys[:start + 30]), store.sorted_keys.tolist())
+            self.assertListEqual(store.sorted_keys.tolist(), store.keys[store.keys_sort_order].tolist())
+        self.assertListEqual([Prediction(key % 2 == 0, 0.5) for key in keys], store.get(keys))
+
+    def test_partially_written_rows_are_discarded(self):
+        store = PredictionStore(self.store_dir)
+        store.add({1: Prediction(True, 0.75), 2: Prediction(False, 0.25)})
+        # simulate a crash after writing the scores of a new row, and part of its key
+        with open(os.path.join(self.store_dir, PredictionStore.scores_filename), 'ab') as f:
+            f.write(np.array([0.5], dtype=np.float32).tobytes())
+        with open(os.path.join(self.store_dir, PredictionStore.keys_filename), 'ab') as f:
+            f.write(b'\x03\x00\x00')
+
+        store = PredictionStore(self.store_dir)
+        self.assertListEqual([Prediction(True, 0.75), None], store.get([1, 3]))
+        store.add({3: Prediction(True, 0.5)})
+        self.assertListEqual([Prediction(False, 0.25), Prediction(True, 0.5)],
+                             PredictionStore(self.store_dir).get([2, 3]))
+
+    def test_convert_legacy_string_keys(self):
+        store = PredictionStore(self.store_dir)
+        store.add({1: Prediction(True, 0.75), 2: Prediction(False, 0.25)})
+        # replace the keys with string keys, as written by older versions
+        os.remove(os.path.join(self.store_dir, PredictionStore.keys_filename))
+        with open(os.path.join(self.store_dir, PredictionStore.legacy_keys_filename), 'w') as f:
+            f.write('"key 10"\n"key 20"\n')
+
+        store = PredictionStore(self.store_dir, legacy_key_converter=lambda key: int(key.split()[1]))
+        self.assertListEqual([Prediction(False, 0.25), None, Prediction(True, 0.75)], store.get([20, 2, 10]))
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir, PredictionStore.legacy_keys_filename)))
+
+    def test_prediction_class_with_additional_fields(self):
+        predictions = {10: PredictionWithExtras(True, 0.75, {'model1': {'label': True, 'score': 1.0}}),
+                       20: PredictionWithExtras(False, 0.25, {'model1': {'label': False, 'score': 0.5}})}
+        PredictionStore(self.store_dir, PredictionWithExtras).add(predictions)
+        self.assertListEqual([predictions[20], predictions[10]],
+                             PredictionStore(self.store_dir, PredictionWithExtras).get([20, 10]))
@@ -14,33 +14,104 @@
 #
 
 import logging
+import multiprocessing
+import threading
 
 from concurrent.futures import Future
-from concurrent.futures.thread import ThreadPoolExecutor
+from concurrent.futures.process import ProcessPoolExecutor
+from typing import Hashable
 
-from label_sleuth.definitions import CPU_WORKERS, GPU_WORKERS, GPU_AVAILABLE
+from label_sleuth.definitions import CPU_WORKERS, GPU_WORKERS, GPU_AVAILABLE, PROCESS_WORKERS
+from label_sleuth.orchestrator.job_scheduler import JobPriority, JobScheduler
+
+THREAD_BACKEND = "thread"
+PROCESS_BACKEND = "process"
 
 
 class BackgroundJobsManager:
     """
     This class manages various jobs that are submitted in the background (for example, training and inference).
-    The number of jobs running on CPU/GPU at the same time is limited by the CPU_WORKERS/GPU_WORKERS parameters.
+    The number of jobs running on CPU/GPU at the same time is limited by the CPU_WORKERS/GPU_WORKERS parameters, and
+    pending jobs are started according to their priority and workspace (see JobScheduler).
+
+    With the "process" executor backend, CPU jobs that are able to run outside of the main process (see
+    add_process_job()) are executed by a pool of worker processes, so that they do not compete over the GIL with the
+    threads serving requests. All other jobs, as well as jobs that use the GPU, are executed by the thread pools.
     """
-    def __init__(self):
-        self.cpu_executor = ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix=f"CPU_{CPU_WORKERS}_threadpool")
-        self.gpu_executor = ThreadPoolExecutor(GPU_WORKERS, thread_name_prefix=f"GPU_{GPU_WORKERS}_threadpool")
+    def __init__(self, executor_backend: str = THREAD_BACKEND):
+        if executor_backend not in [THREAD_BACKEND, PROCESS_BACKEND]:
+            raise Exception(f"background jobs executor backend must be either '{THREAD_BACKEND}' or "
+                            f"'{PROCESS_BACKEND}' (got '{executor_backend}')")
+        self.executor_backend = executor_backend
+        self.cpu_executor = JobScheduler(CPU_WORKERS, thread_name_prefix=f"CPU_{CPU_WORKERS}_threadpool")
+        self.gpu_executor = JobScheduler(GPU_WORKERS, thread_name_prefix=f"GPU_{GPU_WORKERS}_threadpool")
+        self.process_executor = None  # created on first use
+        self.process_executor_lock = threading.Lock()
 
-    def add_background_job(self, method, args, use_gpu, done_callback) -> Future:
+    def add_background_job(self, method, args, use_gpu, done_callback, priority=JobPriority.BULK_INFERENCE,
+                           workspace_id=None, job_group: Hashable = None) -> Future:
+        """
+        :param method:
+        :param args:
+        :param use_gpu:
+        :param done_callback: an optional function to be called with the future object once the job is done
+        :param priority: the JobPriority class of the job
+        :param workspace_id: the workspace on behalf of which the job runs, if any
+        :param job_group: an optional key, allowing to cancel the pending jobs of the group using cancel_pending_jobs()
+        """
         executor = self.get_executor(use_gpu)
-        future = executor.submit(method, *args)
+        future = executor.submit(method, args, priority=priority, workspace_id=workspace_id, job_group=job_group)
 
-        logging.info(f"Adding background job {method} into the {executor._thread_name_prefix}")
+        logging.info(f"Adding background job {method} with priority {priority.name} into the "
+                     f"{executor._thread_name_prefix}")
 
         if done_callback is not None:
             future.add_done_callback(done_callback)
         return future
 
-    def get_executor(self, model_requested_gpu) -> ThreadPoolExecutor:
+    def add_process_job(self, function, args, done_callback) -> Future:
+        """
+        Run *function* in one of the worker processes. *function* must be a module-level function, and *args* must be
+        picklable; large inputs and outputs should be passed through files rather than as arguments.
+        As with add_background_job(), *done_callback* is called with the future object once the job is done.
+        """
+        executor = self._get_process_executor()
+        future = executor.submit(function, *args)
+
+        logging.info(f"Adding background job {function.__name__} into the process pool")
+
+        if done_callback is not None:
+            future.add_done_callback(done_callback)
+        return future
+
+    def cancel_pending_jobs(self, job_group: Hashable) -> int:
+        """
+        Cancel the jobs in *job_group* that have not started running yet
+        :return: the number of cancelled jobs
+        """
+        num_cancelled = sum(executor.cancel_pending_jobs(job_group) for executor in [self.cpu_executor,
+                                                                                     self.gpu_executor])
+        if num_cancelled > 0:
+            logging.info(f"Cancelled {num_cancelled} pending background jobs of {job_group}")
+        return num_cancelled
+
+    def uses_worker_processes(self, use_gpu) -> bool:
+        """
+        Returns True if jobs that can run in worker processes should be submitted using add_process_job()
+        """
+        return self.executor_backend == PROCESS_BACKEND and self.get_executor(use_gpu) is self.cpu_executor
+
+    def get_executor(self, model_requested_gpu) -> JobScheduler:
         if model_requested_gpu and GPU_WORKERS > 0 and GPU_AVAILABLE:
             return self.gpu_executor
         return self.cpu_executor
+
+    def _get_process_executor(self) -> ProcessPoolExecutor:
+        with self.process_executor_lock:
+            # a pool in which a worker process died unexpectedly cannot be used anymore, so it is replaced
+            if self.process_executor is None or self.process_executor._broken:
+                # worker processes are spawned rather than forked, as forking a process that runs multiple threads
+                # (e.g. the request handling threads) is unsafe
+                self.process_executor = ProcessPoolExecutor(PROCESS_WORKERS,
+                                                            mp_context=multiprocessing.get_context("spawn"))
+            return self.process_executor
@@ -0,0 +1,103 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import queue
+import threading
+
+from collections import defaultdict
+from contextlib import contextmanager
+from enum import Enum
+from typing import Callable, Hashable
+
+
+class CategoryEventType(Enum):
+    LABELS_CHANGED = 0  # labels of the category were set or unset
+    LABEL_CHANGE_COUNT_INCREASED = 1  # the label change counter, which determines when a model is trained, increased
+    ITERATION_CHANGED = 2  # an iteration of the category was added, or its status or information changed
+
+
+class CategoryEvents:
+    """
+    Publishes events about changes in categories to listeners, which are called synchronously by the publishing
+    thread and should return quickly, and to subscribers, which receive the events through a queue (e.g. clients
+    that are subscribed to the status stream of a category).
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self.subscriber_queues = defaultdict(list)  # (workspace_id, category_id) -> queues of the subscribers
+        self.lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, int, CategoryEventType], None]):
+        self.listeners.append(listener)
+
+    def publish(self, workspace_id: str, category_id: int, event_type: CategoryEventType):
+        for listener in self.listeners:
+            try:
+                listener(workspace_id, category_id, event_type)
+            except Exception:
+                logging.exception(f"Category event listener {listener} failed on {event_type.name} event of "
+                                  f"workspace '{workspace_id}' category id '{category_id}'")
+        with self.lock:
+            subscriber_queues = list(self.subscriber_queues.get((workspace_id, category_id), []))
+        for subscriber_queue in subscriber_queues:
+            subscriber_queue.put(event_type)
+
+    @contextmanager
+    def subscribe(self, workspace_id: str, category_id: int):
+        """
+        A context manager that yields a queue of the events of the given category, until the context is exited
+        """
+        subscriber_queue = queue.Queue()
+        with self.lock:
+            self.subscriber_queues[(workspace_id, category_id)].append(subscriber_queue)
+        try:
+            yield subscriber_queue
+        finally:
+            with self.lock:
+                self.subscriber_queues[(workspace_id, category_id)].remove(subscriber_queue)
+                if len(self.subscriber_queues[(workspace_id, category_id)]) == 0:
+                    del self.subscriber_queues[(workspace_id, category_id)]
+
+
+class DebouncedCalls:
+    """
+    Coalesces calls to *function* with the same arguments: the first call schedules *function* to run in a background
+    thread after *delay_seconds*, and further calls with the same arguments until it starts running are dropped.
+    """
+
+    def __init__(self, function: Callable, delay_seconds: float):
+        self.function = function
+        self.delay_seconds = delay_seconds
+        self.pending_calls = set()
+        self.lock = threading.Lock()
+
+    def call(self, *args: Hashable):
+        with self.lock:
+            if args in self.pending_calls:
+                return
+            self.pending_calls.add(args)
+        timer = threading.Timer(self.delay_seconds, self._run, args=args)
+        timer.daemon = True
+        timer.start()
+
+    def _run(self, *args):
+        with self.lock:
+            self.pending_calls.discard(args)
+        try:
+            self.function(*args)
+        except Exception:
+            logging.exception(f"Debounced call to {self.function} with arguments {args} failed")
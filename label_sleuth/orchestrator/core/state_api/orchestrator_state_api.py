@@ -13,20 +13,24 @@
 #  limitations under the License.
 #
 
+import atexit
 import os
 import threading
 import logging
+import time
 from collections import defaultdict
 
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Sequence, Tuple, Mapping
-
-import jsonpickle
+from typing import Callable, Dict, List, Sequence, Tuple, Mapping
 
 from label_sleuth.models.core.model_api import ModelStatus
 from label_sleuth.models.core.model_type import ModelType
+from label_sleuth.orchestrator.core.state_api.workspace_store import JSON_BACKEND, SQLITE_BACKEND, SQLITE_FILENAME, \
+    JsonWorkspaceStore, SqliteWorkspaceStore
+
+WORKSPACE_FLUSH_DELAY_SECONDS = 1  # changes made within this time after a workspace is modified are written together
 
 
 class IterationStatus(Enum):
@@ -84,12 +88,46 @@ class WorkspaceSchemeChangedException(Exception):
 
 
 class OrchestratorStateApi:
+    """
+    The in-memory Workspace objects are the authoritative copy of the workspace state. Modified workspaces are written
+    to disk in the background: a flusher thread waits WORKSPACE_FLUSH_DELAY_SECONDS after a workspace is modified, so
+    that consecutive changes are coalesced into a single write, and then writes the workspace to the store. Call
+    flush() to write all pending changes immediately; this is also done when the process exits.
+
+    Workspaces are stored either as jsonpickle files (the "json" state backend) or in an SQLite database (the "sqlite"
+    state backend), see workspace_store.py. When the SQLite database is first used, the existing json workspace files
+    are imported into it once.
+    """
 
-    def __init__(self, workspaces_dir):
+    def __init__(self, workspaces_dir, state_backend: str = JSON_BACKEND):
         self.workspace_dir = workspaces_dir
         os.makedirs(self.workspace_dir, exist_ok=True)
+        if state_backend == JSON_BACKEND:
+            self.store = JsonWorkspaceStore(workspaces_dir)
+        elif state_backend == SQLITE_BACKEND:
+            self.store = SqliteWorkspaceStore(os.path.join(workspaces_dir, SQLITE_FILENAME))
+            self.store.import_workspaces(JsonWorkspaceStore(workspaces_dir))
+        else:
+            raise Exception(f"state backend must be either '{JSON_BACKEND}' or '{SQLITE_BACKEND}' "
+                            f"(got '{state_backend}')")
         self.workspaces = dict()  # in-memory cache for Workspace objects
         self.workspaces_lock = defaultdict(threading.RLock)  # lock for methods that access or manipulate the workspaces
+        self.dirty_workspace_ids = set()  # workspaces with changes that were not written to disk yet
+        self.flush_condition = threading.Condition()  # guards dirty_workspace_ids
+        self.flusher_thread = None  # started on the first change
+        self.iteration_listeners = []
+        atexit.register(self.flush)
+
+    def add_iteration_listener(self, listener: Callable[[str, int], None]):
+        """
+        Register a function that is called with the workspace id and category id whenever an iteration of the category
+        is added or modified. Listeners are called while the workspace lock is held, so they should return quickly.
+        """
+        self.iteration_listeners.append(listener)
+
+    def _notify_iteration_listeners(self, workspace_id, category_id):
+        for listener in self.iteration_listeners:
+            listener(workspace_id, category_id)
 
     # Workspace-related methods
 
@@ -101,8 +139,9 @@ class OrchestratorStateApi:
 
             workspace = Workspace(workspace_id=workspace_id, dataset_name=dataset_name)
 
-            if self._filename_from_workspace_id(workspace_id) in os.listdir(self.workspace_dir):
+            if self.workspace_exists(workspace_id):
                 raise Exception(f"workspace name '{workspace_id}' already exists")
+            self.workspaces[workspace_id] = workspace
             self._save_workspace(workspace)
 
     def get_workspace(self, workspace_id) -> Workspace:
@@ -121,20 +160,29 @@ class OrchestratorStateApi:
 
     def workspace_exists(self, workspace_id: str) -> bool:
         with self.workspaces_lock[workspace_id]:
-            return os.path.exists(os.path.join(self.workspace_dir, self._filename_from_workspace_id(workspace_id)))
+            return workspace_id in self.workspaces or self.store.workspace_exists(workspace_id)
 
     def delete_workspace_state(self, workspace_id: str):
         with self.workspaces_lock[workspace_id]:
-            os.remove(os.path.join(self.workspace_dir, self._filename_from_workspace_id(workspace_id)))
+            with self.flush_condition:
+                self.dirty_workspace_ids.discard(workspace_id)
+            if workspace_id not in self.workspaces or self.store.workspace_exists(workspace_id):
+                self.store.delete_workspace(workspace_id)
             if workspace_id in self.workspaces:
                 del self.workspaces[workspace_id]
 
+    def get_workspace_ids_by_dataset(self, dataset_name: str) -> List[str]:
+        workspace_ids = set(self.store.get_workspace_ids_by_dataset(dataset_name))
+        # workspaces that were created recently may not have been written to disk yet
+        workspace_ids.update(workspace_id for workspace_id, workspace in list(self.workspaces.items())
+                             if workspace.dataset_name == dataset_name)
+        return sorted(workspace_ids)
+
     def get_all_workspaces(self) -> Sequence[Workspace]:
         all_workspaces = []
-        for file in os.listdir(self.workspace_dir):
-            if file.startswith('.') or not file.endswith('.json'):
-                continue
-            workspace_id, _ = os.path.splitext(file)
+        # workspaces that were created recently may not have been written to disk yet
+        workspace_ids = set(self.store.get_all_workspace_ids()).union(list(self.workspaces.keys()))
+        for workspace_id in sorted(workspace_ids):
             try:
                 workspace = self.get_workspace(workspace_id)
             except WorkspaceSchemeChangedException:
@@ -147,23 +195,58 @@ class OrchestratorStateApi:
         cached_workspace = self.workspaces.get(workspace_id)
         if cached_workspace:
             return cached_workspace
-        with open(os.path.join(self.workspace_dir, self._filename_from_workspace_id(workspace_id))) as json_file:
-            workspace = json_file.read()
-        workspace = jsonpickle.decode(workspace)
-        # int dictionary keys are converted to string when writing to json, see https://bugs.python.org/issue34972
-        workspace.categories = {int(category_id_str): category
-                                for category_id_str, category in workspace.categories.items()}
+        workspace = self.store.load_workspace(workspace_id)
         self.workspaces[workspace_id] = workspace
         return workspace
 
     def _save_workspace(self, workspace: Workspace):
-        workspace_encoded = jsonpickle.encode(workspace)
-        with open(os.path.join(self.workspace_dir, self._filename_from_workspace_id(workspace.workspace_id)), 'w') as f:
-            f.write(workspace_encoded)
+        """
+        Mark the workspace as modified; the changes are written to disk by the flusher thread
+        """
+        with self.flush_condition:
+            self.dirty_workspace_ids.add(workspace.workspace_id)
+            if self.flusher_thread is None:
+                self.flusher_thread = threading.Thread(target=self._flush_periodically, name="workspaces_flusher",
+                                                       daemon=True)
+                self.flusher_thread.start()
+            self.flush_condition.notify()
+
+    def flush(self):
+        """
+        Write the changes of all the modified workspaces to disk
+        """
+        with self.flush_condition:
+            workspace_ids = list(self.dirty_workspace_ids)
+        for workspace_id in workspace_ids:
+            self._flush_workspace(workspace_id)
+
+    def _flush_periodically(self):
+        while True:
+            with self.flush_condition:
+                while len(self.dirty_workspace_ids) == 0:
+                    self.flush_condition.wait()
+            time.sleep(WORKSPACE_FLUSH_DELAY_SECONDS)  # changes made in the meantime are included in the same write
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Failed to write workspaces to disk")
 
-    @staticmethod
-    def _filename_from_workspace_id(workspace_id: str):
-        return workspace_id + ".json"
+    def _flush_workspace(self, workspace_id):
+        with self.workspaces_lock[workspace_id]:
+            with self.flush_condition:
+                if workspace_id not in self.dirty_workspace_ids:  # already written, or deleted
+                    return
+                self.dirty_workspace_ids.remove(workspace_id)
+            if not os.path.isdir(self.workspace_dir):
+                logging.warning(f"Workspaces directory {self.workspace_dir} was removed, changes to workspace "
+                                f"'{workspace_id}' are not saved")
+                return
+            try:
+                self.store.save_workspace(self.workspaces[workspace_id])
+            except Exception:
+                with self.flush_condition:
+                    self.dirty_workspace_ids.add(workspace_id)
+                raise
 
     # Category-related methods
 
@@ -212,6 +295,7 @@ class OrchestratorStateApi:
             workspace.categories[category_id].iterations[iteration_index].active_learning_recommendations \
                 = recommended_items
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
 
     def get_label_change_count_since_last_train(self, workspace_id: str, category_id: int) -> int:
         with self.workspaces_lock[workspace_id]:
@@ -240,6 +324,7 @@ class OrchestratorStateApi:
             iteration = Iteration(status=IterationStatus.PREPARING_DATA)
             workspace.categories[category_id].iterations.append(iteration)
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
 
     def add_model(self, workspace_id: str, category_id: int, iteration_index: int, model_info: ModelInfo):
         with self.workspaces_lock[workspace_id]:
@@ -249,6 +334,7 @@ class OrchestratorStateApi:
                                 f"already has a model, cannot add a model")
             workspace.categories[category_id].iterations[iteration_index].model = model_info
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
 
     def get_iteration_status(self, workspace_id: str, category_id: int, iteration_index: int) -> IterationStatus:
         with self.workspaces_lock[workspace_id]:
@@ -261,6 +347,7 @@ class OrchestratorStateApi:
             workspace = self._load_workspace(workspace_id)
             workspace.categories[category_id].iterations[iteration_index].status = new_status
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
 
     def get_all_iterations(self, workspace_id, category_id: int) -> List[Iteration]:
         with self.workspaces_lock[workspace_id]:
@@ -280,6 +367,7 @@ class OrchestratorStateApi:
             iteration = workspace.categories[category_id].iterations[iteration_index]
             iteration.iteration_statistics.update(statistics_dict)
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
 
     def update_model_status(self, workspace_id: str, category_id: int, iteration_index: int, new_status: ModelStatus):
         with self.workspaces_lock[workspace_id]:
@@ -289,6 +377,7 @@ class OrchestratorStateApi:
                 f"Iteration '{iteration_index}' doesn't exist in workspace '{workspace_id}'"
             iterations[iteration_index].model.model_status = new_status
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
 
     def mark_iteration_model_as_deleted(self, workspace_id, category_id: int, iteration_index: int):
         with self.workspaces_lock[workspace_id]:
@@ -297,3 +386,4 @@ class OrchestratorStateApi:
             iteration.model.model_status = ModelStatus.DELETED
             iteration.status = IterationStatus.MODEL_DELETED
             self._save_workspace(workspace)
+            self._notify_iteration_listeners(workspace_id, category_id)
@@ -24,6 +24,7 @@ from label_sleuth.models.core.model_api import ModelStatus
 from label_sleuth.models.core.catalog import ModelsCatalog
 from label_sleuth.orchestrator.core.state_api.orchestrator_state_api import OrchestratorStateApi, ModelInfo, \
     IterationStatus, Iteration, Category, Workspace
+from label_sleuth.orchestrator.core.state_api.workspace_store import SQLITE_BACKEND
 
 
 def generate_simple_doc(dataset_name, num_sentences, doc_id=0):
@@ -165,12 +166,71 @@ class TestOrchestratorStateAPI(unittest.TestCase):
                                               ModelInfo("456", ModelStatus.TRAINING, datetime.now(),
                                                         ModelsCatalog.SVM_OVER_WORD_EMBEDDINGS, {}))
         workspace = self.orchestrator_state_api.get_workspace(workspace_id)
-        # clear workspace cache
+        # write the workspace to disk and clear workspace cache
+        self.orchestrator_state_api.flush()
         self.orchestrator_state_api.workspaces = {}
         workspace_from_disk = self.orchestrator_state_api.get_workspace(workspace_id)
         self.assertEqual(workspace, workspace_from_disk,
                          msg='Workspace loaded from disk does not match original workspace')
 
+    def test_workspace_changes_are_flushed(self):
+        workspace_id = "workspace_1"
+        self.orchestrator_state_api.create_workspace(workspace_id=workspace_id, dataset_name='non_existing_dump')
+        category_id = self.orchestrator_state_api.add_category_to_workspace(workspace_id, "category_1", "description")
+        for _ in range(5):
+            self.orchestrator_state_api.increase_label_change_count_since_last_train(workspace_id, category_id, 2)
+        self.assertTrue(self.orchestrator_state_api.workspace_exists(workspace_id))
+
+        self.orchestrator_state_api.flush()
+        self.assertListEqual([f"{workspace_id}.json"], os.listdir(self.temp_dir.name))
+        other_state_api = OrchestratorStateApi(self.temp_dir.name)
+        self.assertEqual(10, other_state_api.get_label_change_count_since_last_train(workspace_id, category_id))
+
+    def test_sqlite_state_backend(self):
+        # a json workspace file written before switching to the sqlite backend is imported
+        self.orchestrator_state_api.create_workspace(workspace_id="json_workspace", dataset_name='dataset_1')
+        self.orchestrator_state_api.flush()
+        sqlite_state_api = OrchestratorStateApi(self.temp_dir.name, state_backend=SQLITE_BACKEND)
+        self.assertEqual(['json_workspace'], sqlite_state_api.get_workspace_ids_by_dataset('dataset_1'))
+
+        workspace_id = "workspace_1"
+        sqlite_state_api.create_workspace(workspace_id=workspace_id, dataset_name='dataset_1')
+        sqlite_state_api.create_workspace(workspace_id="workspace_2", dataset_name='dataset_2')
+        sqlite_state_api.add_category_to_workspace(workspace_id, "category_1", "category 1 description")
+        category2_id = sqlite_state_api.add_category_to_workspace(workspace_id, "category_2", "description")
+        for iteration_index in range(2):
+            sqlite_state_api.add_iteration(workspace_id, category2_id)
+            sqlite_state_api.add_model(workspace_id, category2_id, iteration_index,
+                                       ModelInfo(str(iteration_index), ModelStatus.READY, datetime.now(),
+                                                 ModelsCatalog.SVM_OVER_BOW, {}))
+        sqlite_state_api.flush()
+        sqlite_state_api.delete_category_from_workspace(workspace_id, 0)
+        sqlite_state_api.update_iteration_status(workspace_id, category2_id, 1, IterationStatus.READY)
+        sqlite_state_api.flush()
+
+        reloaded_state_api = OrchestratorStateApi(self.temp_dir.name, state_backend=SQLITE_BACKEND)
+        self.assertEqual(['json_workspace', workspace_id], reloaded_state_api.get_workspace_ids_by_dataset('dataset_1'))
+        self.assertEqual({category2_id}, reloaded_state_api.get_all_categories(workspace_id).keys())
+        self.assertIsNone(reloaded_state_api.get_workspace(workspace_id).categories[0])
+        iterations = reloaded_state_api.get_all_iterations(workspace_id, category2_id)
+        self.assertEqual(['0', '1'], [iteration.model.model_id for iteration in iterations])
+        self.assertEqual([IterationStatus.PREPARING_DATA, IterationStatus.READY],
+                         [iteration.status for iteration in iterations])
+
+        reloaded_state_api.delete_workspace_state("workspace_2")
+        self.assertFalse(reloaded_state_api.workspace_exists("workspace_2"))
+        self.assertEqual([], reloaded_state_api.get_workspace_ids_by_dataset('dataset_2'))
+
+    def test_deleted_imported_workspace_is_not_imported_again(self):
+        self.orchestrator_state_api.create_workspace(workspace_id="json_workspace", dataset_name='dataset_1')
+        self.orchestrator_state_api.flush()
+        sqlite_state_api = OrchestratorStateApi(self.temp_dir.name, state_backend=SQLITE_BACKEND)
+        sqlite_state_api.delete_workspace_state("json_workspace")
+
+        restarted_state_api = OrchestratorStateApi(self.temp_dir.name, state_backend=SQLITE_BACKEND)
+        self.assertFalse(restarted_state_api.workspace_exists("json_workspace"))
+        self.assertEqual([], restarted_state_api.get_workspace_ids_by_dataset('dataset_1'))
+
     def test_load_existing_workspace(self):
         """
         Make sure that code changes do not break existing workspaces
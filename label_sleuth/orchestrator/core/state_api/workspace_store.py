@@ -0,0 +1,277 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import abc
+import dataclasses
+import logging
+import os
+import sqlite3
+import threading
+
+from typing import Dict, List
+
+import jsonpickle
+
+JSON_BACKEND = "json"
+SQLITE_BACKEND = "sqlite"
+SQLITE_FILENAME = "workspaces.sqlite"
+
+
+class WorkspaceStore(metaclass=abc.ABCMeta):
+    """
+    Persistent storage of the Workspace objects of the OrchestratorStateApi
+    """
+
+    @abc.abstractmethod
+    def get_all_workspace_ids(self) -> List[str]:
+        pass
+
+    @abc.abstractmethod
+    def get_workspace_ids_by_dataset(self, dataset_name: str) -> List[str]:
+        pass
+
+    @abc.abstractmethod
+    def workspace_exists(self, workspace_id: str) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def load_workspace(self, workspace_id: str):
+        pass
+
+    @abc.abstractmethod
+    def save_workspace(self, workspace):
+        pass
+
+    @abc.abstractmethod
+    def delete_workspace(self, workspace_id: str):
+        pass
+
+
+class JsonWorkspaceStore(WorkspaceStore):
+    """
+    Stores each workspace as a jsonpickle file in *workspaces_dir*
+    """
+
+    def __init__(self, workspaces_dir):
+        self.workspaces_dir = workspaces_dir
+
+    def get_all_workspace_ids(self) -> List[str]:
+        return sorted(os.path.splitext(file)[0] for file in os.listdir(self.workspaces_dir)
+                      if not file.startswith('.') and file.endswith('.json'))
+
+    def get_workspace_ids_by_dataset(self, dataset_name: str) -> List[str]:
+        workspace_ids = []
+        for workspace_id in self.get_all_workspace_ids():
+            try:
+                if self.load_workspace(workspace_id).dataset_name == dataset_name:
+                    workspace_ids.append(workspace_id)
+            except Exception:
+                logging.warning(f"Failed to load workspace {workspace_id}. skipping...", exc_info=True)
+        return workspace_ids
+
+    def workspace_exists(self, workspace_id: str) -> bool:
+        return os.path.exists(self._get_workspace_path(workspace_id))
+
+    def load_workspace(self, workspace_id: str):
+        with open(self._get_workspace_path(workspace_id)) as json_file:
+            workspace = json_file.read()
+        workspace = jsonpickle.decode(workspace)
+        # int dictionary keys are converted to string when writing to json, see https://bugs.python.org/issue34972
+        workspace.categories = {int(category_id_str): category
+                                for category_id_str, category in workspace.categories.items()}
+        return workspace
+
+    def save_workspace(self, workspace):
+        workspace_encoded = jsonpickle.encode(workspace)
+        workspace_path = self._get_workspace_path(workspace.workspace_id)
+        # the workspace file is replaced atomically, so a failure while writing does not corrupt it
+        with open(workspace_path + '.tmp', 'w') as f:
+            f.write(workspace_encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(workspace_path + '.tmp', workspace_path)
+
+    def delete_workspace(self, workspace_id: str):
+        os.remove(self._get_workspace_path(workspace_id))
+
+    def _get_workspace_path(self, workspace_id):
+        return os.path.join(self.workspaces_dir, workspace_id + ".json")
+
+
+class SqliteWorkspaceStore(WorkspaceStore):
+    """
+    Stores the workspaces in an SQLite database, with a row for each workspace, category and iteration. Workspaces can
+    be looked up by their dataset using an index, and each save is a single transaction that only writes the rows
+    that changed since the workspace was last loaded or saved.
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS workspaces (
+            workspace_id TEXT PRIMARY KEY,
+            dataset_name TEXT NOT NULL,
+            workspace TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS workspaces_by_dataset ON workspaces (dataset_name);
+        CREATE TABLE IF NOT EXISTS categories (
+            workspace_id TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            category TEXT,  -- NULL for deleted categories
+            PRIMARY KEY (workspace_id, category_id)
+        );
+        CREATE TABLE IF NOT EXISTS iterations (
+            workspace_id TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            iteration_index INTEGER NOT NULL,
+            iteration TEXT NOT NULL,
+            PRIMARY KEY (workspace_id, category_id, iteration_index)
+        );
+        CREATE TABLE IF NOT EXISTS imported_workspaces (
+            workspace_id TEXT PRIMARY KEY
+        );
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # transactions are managed explicitly, and the connection is shared by all threads under self.lock
+        self.connection = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        # workspace id -> the encoded rows of the workspace as they are in the database
+        self.stored_rows: Dict[str, Dict] = {}
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(self.schema)
+
+    def get_all_workspace_ids(self) -> List[str]:
+        with self.lock:
+            rows = self.connection.execute("SELECT workspace_id FROM workspaces ORDER BY workspace_id").fetchall()
+        return [workspace_id for workspace_id, in rows]
+
+    def get_workspace_ids_by_dataset(self, dataset_name: str) -> List[str]:
+        with self.lock:
+            rows = self.connection.execute("SELECT workspace_id FROM workspaces WHERE dataset_name = ? "
+                                           "ORDER BY workspace_id", (dataset_name,)).fetchall()
+        return [workspace_id for workspace_id, in rows]
+
+    def workspace_exists(self, workspace_id: str) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM workspaces WHERE workspace_id = ?",
+                                           (workspace_id,)).fetchone() is not None
+
+    def import_workspaces(self, other_store: WorkspaceStore):
+        """
+        Copy the workspaces of *other_store* that are not in this store. Each workspace is imported only once, so a
+        workspace that was deleted from this store is not imported again from its (stale) copy in *other_store*.
+        """
+        with self.lock:
+            skipped_workspace_ids = {workspace_id for workspace_id, in self.connection.execute(
+                "SELECT workspace_id FROM workspaces UNION SELECT workspace_id FROM imported_workspaces").fetchall()}
+        for workspace_id in other_store.get_all_workspace_ids():
+            if workspace_id in skipped_workspace_ids:
+                continue
+            try:
+                self.save_workspace(other_store.load_workspace(workspace_id))
+                with self.lock:
+                    self.connection.execute("INSERT OR IGNORE INTO imported_workspaces VALUES (?)", (workspace_id,))
+                logging.info(f"Imported workspace '{workspace_id}' from {other_store.__class__.__name__}")
+            except Exception:
+                logging.exception(f"Failed to import workspace '{workspace_id}' from "
+                                  f"{other_store.__class__.__name__}. skipping...")
+
+    def load_workspace(self, workspace_id: str):
+        with self.lock:
+            workspace_row = self.connection.execute("SELECT workspace FROM workspaces WHERE workspace_id = ?",
+                                                    (workspace_id,)).fetchone()
+            if workspace_row is None:
+                raise Exception(f"workspace '{workspace_id}' does not exist")
+            category_rows = self.connection.execute("SELECT category_id, category FROM categories "
+                                                    "WHERE workspace_id = ? ORDER BY category_id",
+                                                    (workspace_id,)).fetchall()
+            iteration_rows = self.connection.execute("SELECT category_id, iteration_index, iteration FROM iterations "
+                                                     "WHERE workspace_id = ? ORDER BY category_id, iteration_index",
+                                                     (workspace_id,)).fetchall()
+            # recorded together with the reads, so that a save of the workspace by another thread cannot be
+            # overwritten by this (older) snapshot of its rows
+            self.stored_rows[workspace_id] = {
+                'workspace': workspace_row[0],
+                'categories': dict(category_rows),
+                'iterations': {(category_id, iteration_index): iteration
+                               for category_id, iteration_index, iteration in iteration_rows}}
+        workspace = jsonpickle.decode(workspace_row[0])
+        workspace.categories = {category_id: None if category is None else jsonpickle.decode(category)
+                                for category_id, category in category_rows}
+        for category_id, _, iteration in iteration_rows:
+            workspace.categories[category_id].iterations.append(jsonpickle.decode(iteration))
+        return workspace
+
+    def save_workspace(self, workspace):
+        workspace_id = workspace.workspace_id
+        rows = self._encode_rows(workspace)
+        with self.lock:
+            stored_rows = self.stored_rows.pop(workspace_id, None)
+            try:
+                self.connection.execute("BEGIN IMMEDIATE")
+                if stored_rows is None:  # the rows in the database are unknown, so all the rows are rewritten
+                    self._delete_rows(workspace_id)
+                    stored_rows = {'workspace': None, 'categories': {}, 'iterations': {}}
+                if rows['workspace'] != stored_rows['workspace']:
+                    self.connection.execute("INSERT OR REPLACE INTO workspaces VALUES (?, ?, ?)",
+                                            (workspace_id, workspace.dataset_name, rows['workspace']))
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO categories VALUES (?, ?, ?)",
+                    [(workspace_id, category_id, category) for category_id, category in rows['categories'].items()
+                     if category_id not in stored_rows['categories']
+                     or stored_rows['categories'][category_id] != category])
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO iterations VALUES (?, ?, ?, ?)",
+                    [(workspace_id, *key, iteration) for key, iteration in rows['iterations'].items()
+                     if stored_rows['iterations'].get(key) != iteration])
+                self.connection.executemany(
+                    "DELETE FROM iterations WHERE workspace_id = ? AND category_id = ? AND iteration_index = ?",
+                    [(workspace_id, *key) for key in stored_rows['iterations'].keys() - rows['iterations'].keys()])
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.stored_rows[workspace_id] = rows
+
+    def delete_workspace(self, workspace_id: str):
+        with self.lock:
+            self.stored_rows.pop(workspace_id, None)
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                if self._delete_rows(workspace_id) == 0:
+                    raise Exception(f"workspace '{workspace_id}' does not exist")
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def _delete_rows(self, workspace_id) -> int:
+        """
+        Delete all the rows of the workspace, and return the number of deleted workspace rows
+        """
+        self.connection.execute("DELETE FROM iterations WHERE workspace_id = ?", (workspace_id,))
+        self.connection.execute("DELETE FROM categories WHERE workspace_id = ?", (workspace_id,))
+        return self.connection.execute("DELETE FROM workspaces WHERE workspace_id = ?", (workspace_id,)).rowcount
+
+    @staticmethod
+    def _encode_rows(workspace) -> Dict:
+        return {
+            'workspace': jsonpickle.encode(dataclasses.replace(workspace, categories={})),
+            'categories': {category_id: None if category is None
+                           else jsonpickle.encode(dataclasses.replace(category, iterations=[]))
+                           for category_id, category in workspace.categories.items()},
+            'iterations': {(category_id, iteration_index): jsonpickle.encode(iteration)
+                           for category_id, category in workspace.categories.items() if category is not None
+                           for iteration_index, iteration in enumerate(category.iterations)}}
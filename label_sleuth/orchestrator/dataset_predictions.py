@@ -0,0 +1,116 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import random
+import threading
+
+from dataclasses import dataclass, field
+from typing import List, Sequence
+
+import numpy as np
+
+from label_sleuth.data_access.core.data_structs import LABEL_POSITIVE
+from label_sleuth.models.core.prediction import Prediction
+from label_sleuth.models.util.LRUCache import LRUCache
+
+ROW_ORDERS_CACHE_SIZE = 8
+
+
+@dataclass
+class DatasetPredictions:
+    """
+    The predictions of a single model for all the elements of a dataset, aligned with the order of the elements in the
+    dataset, i.e. labels[i] and scores[i] are the prediction for the element in row i of the dataset.
+
+    positive_rows and negative_rows are the (sorted) rows with each predicted label, so that a page of the elements with
+    a given prediction is a slice of these arrays. Other orderings of the rows (shuffled, without duplicate texts) are
+    computed on first use and cached.
+    """
+    uris: List[str]
+    labels: np.ndarray
+    scores: np.ndarray
+    is_duplicate: np.ndarray  # True for elements whose text is identical to that of an element in a previous row
+    positive_rows: np.ndarray
+    negative_rows: np.ndarray
+    row_orders: LRUCache = field(default_factory=lambda: LRUCache(ROW_ORDERS_CACHE_SIZE), repr=False)
+    row_orders_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __len__(self):
+        return len(self.uris)
+
+    def get_rows(self, required_prediction, shuffle=False, random_state: int = 0,
+                 remove_duplicates=False) -> np.ndarray:
+        """
+        Return the dataset rows of the elements with the required prediction. The order of the rows is identical to the
+        order of these elements in DataAccessApi.get_text_element_iterator() with the same arguments.
+        :param required_prediction:
+        :param shuffle: if True, the rows are returned in random order
+        :param random_state: provide an int seed to define a random state. Default is zero.
+        :param remove_duplicates: if True, do not include elements that are duplicates of each other.
+        """
+        if not shuffle and not remove_duplicates:
+            return self.positive_rows if required_prediction == LABEL_POSITIVE else self.negative_rows
+
+        key = (required_prediction, shuffle, random_state if shuffle else None, remove_duplicates)
+        with self.row_orders_lock:
+            rows = self.row_orders.get(key)
+        if rows is None:
+            rows = np.flatnonzero(~self.is_duplicate) if remove_duplicates else np.arange(len(self))
+            if shuffle:
+                # the order of a shuffled list only depends on its length and on the seed, so shuffling the row
+                # positions gives the same order as shuffling the uris of these rows
+                order = list(range(len(rows)))
+                random.Random(random_state).shuffle(order)
+                rows = rows[order]
+            rows = rows[self.labels[rows] == required_prediction]
+            with self.row_orders_lock:
+                self.row_orders.set(key, rows)
+        return rows
+
+    def get_uris(self, rows: np.ndarray) -> List[str]:
+        return [self.uris[row] for row in rows.tolist()]
+
+
+class DatasetPredictionsBuilder:
+    """
+    Collects the predictions for the elements of a dataset chunk by chunk, in the order of the dataset, e.g. as they are
+    passed to the chunk callback of ModelAPI.infer_by_id_in_chunks(). Only the labels and the scores are kept, rather
+    than the elements or the Prediction objects.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.scores = []
+
+    def add_chunk(self, predictions: Sequence[Prediction]):
+        """
+        :param predictions: the model prediction for each of the next elements of the dataset
+        """
+        self.labels.append(np.array([prediction.label for prediction in predictions], dtype=bool))
+        self.scores.append(np.array([prediction.score for prediction in predictions], dtype=np.float64))
+
+    def build(self, uris: List[str], is_duplicate: np.ndarray) -> DatasetPredictions:
+        """
+        :param uris: the uris of the elements of all the added chunks, in the order of the dataset
+        :param is_duplicate: True for elements whose text is identical to that of an element in a previous row (see
+        DataAccessApi.get_duplicate_text_mask())
+        """
+        labels = np.concatenate(self.labels) if len(self.labels) > 0 else np.zeros(0, dtype=bool)
+        if len(uris) != len(labels) or len(is_duplicate) != len(labels):
+            raise Exception(f"got {len(uris)} uris and {len(is_duplicate)} duplicate flags for the predictions of "
+                            f"{len(labels)} elements")
+        scores = np.concatenate(self.scores) if len(self.scores) > 0 else np.zeros(0, dtype=np.float64)
+        return DatasetPredictions(uris=uris, labels=labels, scores=scores, is_duplicate=is_duplicate,
+                                  positive_rows=np.flatnonzero(labels), negative_rows=np.flatnonzero(~labels))
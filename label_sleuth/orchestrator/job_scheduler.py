@@ -0,0 +1,128 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import threading
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Callable, Dict, Hashable, Sequence
+
+
+class JobPriority(IntEnum):
+    """
+    Priority classes of background jobs; pending jobs of a lower value are always started first.
+    """
+    TRAINING = 0  # training that the user is waiting for, including the preparation of the train set
+    ACTIVE_LEARNING_INFERENCE = 1  # inference that is required for completing an iteration
+    BULK_INFERENCE = 2  # e.g. inferring documents that were added to an existing dataset
+    REPORTS = 3  # e.g. the cross-validation models of the labeling reports
+
+
+@dataclass
+class _Job:
+    future: Future
+    method: Callable
+    args: Sequence
+    job_group: Hashable
+
+
+class JobScheduler:
+    """
+    Executes jobs using up to *num_workers* threads. Pending jobs are started by their priority class, and within a
+    priority class the workspaces that have pending jobs take turns (round robin), so that a workspace that submitted
+    many jobs does not hold back the jobs of other workspaces. Jobs submitted without a workspace id take turns as if
+    they belong to a single workspace.
+
+    Each job can be assigned to a job group, so that pending jobs that were superseded by newer ones can be cancelled
+    together.
+    """
+    def __init__(self, num_workers, thread_name_prefix):
+        self.num_workers = num_workers
+        self._thread_name_prefix = thread_name_prefix
+        # priority -> workspace id -> pending jobs of the workspace; the order of the workspaces is the round robin order
+        self.pending_jobs: Dict[JobPriority, OrderedDict] = {priority: OrderedDict() for priority in JobPriority}
+        self.workers = []
+        # the number of waiting workers that were not yet notified about a new job; a submitted job reserves one of
+        # them, so that jobs submitted together do not all count on the same idle worker
+        self.num_idle_workers = 0
+        self.condition = threading.Condition()
+
+    def submit(self, method, args, priority: JobPriority, workspace_id=None, job_group: Hashable = None) -> Future:
+        future = Future()
+        with self.condition:
+            self.pending_jobs[priority].setdefault(workspace_id, deque()).append(
+                _Job(future=future, method=method, args=args, job_group=job_group))
+            if self.num_idle_workers > 0:
+                self.num_idle_workers -= 1
+                self.condition.notify()
+            elif len(self.workers) < self.num_workers:
+                worker = threading.Thread(target=self._work, name=f"{self._thread_name_prefix}_{len(self.workers)}",
+                                          daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        return future
+
+    def cancel_pending_jobs(self, job_group: Hashable) -> int:
+        """
+        Cancel the jobs of *job_group* that have not started running. The done callbacks of these jobs are called with
+        a cancelled future.
+        :return: the number of cancelled jobs
+        """
+        cancelled_jobs = []
+        with self.condition:
+            for workspace_to_jobs in self.pending_jobs.values():
+                for workspace_id, jobs in list(workspace_to_jobs.items()):
+                    cancelled_jobs.extend(job for job in jobs if job.job_group == job_group)
+                    remaining_jobs = deque(job for job in jobs if job.job_group != job_group)
+                    if len(remaining_jobs) > 0:
+                        workspace_to_jobs[workspace_id] = remaining_jobs
+                    else:
+                        del workspace_to_jobs[workspace_id]
+        # done callbacks are called by cancel(), so it is called without holding the lock
+        return sum(job.future.cancel() for job in cancelled_jobs)
+
+    def get_pending_job_counts(self) -> Dict[JobPriority, int]:
+        with self.condition:
+            return {priority: sum(len(jobs) for jobs in workspace_to_jobs.values())
+                    for priority, workspace_to_jobs in self.pending_jobs.items()}
+
+    def _get_next_job(self) -> _Job:
+        with self.condition:
+            while True:
+                for priority in JobPriority:
+                    workspace_to_jobs = self.pending_jobs[priority]
+                    if len(workspace_to_jobs) > 0:
+                        workspace_id, jobs = workspace_to_jobs.popitem(last=False)
+                        job = jobs.popleft()
+                        if len(jobs) > 0:  # the workspace moves to the end of the round
+                            workspace_to_jobs[workspace_id] = jobs
+                        return job
+                # the count is decreased by the submit() call that notifies this worker
+                self.num_idle_workers += 1
+                self.condition.wait()
+
+    def _work(self):
+        while True:
+            job = self._get_next_job()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = job.method(*job.args)
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
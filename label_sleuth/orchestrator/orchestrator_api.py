@@ -14,16 +14,15 @@
 #
 
 import functools
-import itertools
 import logging
 import os
 import sys
+import threading
 import time
 
 from collections import Counter, defaultdict
-from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import datetime
-from typing import Mapping, List, Sequence, Union, Tuple
+from typing import Iterable, Mapping, List, Sequence, Union, Tuple
 
 import jsonpickle
 import pandas as pd
@@ -37,24 +36,30 @@ from label_sleuth.data_access.data_access_api import DataAccessApi
 from label_sleuth.data_access.label_import_utils import process_labels_dataframe
 from label_sleuth.data_access.processors.csv_processor import CsvFileProcessor
 from label_sleuth.definitions import ACTIVE_LEARNING_SUGGESTION_COUNT
-from label_sleuth.models.core.model_api import ModelStatus
+from label_sleuth.models.core.model_api import INFER_CHUNK_SIZE, ModelStatus, split_into_chunks
 from label_sleuth.models.core.catalog import ModelsCatalog
 from label_sleuth.models.core.model_type import ModelType
 from label_sleuth.models.core.models_factory import ModelFactory
 from label_sleuth.models.core.prediction import Prediction
 from label_sleuth.models.core.tools import SentenceEmbeddingService
+from label_sleuth.models.util.LRUCache import LRUCache
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+from label_sleuth.orchestrator.category_events import CategoryEvents, CategoryEventType, DebouncedCalls
 from label_sleuth.orchestrator.core.state_api.orchestrator_state_api import Category, Iteration, IterationStatus, \
     ModelInfo, OrchestratorStateApi
-from label_sleuth.orchestrator.utils import convert_text_elements_to_train_data
+from label_sleuth.orchestrator.dataset_predictions import DatasetPredictions, DatasetPredictionsBuilder
+from label_sleuth.orchestrator.job_scheduler import JobPriority
+from label_sleuth.orchestrator.utils import InferenceTotals, convert_text_elements_to_train_data
 from label_sleuth.training_set_selector.training_set_selector_factory import TrainingSetSelectionFactory
 
 # constants
 NUMBER_OF_MODELS_TO_KEEP = 2
 TRAIN_COUNTS_STR_KEY = "train_counts"
-
-# members
-new_data_infer_thread_pool = ThreadPoolExecutor(1)
+INFERENCE_PROGRESS_STR_KEY = "inference_progress"  # the fraction of the dataset inferred by the iteration model
+EXPORT_BATCH_SIZE = 10000  # number of rows in each batch of exported labels and predictions
+DATASET_PREDICTIONS_CACHE_SIZE = 10  # number of models whose predictions for the full dataset are kept in memory
+# label changes made within this time are followed by a single check of whether a new model should be trained
+TRAIN_CHECK_DELAY_SECONDS = 0.5
 
 
 class OrchestratorApi:
@@ -71,6 +76,19 @@ class OrchestratorApi:
         self.sentence_embedding_service = sentence_embedding_service
         self.training_set_selection_factory = training_set_selection_factory
         self.config = config
+        self.dataset_predictions = LRUCache(DATASET_PREDICTIONS_CACHE_SIZE)
+        self.dataset_predictions_lock = threading.Lock()
+        # (workspace_id, category_id) -> texts added to the dataset while an iteration of the category was in progress,
+        # which are inferred once the iteration is ready
+        self.texts_awaiting_iteration = defaultdict(list)
+        self.texts_awaiting_iteration_lock = threading.Lock()
+        # events about label and iteration changes, which trigger the training of new models and are streamed to the UI
+        self.events = CategoryEvents()
+        self.train_checks = DebouncedCalls(self._check_training, TRAIN_CHECK_DELAY_SECONDS)
+        self.events.add_listener(self._on_category_event)
+        self.orchestrator_state.add_iteration_listener(
+            lambda workspace_id, category_id:
+            self.events.publish(workspace_id, category_id, CategoryEventType.ITERATION_CHANGED))
         self._verify_model_and_language_compatibility()
 
     def get_all_dataset_names(self):
@@ -113,11 +131,7 @@ class OrchestratorApi:
                 raise e
     
     def get_workspaces_by_dataset_name(self, dataset_name: str):
-        workspaces_ids = []
-        for workspace_id in self.list_workspaces():
-            if self.get_dataset_name(workspace_id) == dataset_name:
-                workspaces_ids.append(workspace_id)
-        return workspaces_ids
+        return self.orchestrator_state.get_workspace_ids_by_dataset(dataset_name)
 
 
     def delete_dataset(self, dataset_name: str):
@@ -322,6 +336,11 @@ class OrchestratorApi:
             for cat, num_changes in changes_per_cat.items():
                 self.orchestrator_state.increase_label_change_count_since_last_train(workspace_id, cat, num_changes)
         self.data_access.set_labels(workspace_id, uri_to_label, apply_to_duplicate_texts)
+        for cat in {cat for labels_dict in uri_to_label.values() for cat in labels_dict.keys()}:
+            self.events.publish(workspace_id, cat, CategoryEventType.LABELS_CHANGED)
+        if update_label_counter:
+            for cat in changes_per_cat.keys():
+                self.events.publish(workspace_id, cat, CategoryEventType.LABEL_CHANGE_COUNT_INCREASED)
 
     def unset_labels(self, workspace_id: str, category_id: int, uris: Sequence[str], apply_to_duplicate_texts=True):
         """
@@ -334,6 +353,7 @@ class OrchestratorApi:
         """
         self.data_access.unset_labels(
             workspace_id, category_id, uris, apply_to_duplicate_texts=apply_to_duplicate_texts)
+        self.events.publish(workspace_id, category_id, CategoryEventType.LABELS_CHANGED)
 
     def get_label_counts(self, workspace_id: str, dataset_name: str, category_id: int, remove_duplicates=False,
                          counts_for_training=False) -> Mapping[Union[str, bool], int]:
@@ -397,9 +417,13 @@ class OrchestratorApi:
         logging.info(f"Marking iteration {iteration_index} model id {model_info.model_id} in "
                      f"workspace '{workspace_id}' in category id '{category_id}' as deleted, and deleting the model")
         self.orchestrator_state.mark_iteration_model_as_deleted(workspace_id, category_id, iteration_index)
+        with self.dataset_predictions_lock:
+            self.dataset_predictions.remove(model_info.model_id)
         model_api.delete_model(model_info.model_id)
 
     def _delete_category_models(self, workspace_id, category_id):
+        with self.texts_awaiting_iteration_lock:
+            self.texts_awaiting_iteration.pop((workspace_id, category_id), None)
         workspace = self.orchestrator_state.get_workspace(workspace_id)
         if workspace.categories[category_id] is not None:
             for idx in range(len(workspace.categories[category_id].iterations)):
@@ -448,6 +472,10 @@ class OrchestratorApi:
         new_iteration_index = len(self.orchestrator_state.get_all_iterations(workspace_id, category_id))
         logging.info(f"starting iteration {new_iteration_index} in background for workspace '{workspace_id}' "
                      f"category id '{category_id}'")
+        # inference jobs of previous iterations of the category that have not started yet are superseded by the new
+        # iteration
+        self.background_jobs_manager.cancel_pending_jobs(job_group=self._get_category_job_group(workspace_id,
+                                                                                                category_id))
         category = self.orchestrator_state.get_workspace(workspace_id).categories[category_id]
         self.orchestrator_state.add_iteration(workspace_id=workspace_id, category_id=category_id)
         train_set_selector = self.training_set_selection_factory.get_training_set_selector(
@@ -460,6 +488,14 @@ class OrchestratorApi:
         future.add_done_callback(functools.partial(self._train, workspace_id, category_id, model_type,
                                                    new_iteration_index))
 
+    @staticmethod
+    def _get_category_job_group(workspace_id, category_id):
+        """
+        Returns the job group of the background inference jobs of the category, see
+        BackgroundJobsManager.cancel_pending_jobs()
+        """
+        return workspace_id, category_id
+
     def _train(self, workspace_id, category_id, model_type, iteration_index, future):
         try:
             train_data = future.result()
@@ -500,7 +536,7 @@ class OrchestratorApi:
             }
         }
         model_id, future = model_api.train(train_data=train_data, language=self.config.language,
-                                           model_params=model_params)
+                                           model_params=model_params, workspace_id=workspace_id)
         model_status = model_api.get_model_status(model_id)
         model_info = ModelInfo(model_id=model_id, model_status=model_status, model_type=model_type,
                                train_statistics=train_statistics, creation_date=datetime.now())
@@ -531,42 +567,127 @@ class OrchestratorApi:
                                                         iteration_index=iteration_index, new_status=ModelStatus.ERROR)
             self.orchestrator_state.update_iteration_status(workspace_id, category_id, iteration_index,
                                                             IterationStatus.ERROR)
+            self._infer_texts_awaiting_iteration(workspace_id, category_id, iteration_index)
             return
 
         self.orchestrator_state.update_model_status(workspace_id=workspace_id, category_id=category_id,
                                                     iteration_index=iteration_index, new_status=ModelStatus.READY)
         self.orchestrator_state.update_iteration_status(workspace_id, category_id, iteration_index,
                                                         IterationStatus.RUNNING_INFERENCE)
-        iteration = self.get_all_iterations_for_category(workspace_id, category_id)[iteration_index]
-        model_info = iteration.model
+        logging.info(f"Successfully trained model id {model_id} for workspace '{workspace_id}' category id "
+                     f"'{category_id}' iteration {iteration_index}")
+        self._infer_full_dataset(workspace_id, category_id, iteration_index)
+
+    def _infer_full_dataset(self, workspace_id, category_id, iteration_index):
+        """
+        Launch a background inference job over the full dataset using the model of Iteration *iteration_index*. The
+        dataset is inferred in chunks, and the progress is stored in the iteration statistics after each chunk. Only
+        the elements and predictions of a single chunk are held in memory; the iteration statistics are accumulated
+        over the chunks in an InferenceTotals object.
+        """
+        iterations = self.get_all_iterations_for_category(workspace_id, category_id)
+        model_info = iterations[iteration_index].model
         model_api = self.model_factory.get_model_api(model_info.model_type)
         dataset_name = self.get_dataset_name(workspace_id)
-        elements = self.get_all_text_elements(dataset_name)
-        logging.info(f"Successfully trained model id {model_id} for workspace '{workspace_id}' category id "
-                     f"'{category_id}' iteration {iteration_index}. Running background inference for the full "
-                     f"dataset ({len(elements)} items)")
-        model_api.infer_by_id_async(model_id, items_to_infer=[{"text": element.text} for element in elements],
-                                    done_callback=functools.partial(self._infer_done_callback, workspace_id,
-                                                                    category_id, iteration_index))
+        num_texts = self.get_text_element_count(workspace_id)
+        previous_ready_models = [iteration.model for iteration in iterations[:iteration_index]
+                                 if iteration.status == IterationStatus.READY]
+        totals = InferenceTotals(previous_model=previous_ready_models[-1] if len(previous_ready_models) > 0 else None)
+        logging.info(f"Running background inference for the full dataset ({num_texts} items) using model id "
+                     f"{model_info.model_id} for workspace '{workspace_id}' category id '{category_id}' iteration "
+                     f"{iteration_index}")
+        model_api.infer_by_id_in_chunks_async(
+            model_info.model_id, self._get_dataset_text_chunks(dataset_name, num_texts), num_texts,
+            done_callback=functools.partial(self._infer_done_callback, workspace_id, category_id, iteration_index,
+                                            totals),
+            chunk_callback=functools.partial(self._add_inference_chunk_to_totals, totals),
+            progress_callback=functools.partial(self._report_inference_progress, workspace_id, category_id,
+                                                iteration_index),
+            workspace_id=workspace_id, job_group=self._get_category_job_group(workspace_id, category_id))
         # Inference is performed in the background. Once the infer job is complete the iteration flow continues in the
         # *_infer_done_callback* method
 
-    def _infer_done_callback(self, workspace_id, category_id, iteration_index, future):
+    def _get_dataset_text_chunks(self, dataset_name, num_texts) -> Iterable[List[str]]:
+        """
+        Iterate over the texts of the first *num_texts* elements of the dataset, in chunks of INFER_CHUNK_SIZE texts.
+        Elements added to the dataset after the inference was launched are not included, as they are inferred once the
+        iteration is ready (see _infer_texts_awaiting_iteration()).
+        """
+        num_remaining = num_texts
+        for elements in self.data_access.get_all_text_elements_batches(dataset_name, INFER_CHUNK_SIZE):
+            if num_remaining <= 0:
+                break
+            yield [element.text for element in elements[:num_remaining]]
+            num_remaining -= len(elements)
+
+    def _add_inference_chunk_to_totals(self, totals: InferenceTotals, texts: Sequence[str],
+                                       predictions: Sequence[Prediction]):
+        totals.predictions_builder.add_chunk(predictions)
+        totals.positive_count += sum(prediction.label is True for prediction in predictions)
+        if totals.previous_model is not None:
+            previous_model = totals.previous_model
+            try:
+                previous_model_predictions = self.model_factory.get_model_api(previous_model.model_type) \
+                    .infer_by_id(previous_model.model_id, [{"text": text} for text in texts])
+            except Exception:
+                logging.warning(f"Failed to infer using the previous model id {previous_model.model_id}, the fraction "
+                                f"of changed predictions will not be calculated", exc_info=True)
+                totals.previous_model = None
+                return
+            totals.changed_count += sum(x.label != y.label for x, y in zip(predictions, previous_model_predictions))
+
+    def _report_inference_progress(self, workspace_id, category_id, iteration_index, num_inferred, num_total):
+        logging.info(f"Inferred {num_inferred}/{num_total} items for workspace '{workspace_id}' category id "
+                     f"'{category_id}' iteration {iteration_index}")
+        self.orchestrator_state.add_iteration_statistics(workspace_id, category_id, iteration_index,
+                                                         {INFERENCE_PROGRESS_STR_KEY: num_inferred / num_total})
+
+    def resume_interrupted_iterations(self):
+        """
+        Resume the iterations whose flow was interrupted after the model was trained, e.g. by a server restart. The
+        inference over the full dataset is restarted; chunks that were inferred before the interruption are read from
+        the model prediction store, so the inference resumes from the last completed chunk.
+        """
+        interrupted_statuses = [IterationStatus.RUNNING_INFERENCE, IterationStatus.CALCULATING_STATISTICS,
+                                IterationStatus.RUNNING_ACTIVE_LEARNING]
+        for workspace in self.orchestrator_state.get_all_workspaces():
+            for category_id, category in workspace.categories.items():
+                if category is None or len(category.iterations) == 0:
+                    continue
+                iteration_index = len(category.iterations) - 1
+                iteration = category.iterations[iteration_index]
+                if iteration.status in interrupted_statuses and iteration.model.model_status == ModelStatus.READY:
+                    logging.info(f"Resuming iteration {iteration_index} of workspace '{workspace.workspace_id}' "
+                                 f"category id '{category_id}' (status was {iteration.status.name})")
+                    self.orchestrator_state.update_iteration_status(workspace.workspace_id, category_id,
+                                                                    iteration_index, IterationStatus.RUNNING_INFERENCE)
+                    self._infer_full_dataset(workspace.workspace_id, category_id, iteration_index)
+
+    def _infer_done_callback(self, workspace_id, category_id, iteration_index, totals: InferenceTotals, future):
         """
         Once model inference for Iteration *iteration_index* over the full dataset is complete, the flow of the
         iteration continues here. As part of this stage the active learning module recommendations are calculated.
         :param workspace_id:
         :param category_id:
         :param iteration_index:
+        :param totals: the totals accumulated over the chunks of the inference
         :param future: future object for the inference job, which was submitted through the BackgroundJobsManager
         """
+        if future.cancelled():
+            logging.info(f"Background inference on workspace '{workspace_id}' category id '{category_id}' iteration "
+                         f"{iteration_index} was cancelled, as it was superseded by a newer iteration. Deleting the "
+                         f"iteration model")
+            self.delete_iteration_model(workspace_id, category_id, iteration_index)
+            return
+
         try:
-            predictions = future.result()
+            num_inferred = future.result()
         except Exception:
             logging.exception(f"Background inference on workspace '{workspace_id}' category id '{category_id}' "
                               f"iteration {iteration_index} Failed. Marking iteration with Error")
             self.orchestrator_state.update_iteration_status(workspace_id, category_id, iteration_index,
                                                             IterationStatus.ERROR)
+            self._infer_texts_awaiting_iteration(workspace_id, category_id, iteration_index)
             return
 
         try:
@@ -574,11 +695,19 @@ class OrchestratorApi:
                          f" category id '{category_id}' iteration {iteration_index}, "
                          f"calculating statistics and updating active learning recommendations")
 
-            self._calculate_iteration_statistics(workspace_id, category_id, iteration_index, predictions)
+            self._calculate_iteration_statistics(workspace_id, category_id, iteration_index, num_inferred, totals)
+            # keep the predictions for the full dataset, so that views filtered by the predictions of this iteration
+            # are served from memory once it is ready
+            dataset_name = self.get_dataset_name(workspace_id)
+            uris = self.data_access.get_all_text_elements_uris(dataset_name)[:num_inferred]
+            is_duplicate = self.data_access.get_duplicate_text_mask(dataset_name)[:num_inferred]
+            dataset_predictions = totals.predictions_builder.build(uris, is_duplicate)
+            model_id = self.get_all_iterations_for_category(workspace_id, category_id)[iteration_index].model.model_id
+            with self.dataset_predictions_lock:
+                self.dataset_predictions.set(model_id, dataset_predictions)
 
             self.orchestrator_state.update_iteration_status(workspace_id, category_id,
                                                             iteration_index, IterationStatus.RUNNING_ACTIVE_LEARNING)
-            dataset_name = self.get_dataset_name(workspace_id)
             self._calculate_active_learning_recommendations(workspace_id, dataset_name, category_id,
                                                             ACTIVE_LEARNING_SUGGESTION_COUNT, iteration_index)
             self.orchestrator_state.update_iteration_status(workspace_id, category_id, iteration_index,
@@ -591,40 +720,30 @@ class OrchestratorApi:
                               f"Failed. Marking iteration with Error")
             self.orchestrator_state.update_iteration_status(workspace_id, category_id, iteration_index,
                                                             IterationStatus.ERROR)
+        self._infer_texts_awaiting_iteration(workspace_id, category_id, iteration_index)
         try:
             self._delete_old_models(workspace_id, category_id, iteration_index)
         except Exception:
             logging.exception(f"Failed to delete old models for workspace '{workspace_id}' category id '{category_id}' "
                               f"after iteration {iteration_index} finished successfully ")
 
-    def _calculate_iteration_statistics(self, workspace_id, category_id, iteration_index,
-                                        predictions: Sequence[Prediction]):
+    def _calculate_iteration_statistics(self, workspace_id, category_id, iteration_index, dataset_size: int,
+                                        totals: InferenceTotals):
         """
         Calculate some statistics about the *iteration_index* model and store them in the workspace
         :param workspace_id:
         :param category_id:
         :param iteration_index:
-        :param predictions: model predictions of the *iteration_index* model over the entire dataset
+        :param dataset_size: the number of elements inferred by the *iteration_index* model
+        :param totals: the totals accumulated over the inference of the full dataset by the *iteration_index* model
         """
-        dataset_name = self.get_dataset_name(workspace_id)
-        elements = self.get_all_text_elements(dataset_name)
-        dataset_size = len(predictions)
-
         # calculate the fraction of examples that receive a positive prediction from the current model
-        positive_count = sum([pred.label is True for pred in predictions])
-        positive_fraction = positive_count / dataset_size
-        post_train_statistics = {"positive_fraction": positive_fraction, "total_positive_count": positive_count}
+        positive_fraction = totals.positive_count / dataset_size
+        post_train_statistics = {"positive_fraction": positive_fraction, "total_positive_count": totals.positive_count}
 
         # calculate the fraction of predictions that changed between the previous model and the current model
-        previous_iterations = self.orchestrator_state.get_all_iterations(workspace_id, category_id)[:iteration_index]
-        previous_ready_iteration_indices = \
-            [candidate_iteration_index for candidate_iteration_index, iteration in enumerate(previous_iterations)
-             if iteration.status == IterationStatus.READY]
-        if len(previous_ready_iteration_indices) > 0:
-            previous_model_predictions = self.infer(workspace_id, category_id, elements,
-                                                    iteration_index=previous_ready_iteration_indices[-1])
-            num_identical = sum(x.label == y.label for x, y in zip(predictions, previous_model_predictions))
-            post_train_statistics["changed_fraction"] = (dataset_size - num_identical) / dataset_size
+        if totals.previous_model is not None:
+            post_train_statistics["changed_fraction"] = totals.changed_count / dataset_size
 
         logging.info(
             f"workspace {workspace_id} category {category_id} post train measurements for iteration {iteration_index}: {post_train_statistics}")
@@ -683,6 +802,25 @@ class OrchestratorApi:
                          f"{NUMBER_OF_MODELS_TO_KEEP} models are kept.")
             self.delete_iteration_model(workspace_id, category_id, candidate_iteration_index)
 
+    def _on_category_event(self, workspace_id: str, category_id: int, event_type: CategoryEventType):
+        """
+        Schedule a check of whether a new model should be trained when the label change counter of the category
+        increases, and when an iteration of the category is ready, as a new iteration is not started while the
+        previous one is in progress.
+        """
+        if event_type == CategoryEventType.LABEL_CHANGE_COUNT_INCREASED:
+            self.train_checks.call(workspace_id, category_id)
+        elif event_type == CategoryEventType.ITERATION_CHANGED:
+            iterations = self.orchestrator_state.get_all_iterations(workspace_id, category_id)
+            if len(iterations) > 0 and iterations[-1].status in [IterationStatus.READY, IterationStatus.ERROR]:
+                self.train_checks.call(workspace_id, category_id)
+
+    def _check_training(self, workspace_id: str, category_id: int):
+        # the workspace or category may have been deleted since the check was scheduled
+        if self.workspace_exists(workspace_id) \
+                and category_id in self.orchestrator_state.get_all_categories(workspace_id):
+            self.train_if_recommended(workspace_id, category_id)
+
     def train_if_recommended(self, workspace_id: str, category_id: int, force=False) -> Union[None, str]:
         """
         Check if the minimal threshold for training a new model has been met, and if so, start the flow of a
@@ -764,9 +902,23 @@ class OrchestratorApi:
         if len(elements_to_infer) == 0:
             return []
 
+        iteration, _ = self._get_iteration_for_inference(workspace_id, category_id, iteration_index)
+        model_info = iteration.model
+        model_api = self.model_factory.get_model_api(model_info.model_type)
+        list_of_dicts = [{"text": element.text} for element in elements_to_infer]
+        predictions = model_api.infer_by_id(model_id=model_info.model_id, items_to_infer=list_of_dicts,
+                                            use_cache=use_cache)
+        return predictions
+
+    def _get_iteration_for_inference(self, workspace_id, category_id, iteration_index=None) -> Tuple[Iteration, int]:
+        """
+        :param iteration_index: iteration to use. If set to None, the latest ready iteration for the category is used
+        :return: a tuple of the iteration and its index
+        """
         iterations = self.get_all_iterations_for_category(workspace_id, category_id)
         if iteration_index is None:  # use the latest ready model
-            iteration = [it for it in iterations if it.status == IterationStatus.READY][-1]
+            iteration_index = [idx for idx, it in enumerate(iterations) if it.status == IterationStatus.READY][-1]
+            iteration = iterations[iteration_index]
         else:
             iteration = iterations[iteration_index]
             if iteration.status in [IterationStatus.PREPARING_DATA, IterationStatus.TRAINING,
@@ -780,12 +932,39 @@ class OrchestratorApi:
         if model_info.model_status != ModelStatus.READY:
             raise Exception(f"model id {model_info.model_id} is not in READY status "
                             f"while iteration status is {iteration.status}.  Something went wrong")
+        return iteration, iteration_index
 
-        model_api = self.model_factory.get_model_api(model_info.model_type)
-        list_of_dicts = [{"text": element.text} for element in elements_to_infer]
-        predictions = model_api.infer_by_id(model_id=model_info.model_id, items_to_infer=list_of_dicts,
-                                            use_cache=use_cache)
-        return predictions
+    def get_dataset_predictions(self, workspace_id: str, category_id: int, iteration_index: int = None) \
+            -> DatasetPredictions:
+        """
+        Get the predictions of the model of the given iteration for all the elements of the dataset, aligned with the
+        order of the dataset. These are kept in memory for the most recently used models, and recomputed (mostly from
+        the cached model predictions) if elements were added to the dataset since they were calculated.
+        :param workspace_id:
+        :param category_id:
+        :param iteration_index: iteration to use. If set to None, the latest model for the category will be used
+        :return: a DatasetPredictions object
+        """
+        iteration, iteration_index = self._get_iteration_for_inference(workspace_id, category_id, iteration_index)
+        model_id = iteration.model.model_id
+        with self.dataset_predictions_lock:
+            dataset_predictions = self.dataset_predictions.get(model_id)
+        num_texts = self.get_text_element_count(workspace_id)
+        if dataset_predictions is None or len(dataset_predictions) != num_texts:
+            start = time.time()
+            dataset_name = self.get_dataset_name(workspace_id)
+            # the dataset is inferred in chunks, so only the elements and predictions of one chunk are held in memory
+            builder = DatasetPredictionsBuilder()
+            model_api = self.model_factory.get_model_api(iteration.model.model_type)
+            model_api.infer_by_id_in_chunks(model_id, self._get_dataset_text_chunks(dataset_name, num_texts), num_texts,
+                                            chunk_callback=lambda texts, predictions: builder.add_chunk(predictions))
+            dataset_predictions = builder.build(self.data_access.get_all_text_elements_uris(dataset_name)[:num_texts],
+                                                self.data_access.get_duplicate_text_mask(dataset_name)[:num_texts])
+            with self.dataset_predictions_lock:
+                self.dataset_predictions.set(model_id, dataset_predictions)
+            logging.info(f"calculating the predictions of model id {model_id} for the full dataset "
+                         f"({num_texts} items) took {time.time() - start}")
+        return dataset_predictions
 
     # Labeling/Evaluation reports
 
@@ -827,8 +1006,7 @@ class OrchestratorApi:
 
         # since we don't want a new model to train while labeling in precision evaluation mode, we only update the
         # labeling counts after evaluation is finished
-        self.orchestrator_state.increase_label_change_count_since_last_train(workspace_id, category_id,
-                                                                             changed_elements_count)
+        self.increase_label_change_count_since_last_train(workspace_id, category_id, changed_elements_count)
         return estimated_precision
 
     def increase_label_change_count_since_last_train(self, workspace_id, category_id, changed_elements_count):
@@ -839,14 +1017,15 @@ class OrchestratorApi:
         """
         self.orchestrator_state.increase_label_change_count_since_last_train(workspace_id, category_id,
                                                                              changed_elements_count)
+        self.events.publish(workspace_id, category_id, CategoryEventType.LABEL_CHANGE_COUNT_INCREASED)
 
     def get_elements_by_prediction(self, workspace_id, category_id, required_prediction, sample_size, start_idx=0,
                                    shuffle=False, random_state=0, remove_duplicates=True) -> List[TextElement]:
         """
-        Get elements in the given workspace that received a positive prediction from the latest classification model
+        Get elements in the given workspace that received the required prediction from the latest classification model
         for the category.
-        As finding and returning _all_ the positively predicted elements is expensive, this method only collects as many
-        elements as is required by the request, namely up to *sample_size + start_idx* positively predicted elements.
+        The elements are a slice of the rows with the required prediction in the predictions of the model for the full
+        dataset (see get_dataset_predictions()), so only the requested elements are fetched from the dataset.
 
         :param workspace_id:
         :param category_id:
@@ -857,26 +1036,12 @@ class OrchestratorApi:
         :param random_state: provide an int seed to define a random state. Default is zero.
         :param remove_duplicates: if True, do not include elements that are duplicates of each other.
         """
-
-        def batched(iterable, batch_size=100):
-            it = iter(iterable)
-            while batch := list(itertools.islice(it, batch_size)):
-                yield batch
-
         dataset_name = self.get_dataset_name(workspace_id)
-        elements_with_required_prediction = []
-        # we fetch and infer text elements in batches, and collect those elements that match the required prediction
-        element_batch_iterator = batched(
-            self.data_access.get_text_element_iterator(workspace_id, dataset_name, shuffle=shuffle,
-                                                       random_state=random_state, remove_duplicates=remove_duplicates))
-        for element_batch in element_batch_iterator:
-            batch_predictions = self.infer(workspace_id, category_id, element_batch)
-            for element, prediction in zip(element_batch, batch_predictions):
-                if prediction.label == required_prediction:
-                    elements_with_required_prediction.append(element)
-            if len(elements_with_required_prediction) >= start_idx + sample_size:
-                break  # we have collected enough elements
-        return elements_with_required_prediction[start_idx:start_idx + sample_size]
+        dataset_predictions = self.get_dataset_predictions(workspace_id, category_id)
+        rows = dataset_predictions.get_rows(required_prediction, shuffle=shuffle, random_state=random_state,
+                                            remove_duplicates=remove_duplicates)
+        uris = dataset_predictions.get_uris(rows[start_idx:start_idx + sample_size])
+        return self.data_access.get_text_elements_by_uris(workspace_id, dataset_name, uris)
 
     def get_progress(self, workspace_id: str, dataset_name: str, category_id: int):
         category_label_counts = self.get_label_counts(workspace_id, dataset_name, category_id, remove_duplicates=True,
@@ -920,23 +1085,23 @@ class OrchestratorApi:
                 category_name_to_id[category_name] = category_id
                 categories_created.append(category_name)
 
-        for category_name, uri_to_label in imported_categories_to_uris_and_labels.items():
+        # the labels of all the categories are set in a single batch
+        uri_to_label = defaultdict(dict)
+        for category_name, category_uri_to_label in imported_categories_to_uris_and_labels.items():
             # switch from category_name to the corresponding category_id
             category_id = category_name_to_id[category_name]
-            uri_to_label = {uri: {category_id: label} for uri, cat_to_label in uri_to_label.items()
-                            for category_name, label in cat_to_label.items()}
-            if len(uri_to_label) == 0:
-                logging.info(f"found 0 elements for category {category_name}")
-            else:
-                logging.info(f'{category_name}: adding labels for {len(uri_to_label)} uris')
-                self.set_labels(workspace_id, uri_to_label,
-                                apply_to_duplicate_texts=False,
-                                update_label_counter=True)
-
+            for uri, cat_to_label in category_uri_to_label.items():
+                uri_to_label[uri][category_id] = cat_to_label[category_name]
+            logging.info(f'{category_name}: adding labels for {len(category_uri_to_label)} uris')
+            categories_counter[category_id] = len(category_uri_to_label)
+        if len(uri_to_label) > 0:
+            self.set_labels(workspace_id, dict(uri_to_label), apply_to_duplicate_texts=False,
+                            update_label_counter=True)
+
+        for category_id in categories_counter:
             label_counts_dict = self.get_label_counts(workspace_id, dataset_name, category_id, remove_duplicates=False)
             logging.info(f"Updated total label count in workspace '{workspace_id}' for category id {category_id} "
                          f"is {sum(label_counts_dict.values())} ({label_counts_dict})")
-            categories_counter[category_id] = len(uri_to_label)
         # TODO return both positive and negative counts
         categories_counter_list = [{'category_id': key, 'counter': value} for key, value in categories_counter.items()]
         total = sum(categories_counter.values())
@@ -957,19 +1122,34 @@ class OrchestratorApi:
         :param labeled_only: only export elements as they were labeled by the user. If set to False, use the
         TrainingSetSelectionStrategy to determine the exported elements
         """
+        batches = list(self.export_workspace_labels_batches(workspace_id, labeled_only))
+        return pd.concat(batches, ignore_index=True) if len(batches) > 0 else pd.DataFrame([])
+
+    def export_workspace_labels_batches(self, workspace_id, labeled_only, batch_size=EXPORT_BATCH_SIZE) \
+            -> Iterable[pd.DataFrame]:
+        """
+        Iterate over all user labels from the workspace, as DataFrames of up to *batch_size* labels each. Each row is a
+        label for a specific element for a specific category. Column names for the various fields are listed under
+        DisplayFields.
+
+        :param workspace_id:
+        :param labeled_only: only export elements as they were labeled by the user. If set to False, use the
+        TrainingSetSelectionStrategy to determine the exported elements
+        :param batch_size:
+        """
         dataset_name = self.get_dataset_name(workspace_id)
         categories = self.get_all_categories(workspace_id)
-        list_of_dicts = []
+        total_count = 0
 
         for category_id, category in categories.items():
             label_counts = self.get_label_counts(workspace_id, dataset_name, category_id, False,
                                                  counts_for_training=True)
-            total_count = sum(label_counts.values())
+            category_count = sum(label_counts.values())
 
             if labeled_only or label_counts[LABEL_POSITIVE] == 0:  # if there are no positive elements,
                 # training set selector cannot be used, so we only use the labeled elements
                 logging.info(f"Labeled elements for category {category.name} ({category_id}) in workspace "
-                             f"'{workspace_id}' is {total_count}")
+                             f"'{workspace_id}' is {category_count}")
                 text_elements = self.data_access.get_labeled_text_elements(workspace_id, dataset_name, category_id,
                                                                            remove_duplicates=False)['results']
             else:
@@ -982,28 +1162,57 @@ class OrchestratorApi:
                                                                  category_description=category.description)
                 logging.info(
                     f"Labeled elements size for category {category.name} ({category_id}) in workspace "
-                    f"'{workspace_id}' is {total_count}, exported elements size is {len(text_elements)}")
-
-            list_of_dicts.extend(
-                [{DisplayFields.workspace_id: workspace_id,
-                  DisplayFields.category_name: category.name,
-                  DisplayFields.doc_id: element.uri.split('-')[1],
-                  # TODO handle when handling uri/doc_id/element_id
-                  DisplayFields.dataset: dataset_name,
-                  DisplayFields.text: element.text,
-                  DisplayFields.uri: element.uri,
-                  DisplayFields.element_metadata: element.metadata,
-                  DisplayFields.label: element.category_to_label[category_id].label,
-                  # TODO uncomment when adding metadata
-                  # DisplayFields.label_metadata: le.category_to_label[category_id].metadata,
-                  DisplayFields.label_type: element.category_to_label[category_id].label_type.name
-                  }
-                 for element in text_elements])
+                    f"'{workspace_id}' is {category_count}, exported elements size is {len(text_elements)}")
+
+            for i in range(0, len(text_elements), batch_size):
+                yield pd.DataFrame(
+                    [{DisplayFields.workspace_id: workspace_id,
+                      DisplayFields.category_name: category.name,
+                      DisplayFields.doc_id: element.uri.split('-')[1],
+                      # TODO handle when handling uri/doc_id/element_id
+                      DisplayFields.dataset: dataset_name,
+                      DisplayFields.text: element.text,
+                      DisplayFields.uri: element.uri,
+                      DisplayFields.element_metadata: element.metadata,
+                      DisplayFields.label: element.category_to_label[category_id].label,
+                      # TODO uncomment when adding metadata
+                      # DisplayFields.label_metadata: le.category_to_label[category_id].metadata,
+                      DisplayFields.label_type: element.category_to_label[category_id].label_type.name
+                      }
+                     for element in text_elements[i:i + batch_size]])
+            total_count += len(text_elements)
+
+        logging.info(f"Exported a total of {total_count} elements from workspace '{workspace_id}'")
+
+    def export_predictions_batches(self, workspace_id, category_id, iteration_index=None,
+                                   batch_size=EXPORT_BATCH_SIZE) -> Iterable[pd.DataFrame]:
+        """
+        Get the predictions of the model from iteration *iteration_index* for all the elements of the dataset, as
+        DataFrames of up to *batch_size* elements each. The predictions are calculated (or retrieved from memory)
+        before this method returns, while the elements of each batch are only created once the batch is requested.
 
-        logging.info(
-            f"Exporting a total of {len(list_of_dicts)} elements from workspace '{workspace_id}'")
-
-        return pd.DataFrame(list_of_dicts)
+        :param workspace_id:
+        :param category_id:
+        :param iteration_index: iteration to use. If set to None, the latest model for the category will be used
+        :param batch_size:
+        """
+        dataset_name = self.get_dataset_name(workspace_id)
+        dataset_predictions = self.get_dataset_predictions(workspace_id, category_id, iteration_index)
+
+        def get_batches():
+            start = 0
+            for elements in self.data_access.get_all_text_elements_batches(dataset_name, batch_size):
+                # ignore elements that were added to the dataset after the predictions were calculated
+                elements = elements[:len(dataset_predictions) - start]
+                if len(elements) == 0:
+                    break
+                batch_df = pd.DataFrame([element.__dict__ for element in elements])
+                batch_df['score'] = dataset_predictions.scores[start:start + len(elements)]
+                batch_df['predicted_label'] = dataset_predictions.labels[start:start + len(elements)]
+                start += len(elements)
+                yield batch_df
+
+        return get_batches()
 
     def copy_model_dir_for_export(self, workspace_id, category_id, iteration_index):
         iteration = self.orchestrator_state.get_all_iterations(workspace_id, category_id)[iteration_index]
@@ -1018,66 +1227,101 @@ class OrchestratorApi:
         return os.path.join(exported_model_dir, os.pardir)
 
     def add_documents_from_file(self, dataset_name, temp_file_path):
-        global new_data_infer_thread_pool
         logging.info(f"adding documents to dataset '{dataset_name}'")
         documents = CsvFileProcessor(dataset_name, temp_file_path).build_documents()
         document_statistics = self.data_access.add_documents(dataset_name, documents)
+        # only the unique texts of the new documents need to be inferred by the existing models; texts identical to
+        # those already in the dataset are found in the model prediction stores
+        new_texts = list(dict.fromkeys(element.text for document in documents for element in document.text_elements))
         workspaces_to_update = []
-        total_infer_jobs = 0
-        for workspace_id in self.list_workspaces():
-            if self.get_dataset_name(workspace_id) == dataset_name:
-                workspaces_to_update.append(workspace_id)
-
-                for category_id, category in self.get_all_categories(workspace_id).items():
-                    if self.config.apply_labels_to_duplicate_texts:
-                        # since new data may contain texts identical to existing labeled texts, we set all the existing
-                        # labels again to apply the labels to the new data
-                        labeled_elements = self.data_access.get_labeled_text_elements(workspace_id, dataset_name,
-                                                                                      category_id)['results']
-                        if len(labeled_elements) > 0:
-                            uri_to_label = {te.uri: te.category_to_label for te in labeled_elements}
-                            self.data_access.set_labels(workspace_id, uri_to_label, apply_to_duplicate_texts=True)
-
-                    if len(category.iterations) > 0:
-                        iteration_index = len(category.iterations) - 1
-                        new_data_infer_thread_pool.submit(self._infer_missing_elements, workspace_id, category_id,
-                                                          dataset_name, iteration_index)
-                        total_infer_jobs += 1
-        logging.info(f"done adding documents to {dataset_name} upload statistics: {document_statistics}."
-                     f"{total_infer_jobs} infer jobs were submitted in the background")
+        model_type_to_model_ids = defaultdict(list)
+        for workspace_id in self.get_workspaces_by_dataset_name(dataset_name):
+            workspaces_to_update.append(workspace_id)
+
+            for category_id, category in self.get_all_categories(workspace_id).items():
+                if self.config.apply_labels_to_duplicate_texts:
+                    # since new data may contain texts identical to existing labeled texts, we set all the existing
+                    # labels again to apply the labels to the new data
+                    labeled_elements = self.data_access.get_labeled_text_elements(workspace_id, dataset_name,
+                                                                                  category_id)['results']
+                    if len(labeled_elements) > 0:
+                        uri_to_label = {te.uri: te.category_to_label for te in labeled_elements}
+                        self.data_access.set_labels(workspace_id, uri_to_label, apply_to_duplicate_texts=True)
+
+                if len(category.iterations) > 0:
+                    model_info = self._get_model_for_new_texts(workspace_id, category_id, new_texts)
+                    if model_info is not None:
+                        model_type_to_model_ids[model_info.model_type].append(model_info.model_id)
+
+        for model_type, model_ids in model_type_to_model_ids.items():
+            self._infer_new_texts_async(model_type, model_ids, new_texts)
+        logging.info(f"done adding documents to {dataset_name} upload statistics: {document_statistics}. "
+                     f"Inference of {len(new_texts)} new texts was submitted in the background for "
+                     f"{sum(len(model_ids) for model_ids in model_type_to_model_ids.values())} models")
         return document_statistics, workspaces_to_update
 
-    def _infer_missing_elements(self, workspace_id, category_id, dataset_name, iteration_index):
-        iteration_status = self.get_iteration_status(workspace_id, category_id, iteration_index)
-        if iteration_status == IterationStatus.ERROR:
-            logging.error(
-                f"Cannot run inference for category id {category_id} in workspace '{workspace_id}' after new documents "
-                f"were loaded to dataset '{dataset_name}' using model {iteration_index}, as the iteration status "
-                f"is ERROR")
-            return
-        # if *model_id* is currently training, wait for training to complete
-        start_time = time.time()
-        while iteration_status != IterationStatus.READY:
-            wait_time = time.time() - start_time
-            if wait_time > 15 * 60:
-                logging.error(f"Timeout reached when waiting to run inference with the last model for category id "
-                              f"{category_id} in workspace '{workspace_id}' after new documents were loaded to "
-                              f"dataset '{dataset_name}' using model {iteration_index}")
+    def _get_model_for_new_texts(self, workspace_id, category_id, new_texts) -> Union[ModelInfo, None]:
+        """
+        Returns the model of the latest iteration of the category if it is ready to infer texts that were added to the
+        dataset. If the latest iteration is still in progress, *new_texts* are kept, and inferred once the iteration
+        is done (see _infer_texts_awaiting_iteration()).
+        """
+        iteration_index = len(self.get_all_iterations_for_category(workspace_id, category_id)) - 1
+        # the lock guarantees that the texts are inferred even if the iteration is completed at the same time
+        with self.texts_awaiting_iteration_lock:
+            iteration = self.get_all_iterations_for_category(workspace_id, category_id)[iteration_index]
+            if iteration.status == IterationStatus.READY:
+                return iteration.model
+            if iteration.status in [IterationStatus.ERROR, IterationStatus.MODEL_DELETED]:
+                logging.error(f"Cannot run inference for category id {category_id} in workspace '{workspace_id}' "
+                              f"after new documents were loaded using model {iteration_index}, as the iteration "
+                              f"status is {iteration.status.name}")
+                return None
+            logging.info(f"new documents will be inferred once iteration {iteration_index} is done for category id "
+                         f"{category_id} in workspace '{workspace_id}'")
+            self.texts_awaiting_iteration[(workspace_id, category_id)].extend(new_texts)
+            return None
+
+    def _infer_texts_awaiting_iteration(self, workspace_id, category_id, iteration_index):
+        """
+        Called once Iteration *iteration_index* is done. If texts were added to the dataset while the iteration was in
+        progress, they are inferred using the iteration model if it is ready, and otherwise they are dropped (the next
+        iteration infers the full dataset).
+        """
+        with self.texts_awaiting_iteration_lock:
+            texts = self.texts_awaiting_iteration.pop((workspace_id, category_id), None)
+            if texts is None:
                 return
-            logging.info(f"waiting for iteration {iteration_index} to complete in order to infer newly added documents"
-                         f" for category id {category_id} in workspace '{workspace_id}'")
-            time.sleep(30)
-            iteration_status = self.get_iteration_status(workspace_id, category_id, iteration_index)
-
-        logging.info(f"Running inference with the latest model for category id {category_id} in workspace "
-                     f"'{workspace_id}' after new documents were loaded to dataset '{dataset_name}' "
-                     f"using model {iteration_index}")
-        # Currently, there is no indication to the user that inference is running on the new documents, and there is no
-        # indication for when this inference ends. Can be added and reflected in the UI in the future
-        self.infer(workspace_id, category_id, self.get_all_text_elements(dataset_name), iteration_index)
-        logging.info(f"completed inference with the latest model for category id {category_id} in workspace "
-                     f"'{workspace_id}' after new documents were loaded to dataset '{dataset_name}',"
-                     f"using model {iteration_index}")
+            iteration = self.get_all_iterations_for_category(workspace_id, category_id)[iteration_index]
+        if iteration.status != IterationStatus.READY:
+            logging.error(f"Cannot run inference for category id {category_id} in workspace '{workspace_id}' after new "
+                          f"documents were loaded using model {iteration_index}, as the iteration status is "
+                          f"{iteration.status.name}")
+            return
+        self._infer_new_texts_async(iteration.model.model_type, [iteration.model.model_id],
+                                    list(dict.fromkeys(texts)))
+
+    def _infer_new_texts_async(self, model_type: ModelType, model_ids: Sequence[str], texts: Sequence[str]):
+        """
+        Launch a single background job that infers *texts* using each of the *model_ids* of *model_type*
+        """
+        model_api = self.model_factory.get_model_api(model_type)
+
+        def infer_new_texts():
+            for model_id in model_ids:
+                model_api.infer_by_id_in_chunks(model_id, split_into_chunks(texts), len(texts))
+
+        def log_inference_done(future):
+            if future.exception() is not None:
+                logging.error(f"Failed to infer {len(texts)} new texts using {model_type.name} models {model_ids}",
+                              exc_info=future.exception())
+            else:
+                logging.info(f"completed inference of {len(texts)} new texts using {model_type.name} models "
+                             f"{model_ids}")
+
+        self.background_jobs_manager.add_background_job(infer_new_texts, args=(), use_gpu=model_api.gpu_support,
+                                                        done_callback=log_inference_done,
+                                                        priority=JobPriority.BULK_INFERENCE)
 
     def preload_dataset(self, workspace_id):
         """
@@ -18,7 +18,7 @@ import unittest
 from unittest.mock import MagicMock
 
 from label_sleuth.models.core.prediction import Prediction
-from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager, PROCESS_BACKEND
 
 DUMMY_PREDICTIONS = [Prediction(True, 0.54), Prediction(False, 0.22)]
 
@@ -85,3 +85,17 @@ class TestBackgroundJobsManager(unittest.TestCase):
                                             done_callback=functools.partial(callback_mock, dummy_callback_data))
         self.assertRaises(Exception, future.result)
         callback_mock.assert_called_once_with(dummy_callback_data, future)
+
+    def test_process_job(self):
+        callback_mock = MagicMock(name='callback')
+        manager = BackgroundJobsManager(executor_backend=PROCESS_BACKEND)
+        self.assertTrue(manager.uses_worker_processes(use_gpu=False))
+        mid = 123
+        dummy_callback_data = "workspace1"
+        future = manager.add_process_job(successful_train, (mid, ["dummy"]),
+                                         done_callback=functools.partial(callback_mock, dummy_callback_data))
+        self.assertEqual(mid, future.result())
+        failed_future = manager.add_process_job(train_failed_with_error, (mid, ["dummy"]), done_callback=None)
+        self.assertRaises(Exception, failed_future.result)
+        manager.process_executor.shutdown()  # waits for the done callbacks
+        callback_mock.assert_called_once_with(dummy_callback_data, future)
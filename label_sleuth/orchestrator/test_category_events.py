@@ -0,0 +1,67 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from label_sleuth.orchestrator.category_events import CategoryEvents, CategoryEventType, DebouncedCalls
+
+
+class TestCategoryEvents(unittest.TestCase):
+    def test_publish_to_listeners_and_subscribers(self):
+        events = CategoryEvents()
+        failing_listener = MagicMock(side_effect=Exception("listener failure"))
+        listener = MagicMock()
+        events.add_listener(failing_listener)
+        events.add_listener(listener)
+
+        with events.subscribe('ws', 1) as event_queue:
+            events.publish('ws', 1, CategoryEventType.LABELS_CHANGED)
+            events.publish('ws', 2, CategoryEventType.ITERATION_CHANGED)
+            self.assertEqual(CategoryEventType.LABELS_CHANGED, event_queue.get_nowait())
+            self.assertTrue(event_queue.empty(), msg="events of other categories should not be received")
+        self.assertEqual(0, len(events.subscriber_queues))
+
+        # a failing listener does not prevent the other listeners from receiving the event
+        self.assertEqual(2, listener.call_count)
+        listener.assert_called_with('ws', 2, CategoryEventType.ITERATION_CHANGED)
+
+
+class TestDebouncedCalls(unittest.TestCase):
+    def test_calls_are_coalesced(self):
+        done = threading.Event()
+        calls = []
+
+        def function(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                done.set()
+
+        debounced = DebouncedCalls(function, delay_seconds=0.2)
+        for _ in range(5):
+            debounced.call('ws', 1)
+        debounced.call('ws', 2)
+        self.assertTrue(done.wait(timeout=5))
+        self.assertCountEqual([('ws', 1), ('ws', 2)], calls)
+
+        # once the function started running, a new call is scheduled again
+        done.clear()
+        debounced.call('ws', 1)
+        debounced.call('ws', 1)
+        calls.clear()
+        calls.append(None)
+        self.assertTrue(done.wait(timeout=5))
+        self.assertListEqual([None, ('ws', 1)], calls)
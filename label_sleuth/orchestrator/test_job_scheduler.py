@@ -0,0 +1,96 @@
+#
+#  Copyright (c) 2022 IBM Corp.
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import threading
+import time
+import unittest
+
+from label_sleuth.orchestrator.job_scheduler import JobPriority, JobScheduler
+
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = JobScheduler(1, thread_name_prefix="test_scheduler")
+        self.started_jobs = []
+        # the single worker is kept busy until all the jobs of the test are submitted
+        self.release_worker = threading.Event()
+        worker_started = threading.Event()
+
+        def block_worker():
+            worker_started.set()
+            self.release_worker.wait()
+
+        self.scheduler.submit(block_worker, (), priority=JobPriority.TRAINING)
+        worker_started.wait()
+
+    def submit(self, name, priority, workspace_id=None, job_group=None):
+        return self.scheduler.submit(self.started_jobs.append, (name,), priority=priority, workspace_id=workspace_id,
+                                     job_group=job_group)
+
+    def test_priority_order(self):
+        futures = [self.submit("report", JobPriority.REPORTS),
+                   self.submit("bulk_inference", JobPriority.BULK_INFERENCE),
+                   self.submit("inference", JobPriority.ACTIVE_LEARNING_INFERENCE),
+                   self.submit("train", JobPriority.TRAINING)]
+        self.assertEqual({JobPriority.TRAINING: 1, JobPriority.ACTIVE_LEARNING_INFERENCE: 1,
+                          JobPriority.BULK_INFERENCE: 1, JobPriority.REPORTS: 1},
+                         self.scheduler.get_pending_job_counts())
+        self.release_worker.set()
+        for future in futures:
+            future.result()
+        self.assertListEqual(["train", "inference", "bulk_inference", "report"], self.started_jobs)
+
+    def test_round_robin_between_workspaces(self):
+        futures = [self.submit(f"ws1_{i}", JobPriority.BULK_INFERENCE, workspace_id="ws1") for i in range(3)]
+        futures += [self.submit(f"ws2_{i}", JobPriority.BULK_INFERENCE, workspace_id="ws2") for i in range(2)]
+        self.release_worker.set()
+        for future in futures:
+            future.result()
+        self.assertListEqual(["ws1_0", "ws2_0", "ws1_1", "ws2_1", "ws1_2"], self.started_jobs)
+
+    def test_cancel_pending_jobs(self):
+        cancelled_future = self.submit("old_iteration", JobPriority.ACTIVE_LEARNING_INFERENCE, workspace_id="ws1",
+                                       job_group=("ws1", 0))
+        other_group_future = self.submit("other_category", JobPriority.ACTIVE_LEARNING_INFERENCE, workspace_id="ws1",
+                                         job_group=("ws1", 1))
+        self.assertEqual(1, self.scheduler.cancel_pending_jobs(("ws1", 0)))
+        self.assertTrue(cancelled_future.cancelled())
+        self.release_worker.set()
+        other_group_future.result()
+        self.assertListEqual(["other_category"], self.started_jobs)
+
+    def test_jobs_submitted_together_run_concurrently(self):
+        num_workers = 4
+        scheduler = JobScheduler(num_workers, thread_name_prefix="test_concurrent_scheduler")
+        # all the workers are started and become idle before the jobs are submitted
+        scheduler.submit(time.sleep, (0,), priority=JobPriority.TRAINING).result()
+        barrier = threading.Barrier(num_workers, timeout=5)
+        futures = [scheduler.submit(barrier.wait, (), priority=JobPriority.BULK_INFERENCE)
+                   for _ in range(num_workers)]
+        # each job waits until all the jobs are running, so it fails if the jobs do not run at the same time
+        for future in futures:
+            future.result(timeout=10)
+
+        # and again, once all the workers are idle
+        while scheduler.num_idle_workers < len(scheduler.workers):
+            time.sleep(0.01)
+        barrier.reset()
+        futures = [scheduler.submit(barrier.wait, (), priority=JobPriority.TRAINING) for _ in range(num_workers)]
+        for future in futures:
+            future.result(timeout=10)
+        self.assertEqual(num_workers, len(scheduler.workers))
+
+    def tearDown(self):
+        self.release_worker.set()
@@ -16,7 +16,9 @@
 import os
 import random
 import tempfile
+import time
 import unittest
+from concurrent.futures import Future
 from datetime import datetime
 from unittest.mock import patch
 
@@ -30,10 +32,14 @@ from label_sleuth.data_access.test_file_based_data_access import generate_corpus
 from label_sleuth.models.core.model_api import ModelStatus
 from label_sleuth.models.core.catalog import ModelsCatalog
 from label_sleuth.models.core.models_factory import ModelFactory
+from label_sleuth.models.core.prediction import Prediction
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
 from label_sleuth.orchestrator.core.state_api.orchestrator_state_api import OrchestratorStateApi, Iteration, \
     IterationStatus, ModelInfo
-from label_sleuth.orchestrator.orchestrator_api import OrchestratorApi, NUMBER_OF_MODELS_TO_KEEP
+from label_sleuth.orchestrator.category_events import CategoryEventType
+from label_sleuth.orchestrator.orchestrator_api import OrchestratorApi, NUMBER_OF_MODELS_TO_KEEP, \
+    TRAIN_CHECK_DELAY_SECONDS
+from label_sleuth.orchestrator.utils import InferenceTotals
 from label_sleuth.training_set_selector.training_set_selector_factory import TrainingSetSelectionFactory
 
 
@@ -240,6 +246,26 @@ class TestOrchestratorAPI(unittest.TestCase):
         self.assertEqual(0, num_changed, msg="we set a label with update_label_counter=False "
                                              "so number of changed element should be zero")
 
+    @patch.object(OrchestratorApi, 'train_if_recommended')
+    def test_set_labels_triggers_a_single_train_check(self, mock_train_if_recommended):
+        workspace_id = self.test_set_labels_triggers_a_single_train_check.__name__
+        dataset_name = f'{workspace_id}_dump'
+        generate_corpus(self.data_access, dataset_name)
+        self.orchestrator_api.create_workspace(workspace_id, dataset_name)
+        category_id = self.orchestrator_api.create_new_category(workspace_id, f'{workspace_id}_cat', 'description')
+        text_elements = self.orchestrator_api.get_all_text_elements(dataset_name)
+        with self.orchestrator_api.events.subscribe(workspace_id, category_id) as event_queue:
+            for text_element in text_elements[:3]:
+                self.orchestrator_api.set_labels(workspace_id,
+                                                 {text_element.uri: {category_id: Label(LABEL_POSITIVE)}})
+            self.assertEqual(CategoryEventType.LABELS_CHANGED, event_queue.get(timeout=1))
+            self.assertEqual(CategoryEventType.LABEL_CHANGE_COUNT_INCREASED, event_queue.get(timeout=1))
+        time.sleep(TRAIN_CHECK_DELAY_SECONDS + 1)
+        # checks that were scheduled by other tests may also run during this test
+        calls = [call for call in mock_train_if_recommended.call_args_list if call.args[0] == workspace_id]
+        self.assertEqual(1, len(calls), msg="label changes made together should trigger a single check")
+        self.assertEqual((workspace_id, category_id), calls[0].args)
+
     @patch.object(OrchestratorApi, 'delete_iteration_model')
     @patch.object(OrchestratorStateApi, 'get_all_iterations')
     def test_old_models_deletion(self, get_all_iterations, delete_iteration_model):
@@ -262,3 +288,97 @@ class TestOrchestratorAPI(unittest.TestCase):
 
         # _delete_old_models for iteration NUMBER_OF_MODELS_TO_KEEP should invoke delete_iteration_model for iteration 0
         delete_iteration_model.assert_called_with(workspace_id, category_id, 0)
+
+    @patch.object(OrchestratorApi, '_get_iteration_for_inference')
+    def test_get_elements_by_prediction(self, get_iteration_for_inference):
+        workspace_id = self.test_get_elements_by_prediction.__name__
+        dataset_name = f'{workspace_id}_dump'
+        generate_corpus(self.data_access, dataset_name, 5, add_duplicate=True)
+        self.orchestrator_api.create_workspace(workspace_id, dataset_name)
+        category_id = self.orchestrator_api.create_new_category(workspace_id, f'{workspace_id}_cat', 'description')
+        get_iteration_for_inference.return_value = \
+            (Iteration(IterationStatus.READY, ModelInfo(workspace_id, ModelStatus.READY, datetime.now(),
+                                                        ModelsCatalog.RAND, {}), {}, []), 0)
+        model_api = self.model_factory.get_model_api(ModelsCatalog.RAND)
+        infer_by_id_patch = patch.object(model_api, 'infer_by_id', side_effect=lambda model_id, items, **kwargs: [
+            Prediction(len(item['text']) % 2 == 0, len(item['text']) / 100) for item in items])
+        infer_by_id = infer_by_id_patch.start()
+        self.addCleanup(infer_by_id_patch.stop)
+
+        for required_prediction in [LABEL_POSITIVE, LABEL_NEGATIVE]:
+            for shuffle, remove_duplicates in [(False, False), (True, False), (True, True)]:
+                # the elements are identical to those collected by iterating over the dataset in the same order
+                expected = [e for e in self.data_access.get_text_element_iterator(
+                                workspace_id, dataset_name, shuffle=shuffle, random_state=3,
+                                remove_duplicates=remove_duplicates)
+                            if (len(e.text) % 2 == 0) == required_prediction]
+                elements = self.orchestrator_api.get_elements_by_prediction(
+                    workspace_id, category_id, required_prediction, sample_size=4, start_idx=2, shuffle=shuffle,
+                    random_state=3, remove_duplicates=remove_duplicates)
+                self.assertEqual(expected[2:6], elements)
+
+        # the predictions for the dataset are calculated once, in chunks, and reused for all the requests
+        self.assertEqual(1, infer_by_id.call_count)
+        self.assertEqual(self.orchestrator_api.get_text_element_count(workspace_id),
+                         len(infer_by_id.call_args.args[1]))
+
+    @patch.object(OrchestratorApi, '_get_dataset_text_chunks')
+    @patch.object(OrchestratorApi, '_delete_old_models')
+    @patch.object(OrchestratorApi, '_infer_texts_awaiting_iteration')
+    @patch.object(OrchestratorApi, '_calculate_active_learning_recommendations')
+    @patch.object(OrchestratorApi, '_calculate_iteration_statistics')
+    @patch.object(OrchestratorStateApi, 'update_iteration_status')
+    @patch.object(OrchestratorApi, 'get_all_iterations_for_category')
+    def test_dataset_predictions_kept_from_full_dataset_inference(self, get_all_iterations_for_category, *mocks):
+        get_dataset_text_chunks = mocks[-1]
+        workspace_id = self.test_dataset_predictions_kept_from_full_dataset_inference.__name__
+        dataset_name = f'{workspace_id}_dump'
+        generate_corpus(self.data_access, dataset_name, 5, add_duplicate=True)
+        self.orchestrator_api.create_workspace(workspace_id, dataset_name)
+        category_id = self.orchestrator_api.create_new_category(workspace_id, f'{workspace_id}_cat', 'description')
+        get_all_iterations_for_category.return_value = \
+            [Iteration(IterationStatus.READY, ModelInfo(workspace_id, ModelStatus.READY, datetime.now(),
+                                                        ModelsCatalog.RAND, {}), {}, [])]
+
+        # pass the predictions for the dataset to the inference callbacks, in chunks of 3 texts
+        totals = InferenceTotals()
+        texts = [e.text for e in self.orchestrator_api.get_all_text_elements(dataset_name)]
+        for start in range(0, len(texts), 3):
+            chunk = texts[start:start + 3]
+            self.orchestrator_api._add_inference_chunk_to_totals(
+                totals, chunk, [Prediction(len(text) % 2 == 0, len(text) / 100) for text in chunk])
+        future = Future()
+        future.set_result(len(texts))
+        self.orchestrator_api._infer_done_callback(workspace_id, category_id, 0, totals, future)
+
+        for required_prediction in [LABEL_POSITIVE, LABEL_NEGATIVE]:
+            expected = [e for e in self.data_access.get_text_element_iterator(workspace_id, dataset_name,
+                                                                              remove_duplicates=True)
+                        if (len(e.text) % 2 == 0) == required_prediction]
+            elements = self.orchestrator_api.get_elements_by_prediction(workspace_id, category_id, required_prediction,
+                                                                        sample_size=len(texts), remove_duplicates=True)
+            self.assertEqual(expected, elements)
+        # the dataset predictions were built from the inference results, without inferring the dataset again
+        get_dataset_text_chunks.assert_not_called()
+
+    @patch.object(OrchestratorApi, '_infer_new_texts_async')
+    @patch.object(OrchestratorApi, 'get_all_iterations_for_category')
+    def test_new_texts_inferred_once_iteration_is_ready(self, get_all_iterations_for_category, infer_new_texts_async):
+        workspace_id = self.test_new_texts_inferred_once_iteration_is_ready.__name__
+        model_info = ModelInfo("model_id", ModelStatus.READY, datetime.now(), ModelsCatalog.RAND, {})
+        iteration = Iteration(IterationStatus.RUNNING_INFERENCE, model_info, {}, [])
+        get_all_iterations_for_category.return_value = [iteration]
+
+        # the iteration is in progress, so the texts are kept until it is done
+        self.assertIsNone(self.orchestrator_api._get_model_for_new_texts(workspace_id, 0, ["text1", "text2"]))
+        self.assertIsNone(self.orchestrator_api._get_model_for_new_texts(workspace_id, 0, ["text2", "text3"]))
+        infer_new_texts_async.assert_not_called()
+
+        iteration.status = IterationStatus.READY
+        self.orchestrator_api._infer_texts_awaiting_iteration(workspace_id, 0, 0)
+        infer_new_texts_async.assert_called_once_with(ModelsCatalog.RAND, ["model_id"], ["text1", "text2", "text3"])
+
+        # once the iteration is ready, new texts are inferred immediately using its model
+        self.assertEqual(model_info, self.orchestrator_api._get_model_for_new_texts(workspace_id, 0, ["text4"]))
+        self.orchestrator_api._infer_texts_awaiting_iteration(workspace_id, 0, 0)
+        infer_new_texts_async.assert_called_once()
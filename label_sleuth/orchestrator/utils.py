@@ -13,9 +13,12 @@
 #  limitations under the License.
 #
 
-from typing import Mapping, Sequence
+from dataclasses import dataclass, field
+from typing import Mapping, Optional, Sequence
 
 from label_sleuth.data_access.core.data_structs import TextElement
+from label_sleuth.orchestrator.dataset_predictions import DatasetPredictionsBuilder
+from label_sleuth.orchestrator.core.state_api.orchestrator_state_api import ModelInfo
 
 
 def convert_text_elements_to_train_data(elements: Sequence[TextElement], category_id) -> Sequence[Mapping]:
@@ -34,3 +37,15 @@ def convert_text_elements_to_train_data(elements: Sequence[TextElement], categor
     return converted_data
 
 
+@dataclass
+class InferenceTotals:
+    """
+    Running totals over the chunks of the inference of the full dataset by the model of an iteration, from which the
+    iteration statistics are calculated without keeping the predictions for the full dataset in memory. The labels and
+    scores of the chunks are collected in a DatasetPredictionsBuilder, so the inference is not repeated in order to
+    serve the predictions of the iteration.
+    """
+    previous_model: Optional[ModelInfo] = None  # the model of the previous ready iteration, if any
+    positive_count: int = 0
+    changed_count: int = 0  # number of elements whose predicted label differs from that of previous_model
+    predictions_builder: DatasetPredictionsBuilder = field(default_factory=DatasetPredictionsBuilder)
@@ -14,12 +14,18 @@
 #
 
 import io
+import json
 import logging
 import os
 import time
 import tempfile
+import threading
 import unittest
+
+import pandas as pd
+
 from label_sleuth import app, config
+from label_sleuth.app_utils import STATUS_STREAM_RETRY_MILLISECONDS
 from label_sleuth.orchestrator.core.state_api.orchestrator_state_api import IterationStatus
 
 HEADERS = {'Content-Type': 'application/json'}
@@ -167,6 +173,35 @@ class TestAppIntegration(unittest.TestCase):
         self.assertEqual(200, res.status_code, msg="Failed to get iterations list")
         self.assertEqual(1, len(res.get_json()["iterations"]), msg="first model was not added to the models list")
 
+        # the status stream starts with the current status and iterations
+        res = self.client.get(f"/workspace/{workspace_name}/status_stream?category_id={category_id}",
+                              headers=HEADERS, buffered=False)
+        self.assertEqual(200, res.status_code, msg="Failed to open the status stream")
+        self.assertEqual('text/event-stream', res.mimetype)
+        # the stream starts with the reconnection delay of the browser, as the server closes the stream after a while
+        self.assertEqual(f'retry: {STATUS_STREAM_RETRY_MILLISECONDS}\n\n', next(res.response).decode('utf-8'))
+        first_event = next(res.response).decode('utf-8')
+        res.close()
+        self.assertTrue(first_event.startswith('data: '))
+        status = json.loads(first_event[len('data: '):])
+        self.assertEqual({'true': 2, 'false': 1}, status['labeling_counts'])
+        self.assertEqual('READY', status['iterations'][-1]['iteration_status'])
+
+        # streams above the limit of concurrently open streams are rejected
+        status_stream_slots = self.client.application.status_stream_slots
+        self.client.application.status_stream_slots = threading.BoundedSemaphore(1)
+        res = self.client.get(f"/workspace/{workspace_name}/status_stream?category_id={category_id}",
+                              headers=HEADERS, buffered=False)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(503, self.client.get(f"/workspace/{workspace_name}/status_stream?category_id={category_id}",
+                                              headers=HEADERS).status_code)
+        res.close()
+        res = self.client.get(f"/workspace/{workspace_name}/status_stream?category_id={category_id}",
+                              headers=HEADERS, buffered=False)
+        self.assertEqual(200, res.status_code, msg="the slot of a closed stream should be released")
+        res.close()
+        self.client.application.status_stream_slots = status_stream_slots
+
         # get active learning recommendations
         res = self.client.get(f"/workspace/{workspace_name}/active_learning?category_id={category_id}",
                               headers=HEADERS)
@@ -227,6 +262,11 @@ class TestAppIntegration(unittest.TestCase):
         self.assertEqual({'true': 3, 'false': 2},
                          res.get_json()['labeling_counts'], msg="diffs in get status response after setting a label")
 
+        # wait for the second models
+        res = self.wait_for_new_iteration(category_id, res, workspace_name, 2)
+        self.assertEqual(200, res.status_code, msg="Failed to get models list")
+        self.assertEqual(2, len(res.get_json()["iterations"]), msg="second model was not added to the models list")
+
         # get positively labeled elements
         res = self.client.get(f"/workspace/{workspace_name}/positive_elements?category_id={category_id}",
                               headers=HEADERS)
@@ -270,7 +310,7 @@ class TestAppIntegration(unittest.TestCase):
                             'docid': 'my_test_dataset-document2',
                             'end': 45,
                             'id': 'my_test_dataset-document2-0',
-                            'model_predictions': {'0': 'true'},
+                            'model_predictions': {'0': 'false'},
                             'text': 'this is the only text element in document two',
                             'user_labels': {'0': 'false'}},
                             {'begin': 54,
@@ -284,10 +324,24 @@ class TestAppIntegration(unittest.TestCase):
                         'hit_count': 2},
                         res.get_json(), msg="diffs in negatively labeled elements")
 
-        # wait for the second models
-        res = self.wait_for_new_iteration(category_id, res, workspace_name, 2)
-        self.assertEqual(200, res.status_code, msg="Failed to get models list")
-        self.assertEqual(2, len(res.get_json()["iterations"]), msg="second model was not added to the models list")
+        # export the predictions and the labels
+        res = self.client.get(f"/workspace/{workspace_name}/export_predictions?category_id={category_id}",
+                              headers=HEADERS)
+        self.assertEqual(200, res.status_code, msg="Failed to export predictions")
+        predictions_df = pd.read_csv(io.StringIO(res.get_data(as_text=True)))
+        self.assertEqual(6, len(predictions_df))
+        self.assertListEqual(['uri', 'text', 'span', 'metadata', 'category_to_label', 'score', 'predicted_label'],
+                             list(predictions_df.columns))
+        res = self.client.get(f"/workspace/{workspace_name}/export_predictions?category_id={category_id}"
+                              f"&format=parquet", headers=HEADERS)
+        self.assertEqual(200, res.status_code, msg="Failed to export predictions as parquet")
+        pd.testing.assert_frame_equal(predictions_df[['uri', 'text', 'score', 'predicted_label']],
+                                      pd.read_parquet(io.BytesIO(res.get_data()))[['uri', 'text', 'score',
+                                                                                   'predicted_label']])
+        res = self.client.get(f"/workspace/{workspace_name}/export_labels", headers=HEADERS)
+        self.assertEqual(200, res.status_code, msg="Failed to export labels")
+        labels_df = pd.read_csv(io.StringIO(res.get_data(as_text=True)))
+        self.assertEqual(5, len(labels_df))
 
         # update existing category
         new_category_name = f'{category_name}_new'
@@ -333,7 +387,7 @@ class TestAppIntegration(unittest.TestCase):
             response = res.get_json()
             print(response)
             if res.status_code != 200 or (len(response["iterations"]) == num_models
-                                          and response['iterations'][0]['iteration_status'] == IterationStatus.READY.name):
+                                          and response['iterations'][-1]['iteration_status'] == IterationStatus.READY.name):
                 break
             time.sleep(0.1)
             waiting_count += 1
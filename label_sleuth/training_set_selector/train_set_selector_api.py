@@ -20,6 +20,7 @@ from typing import Sequence, Set
 
 from label_sleuth.data_access.core.data_structs import TextElement, LabelType
 from label_sleuth.orchestrator.background_jobs_manager import BackgroundJobsManager
+from label_sleuth.orchestrator.job_scheduler import JobPriority
 
 
 
@@ -38,7 +39,8 @@ class TrainSetSelectorAPI(object, metaclass=abc.ABCMeta):
         future = self.background_jobs_manager.add_background_job(
             self.get_train_set, args=(workspace_id, train_dataset_name, category_id, category_name,
                                       category_description),
-            use_gpu=self.gpu_support, done_callback=done_callback)
+            use_gpu=self.gpu_support, done_callback=done_callback, priority=JobPriority.TRAINING,
+            workspace_id=workspace_id)
         return future
 
     @abc.abstractmethod